@@ -1,10 +1,11 @@
+import os
 import streamlit as st
 import httpx
 import time
 import pandas as pd
 
 # --- CẤU HÌNH API ---
-GATEWAY_URL = "http://localhost:8000"
+GATEWAY_URL = os.getenv("GATEWAY_URL", "http://localhost:8000")
 
 # --- KHỞI TẠO SESSION ---
 if 'token' not in st.session_state: st.session_state['token'] = None
@@ -0,0 +1,95 @@
+import os
+import time
+import asyncio
+import datetime
+from sqlalchemy import exists
+from sqlalchemy.orm import aliased
+import models
+from cart_store import expiry_cutoff, CART_TTL_HOURS
+
+CART_SWEEP_INTERVAL_SECONDS = float(os.getenv("CART_SWEEP_INTERVAL_SECONDS", 300))
+CART_SWEEP_CHUNK_SIZE = int(os.getenv("CART_SWEEP_CHUNK_SIZE", 500))
+CART_SWEEP_PAUSE_SECONDS = float(os.getenv("CART_SWEEP_PAUSE_SECONDS", 0.05))
+
+class CartSweeper:
+    """Dọn giỏ hàng bỏ quên (không chạm tới quá CART_TTL_HOURS).
+
+    Xoá theo từng chunk tối đa CART_SWEEP_CHUNK_SIZE user, mỗi chunk là 1 transaction
+    ngắn và nghỉ CART_SWEEP_PAUSE_SECONDS giữa các chunk để không giữ lock lâu.
+    """
+
+    def __init__(self, session_factory, store):
+        self.session_factory = session_factory
+        self.store = store
+        self._task = None
+        self.metrics = {
+            "ttl_hours": CART_TTL_HOURS,
+            "runs": 0,
+            "carts_swept": 0,
+            "rows_deleted": 0,
+            "hot_carts_evicted": 0,
+            "errors": 0,
+            "last_run_at": None,
+            "last_run_carts": 0,
+            "last_run_rows": 0,
+            "last_run_ms": 0,
+        }
+
+    def _sweep_chunk(self, cutoff):
+        db = self.session_factory()
+        try:
+            # Chỉ lấy user mà MỌI món trong giỏ đều đã quá hạn: quét dòng cũ theo ix_cart_items_updated_at,
+            # loại user còn món mới chạm tới (tra theo uq_cart_user_food), không GROUP BY cả bảng
+            CartItem, fresh = models.CartItem, aliased(models.CartItem)
+            has_fresh = exists().where(fresh.user_id == CartItem.user_id, fresh.updated_at >= cutoff)
+            user_ids = [uid for (uid,) in db.query(CartItem.user_id).filter(CartItem.updated_at < cutoff, ~has_fresh)
+                        .distinct().limit(CART_SWEEP_CHUNK_SIZE).all()]
+            if not user_ids: return 0, 0
+            # Điều kiện updated_at lặp lại để không xoá giỏ vừa được chạm tới
+            rows = db.query(models.CartItem).filter(
+                models.CartItem.user_id.in_(user_ids), models.CartItem.updated_at < cutoff
+            ).delete(synchronize_session=False)
+            db.commit()
+            return len(user_ids), rows
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def sweep(self):
+        started = time.monotonic()
+        cutoff = expiry_cutoff()
+        carts = rows = 0
+        self.metrics["hot_carts_evicted"] += self.store.expire(cutoff)
+        while True:
+            swept, deleted = await asyncio.to_thread(self._sweep_chunk, cutoff)
+            carts += swept
+            rows += deleted
+            if swept < CART_SWEEP_CHUNK_SIZE: break
+            await asyncio.sleep(CART_SWEEP_PAUSE_SECONDS)
+        self.metrics.update({
+            "runs": self.metrics["runs"] + 1,
+            "carts_swept": self.metrics["carts_swept"] + carts,
+            "rows_deleted": self.metrics["rows_deleted"] + rows,
+            "last_run_at": datetime.datetime.utcnow().isoformat(),
+            "last_run_carts": carts,
+            "last_run_rows": rows,
+            "last_run_ms": round((time.monotonic() - started) * 1000, 1),
+        })
+        return carts, rows
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(CART_SWEEP_INTERVAL_SECONDS)
+            try:
+                await self.sweep()
+            except Exception as e:
+                self.metrics["errors"] += 1
+                print(f"Cart sweep failed: {e}")
+
+    async def start(self):
+        if CART_SWEEP_INTERVAL_SECONDS > 0: self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task: self._task.cancel()
@@ -0,0 +1,269 @@
+"""Lưu trữ giỏ hàng cho Cart Service.
+
+CART_STORE=memory (mặc định): HotCartStore
+    - Giỏ hàng nằm trong RAM của process, mọi GET/POST/PUT/DELETE /cart trả lời từ RAM.
+    - MySQL được cập nhật bất đồng bộ (write-behind): mỗi CART_FLUSH_INTERVAL_SECONDS
+      một task nền gom tối đa CART_FLUSH_BATCH_SIZE giỏ bị sửa và ghi lại trong 1 transaction
+      (DELETE các dòng cũ + INSERT nhiều dòng).
+    - Cache miss (giỏ chưa có trong RAM, vd. sau restart) -> nạp lại từ MySQL, các request
+      đồng thời cho cùng user chỉ nạp 1 lần.
+
+    Cam kết:
+    - Tắt bình thường (SIGTERM / shutdown event): flush hết trước khi thoát, không mất dữ liệu.
+    - Process chết đột ngột (kill -9, OOM, mất điện): mất các thay đổi chưa flush, tối đa
+      khoảng CART_FLUSH_INTERVAL_SECONDS + thời gian 1 lần flush. Giỏ quay về bản đã flush gần nhất.
+    - Flush lỗi (MySQL down): giỏ vẫn được đánh dấu dirty và thử lại ở lần sau; dữ liệu vẫn
+      phục vụ từ RAM nên người dùng không thấy lỗi.
+    - RAM là bản chính: process này phải là nơi duy nhất ghi cart_items. Chạy 1 worker cho
+      cart_service (hoặc sticky routing theo user); nhiều worker sẽ thấy các giỏ khác nhau.
+    - Chỉ giỏ đã flush (không dirty) mới bị đẩy khỏi RAM khi vượt CART_HOT_MAX_USERS.
+
+CART_STORE=db: DbCartStore
+    - Ghi thẳng MySQL, mỗi thao tác là 1 câu lệnh (upsert có điều kiện), không có cache.
+"""
+import os
+import time
+import asyncio
+import datetime
+import itertools
+from collections import OrderedDict
+from sqlalchemy import select, literal, exists, insert
+import models
+
+CART_STORE = os.getenv("CART_STORE", "memory")
+CART_FLUSH_INTERVAL_SECONDS = float(os.getenv("CART_FLUSH_INTERVAL_SECONDS", 1.0))
+CART_FLUSH_BATCH_SIZE = int(os.getenv("CART_FLUSH_BATCH_SIZE", 500))
+CART_HOT_MAX_USERS = int(os.getenv("CART_HOT_MAX_USERS", 100000))
+CART_TTL_HOURS = float(os.getenv("CART_TTL_HOURS", 72))
+
+def expiry_cutoff():
+    # Giỏ không được chạm tới từ trước mốc này coi như bỏ quên
+    return datetime.datetime.utcnow() - datetime.timedelta(hours=CART_TTL_HOURS)
+
+class CartConflict(Exception):
+    """Giỏ đang chứa món của quán khác."""
+
+def add_item_stmt(dialect: str, user_id: int, food_id: int, qty: int, branch_id: int):
+    # 1 câu lệnh duy nhất: chỉ chèn khi giỏ không chứa món của quán khác,
+    # trùng (user_id, food_id) thì cộng dồn số lượng
+    now = datetime.datetime.utcnow()
+    cols = ["user_id", "food_id", "quantity", "branch_id", "updated_at"]
+    other_branch = exists().where(models.CartItem.user_id == user_id, models.CartItem.branch_id != branch_id)
+    src = select(literal(user_id), literal(food_id), literal(qty), literal(branch_id), literal(now)).where(~other_branch)
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+        return dialect_insert(models.CartItem).from_select(cols, src).on_duplicate_key_update(quantity=models.CartItem.quantity + qty, updated_at=now)
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    return dialect_insert(models.CartItem).from_select(cols, src).on_conflict_do_update(
+        index_elements=["user_id", "food_id"], set_={"quantity": models.CartItem.quantity + qty, "updated_at": now})
+
+def _row(user_id, food_id, qty, branch_id):
+    return {"user_id": user_id, "food_id": food_id, "quantity": qty, "branch_id": branch_id}
+
+# ==========================================
+# GHI THẲNG MYSQL
+# ==========================================
+class DbCartStore:
+    def __init__(self, session_factory):
+        self.session_factory = session_factory
+
+    def _run(self, fn):
+        db = self.session_factory()
+        try: return fn(db)
+        finally: db.close()
+
+    async def start(self): pass
+    async def stop(self): pass
+
+    async def get(self, user_id: int):
+        def q(db):
+            Item = models.CartItem
+            rows = db.query(Item.food_id, Item.quantity, Item.branch_id).filter(Item.user_id == user_id).order_by(Item.id)
+            return [_row(user_id, r.food_id, r.quantity, r.branch_id) for r in rows]
+        return await asyncio.to_thread(self._run, q)
+
+    async def add(self, user_id: int, food_id: int, qty: int, branch_id: int):
+        def q(db):
+            result = db.execute(add_item_stmt(db.bind.dialect.name, user_id, food_id, qty, branch_id))
+            db.commit()
+            return result.rowcount
+        if not await asyncio.to_thread(self._run, q): raise CartConflict()
+
+    async def set_quantity(self, user_id: int, food_id: int, qty: int):
+        def q(db):
+            query = db.query(models.CartItem).filter(models.CartItem.user_id == user_id, models.CartItem.food_id == food_id)
+            if qty <= 0: changed = query.delete(synchronize_session=False)
+            else: changed = query.update({models.CartItem.quantity: qty, models.CartItem.updated_at: datetime.datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+            return changed
+        return bool(await asyncio.to_thread(self._run, q))
+
+    async def clear(self, user_id: int):
+        def q(db):
+            db.query(models.CartItem).filter(models.CartItem.user_id == user_id).delete(synchronize_session=False)
+            db.commit()
+        await asyncio.to_thread(self._run, q)
+
+    def expire(self, cutoff):
+        # Không có bản trong RAM, cart_expiry chỉ cần xoá trong DB
+        return 0
+
+# ==========================================
+# RAM LÀ BẢN CHÍNH + WRITE-BEHIND XUỐNG MYSQL
+# ==========================================
+class HotCartStore:
+    def __init__(self, session_factory, flush_interval=CART_FLUSH_INTERVAL_SECONDS, batch_size=CART_FLUSH_BATCH_SIZE, max_users=CART_HOT_MAX_USERS):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_users = max_users
+        # user_id -> {"branch_id": int | None, "items": {food_id: qty}, "touched": epoch}
+        self._carts = OrderedDict()
+        self._dirty = set()
+        self._loading = {}
+        self._task = None
+        self._writing = None
+        self.stats = {"flushes": 0, "flushed_carts": 0, "flush_errors": 0, "loads": 0}
+
+    # --- Nạp từ MySQL khi miss (single-flight theo user) ---
+    def _load_sync(self, user_id):
+        db = self.session_factory()
+        try:
+            rows = db.query(models.CartItem).filter(models.CartItem.user_id == user_id).order_by(models.CartItem.id).all()
+            # Giỏ đã quá hạn nhưng sweeper chưa kịp xoá -> coi như trống, không hồi sinh
+            stamps = [r.updated_at for r in rows if r.updated_at is not None]
+            if stamps and max(stamps) < expiry_cutoff(): rows = []
+            touched = max(stamps).replace(tzinfo=datetime.timezone.utc).timestamp() if stamps and rows else time.time()
+            return {"branch_id": rows[0].branch_id if rows else None, "items": {r.food_id: r.quantity for r in rows}, "touched": touched}
+        finally:
+            db.close()
+
+    async def _cart(self, user_id):
+        cart = self._carts.get(user_id)
+        if cart is not None:
+            self._carts.move_to_end(user_id)
+            return cart
+        fut = self._loading.get(user_id)
+        if fut is None:
+            fut = self._loading[user_id] = asyncio.ensure_future(asyncio.to_thread(self._load_sync, user_id))
+            fut.add_done_callback(lambda _: self._loading.pop(user_id, None))
+            self.stats["loads"] += 1
+        loaded = await fut
+        # Trong lúc chờ, request khác có thể đã tạo giỏ -> giữ bản đang có
+        cart = self._carts.setdefault(user_id, loaded)
+        self._evict()
+        return cart
+
+    def _evict(self):
+        # LRU: đầu OrderedDict là giỏ ít dùng nhất. Chỉ đẩy ra giỏ đã flush; giỏ dirty
+        # được chuyển xuống cuối. Mỗi giỏ xét tối đa 1 lần, giỏ vừa nạp (cuối) không bị đẩy.
+        budget = len(self._carts) - 1
+        while len(self._carts) > self.max_users and budget > 0:
+            budget -= 1
+            user_id = next(iter(self._carts))
+            if user_id in self._dirty: self._carts.move_to_end(user_id)
+            else: self._carts.popitem(last=False)
+
+    def _touch(self, user_id, cart):
+        cart["touched"] = time.time()
+        self._dirty.add(user_id)
+
+    # --- Thao tác giỏ (không await giữa đọc và ghi -> nguyên tử trong 1 process) ---
+    async def get(self, user_id: int):
+        cart = await self._cart(user_id)
+        return [_row(user_id, food_id, qty, cart["branch_id"]) for food_id, qty in cart["items"].items()]
+
+    async def add(self, user_id: int, food_id: int, qty: int, branch_id: int):
+        cart = await self._cart(user_id)
+        if cart["items"] and cart["branch_id"] != branch_id: raise CartConflict()
+        cart["branch_id"] = branch_id
+        cart["items"][food_id] = cart["items"].get(food_id, 0) + qty
+        self._touch(user_id, cart)
+
+    async def set_quantity(self, user_id: int, food_id: int, qty: int):
+        cart = await self._cart(user_id)
+        if food_id not in cart["items"]: return False
+        if qty <= 0: del cart["items"][food_id]
+        else: cart["items"][food_id] = qty
+        self._touch(user_id, cart)
+        return True
+
+    async def clear(self, user_id: int):
+        self._carts[user_id] = {"branch_id": None, "items": {}, "touched": time.time()}
+        self._dirty.add(user_id)
+
+    def expire(self, cutoff):
+        # Bỏ khỏi RAM các giỏ quá hạn (kể cả đang dirty); dòng trong DB do cart_expiry xoá
+        cutoff_ts = cutoff.replace(tzinfo=datetime.timezone.utc).timestamp()
+        expired = [uid for uid, cart in self._carts.items() if cart["touched"] < cutoff_ts]
+        for uid in expired:
+            del self._carts[uid]
+            self._dirty.discard(uid)
+        return len(expired)
+
+    # --- Write-behind ---
+    @staticmethod
+    def _snapshot(cart):
+        touched = datetime.datetime.fromtimestamp(cart["touched"], datetime.timezone.utc).replace(tzinfo=None)
+        return {"branch_id": cart["branch_id"], "items": dict(cart["items"]), "updated_at": touched}
+
+    def _write_batch(self, snapshot):
+        db = self.session_factory()
+        try:
+            user_ids = list(snapshot)
+            db.query(models.CartItem).filter(models.CartItem.user_id.in_(user_ids)).delete(synchronize_session=False)
+            rows = [{**_row(uid, food_id, qty, cart["branch_id"]), "updated_at": cart["updated_at"]} for uid, cart in snapshot.items() for food_id, qty in cart["items"].items()]
+            if rows: db.execute(insert(models.CartItem).values(rows))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def flush(self, limit: int = None):
+        flushed = 0
+        while self._dirty and (limit is None or flushed < limit):
+            # Lần ghi trước bị huỷ (vd. stop() cancel vòng flush) vẫn chạy trong thread:
+            # chờ xong rồi mới ghi tiếp để bản cũ không commit đè lên bản mới
+            if self._writing is not None: await asyncio.gather(self._writing, return_exceptions=True)
+            # Batch vẫn nằm trong _dirty cho tới khi commit xong -> lỗi hay bị huỷ giữa chừng đều không mất
+            batch = list(itertools.islice(self._dirty, self.batch_size))
+            snapshot = {uid: self._snapshot(self._carts[uid]) for uid in batch if uid in self._carts}
+            self._writing = asyncio.ensure_future(asyncio.to_thread(self._write_batch, snapshot))
+            try:
+                await asyncio.shield(self._writing)
+            except Exception as e:
+                self.stats["flush_errors"] += 1
+                print(f"Cart flush failed: {e}")
+                break
+            # Giỏ bị sửa trong lúc ghi thì giữ dirty cho lần sau
+            for uid in batch:
+                cart = self._carts.get(uid)
+                if cart is None or (uid in snapshot and self._snapshot(cart) == snapshot[uid]): self._dirty.discard(uid)
+            flushed += len(batch)
+            self.stats["flushes"] += 1
+            self.stats["flushed_carts"] += len(batch)
+        self._evict()
+        return flushed
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush(limit=self.batch_size * 10)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self.flush()
+
+def create_store(session_factory):
+    if CART_STORE == "db": return DbCartStore(session_factory)
+    return HotCartStore(session_factory)
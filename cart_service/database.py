@@ -1,18 +1,7 @@
-import os
-from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from common.db import create_database
 
-DB_USER = os.getenv("DB_ROOT_USER", "root")
-DB_PASS = os.getenv("DB_PASSWORD", "123456")
+# Kết nối + pool cấu hình qua env (xem common/db.py): CART_DB_HOST, CART_DATABASE_URL, CART_DB_POOL_SIZE...
+engine, SessionLocal = create_database("CART", "cart_db")
 
-# Mặc định trỏ về 'db'
-DB_HOST = os.getenv("CART_DB_HOST", "db")
-DB_NAME = "cart_db"
-
-SQLALCHEMY_DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASS}@{DB_HOST}/{DB_NAME}"
-
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
@@ -1,42 +1,59 @@
-import httpx
-from fastapi import FastAPI, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
+import os
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Request
+from pydantic import BaseModel
 from database import SessionLocal, engine, Base
 import models
+from cart_store import create_store, CartConflict
+from cart_expiry import CartSweeper
+from common.auth import get_verifier
+from common.db import pool_stats
+from common.migrations import run_migrations
+from common.responses import FastJSONResponse
+from common.workers import setup_worker
 
 # Tạo lại bảng
 Base.metadata.create_all(bind=engine)
+run_migrations(engine, os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations"))
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
+verifier = get_verifier()
+# Chạy 1 worker (giỏ hàng nóng nằm trong RAM); warm-up + /metrics/worker: common/workers.py
+setup_worker(app, engines={"primary": engine}, warmups=[verifier.warm_up])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Kho giỏ hàng: RAM + write-behind xuống MySQL (xem cart_store.py)
+store = create_store(SessionLocal)
+# Dọn giỏ bỏ quên theo TTL (xem cart_expiry.py)
+sweeper = CartSweeper(SessionLocal, store)
+
+@app.on_event("startup")
+async def start_store():
+    await store.start()
+    await sweeper.start()
+
+@app.on_event("shutdown")
+async def stop_store():
+    await sweeper.stop()
+    await store.stop()
+    await verifier.close()
+
+# Mức dùng connection pool (common/db.py)
+@app.get("/metrics/db")
+def get_db_metrics():
+    return pool_stats(engine)
 
 # --- AUTH HELPER ---
 async def get_user_id(request: Request):
-    token = request.headers.get("Authorization")
-    if not token:
-        raise HTTPException(status_code=401, detail="Missing Token")
-    try:
-        # Gọi User Service xác thực (qua Gateway hoặc trực tiếp)
-        async with httpx.AsyncClient() as client:
-            res = await client.get("http://user_service:8001/verify", headers={"Authorization": token})
-            if res.status_code != 200:
-                raise HTTPException(status_code=401, detail="Invalid Token")
-            return res.json()['id']
-    except Exception as e:
-        raise HTTPException(status_code=401, detail=str(e))
+    # Giải mã tại chỗ nếu có key, ngược lại gọi /verify có cache (common/auth.py)
+    payload = await verifier.verify(request.headers.get("Authorization"))
+    return payload['id']
 
 # ==========================================
 # API GIỎ HÀNG THÔNG MINH
 # ==========================================
 
 @app.post("/cart")
-async def add_to_cart(item: dict, request: Request, db: Session = Depends(get_db)):
+async def add_to_cart(item: dict, request: Request):
     user_id = await get_user_id(request)
     
     # Nhận dữ liệu từ UI
@@ -46,60 +63,47 @@ async def add_to_cart(item: dict, request: Request, db: Session = Depends(get_db
     
     if not b_id:
         raise HTTPException(status_code=400, detail="Missing branch_id")
+    if not f_id or not isinstance(qty, int) or qty <= 0:
+        raise HTTPException(status_code=400, detail="Invalid food_id/quantity")
 
-    # 1. Kiểm tra giỏ hàng hiện tại
-    existing_items = db.query(models.CartItem).filter(models.CartItem.user_id == user_id).all()
-    
-    if existing_items:
-        # Lấy branch_id của món đầu tiên trong giỏ
-        current_branch = existing_items[0].branch_id
-        
-        # Nếu khác branch -> Báo lỗi ngay
-        if current_branch != b_id:
-             raise HTTPException(status_code=409, detail=f"Giỏ hàng đang chứa món của quán khác. Vui lòng xóa giỏ hàng cũ trước!")
-            
-        # Nếu cùng branch -> Cộng dồn số lượng nếu trùng món
-        found = False
-        for cart_item in existing_items:
-            if cart_item.food_id == f_id:
-                cart_item.quantity += qty
-                found = True
-                break
-        
-        if not found:
-            new_item = models.CartItem(user_id=user_id, food_id=f_id, quantity=qty, branch_id=b_id)
-            db.add(new_item)
-            
-    else:
-        # Giỏ trống -> Thêm mới
-        new_item = models.CartItem(user_id=user_id, food_id=f_id, quantity=qty, branch_id=b_id)
-        db.add(new_item)
-
-    db.commit()
+    try:
+        await store.add(user_id, f_id, qty, b_id)
+    except CartConflict:
+        raise HTTPException(status_code=409, detail=f"Giỏ hàng đang chứa món của quán khác. Vui lòng xóa giỏ hàng cũ trước!")
     return {"message": "Added"}
 
-@app.get("/cart")
-async def get_my_cart(request: Request, db: Session = Depends(get_db)):
+class CartItemOut(BaseModel):
+    user_id: int
+    food_id: int
+    quantity: int
+    branch_id: Optional[int] = None
+
+@app.get("/cart", response_model=List[CartItemOut])
+async def get_my_cart(request: Request):
     user_id = await get_user_id(request)
-    return db.query(models.CartItem).filter(models.CartItem.user_id == user_id).all()
+    # Dòng giỏ đã là dict kiểu cơ bản -> serialize thẳng
+    return FastJSONResponse(await store.get(user_id))
 
 @app.put("/cart")
-async def update_cart(item: dict, request: Request, db: Session = Depends(get_db)):
+async def update_cart(item: dict, request: Request):
     user_id = await get_user_id(request)
     f_id = item.get('food_id')
     qty = item.get('quantity')
     
-    cart_item = db.query(models.CartItem).filter(models.CartItem.user_id == user_id, models.CartItem.food_id == f_id).first()
-    if cart_item:
-        if qty <= 0: db.delete(cart_item)
-        else: cart_item.quantity = qty
-        db.commit()
+    if not isinstance(qty, int):
+        raise HTTPException(status_code=400, detail="Invalid quantity")
+    
+    if await store.set_quantity(user_id, f_id, qty):
         return {"message": "Updated"}
     raise HTTPException(status_code=404, detail="Item not found")
 
 @app.delete("/cart")
-async def clear_cart(request: Request, db: Session = Depends(get_db)):
+async def clear_cart(request: Request):
     user_id = await get_user_id(request)
-    db.query(models.CartItem).filter(models.CartItem.user_id == user_id).delete()
-    db.commit()
-    return {"message": "Cleared"}
\ No newline at end of file
+    await store.clear(user_id)
+    return {"message": "Cleared"}
+
+# Số liệu nội bộ: dọn giỏ hết hạn + write-behind (không đi qua Gateway)
+@app.get("/cart/metrics")
+def cart_metrics():
+    return {"sweeper": sweeper.metrics, "store": getattr(store, "stats", {})}
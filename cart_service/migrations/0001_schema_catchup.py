@@ -0,0 +1,16 @@
+"""Cột / ràng buộc thêm vào cart_items sau bản đầu (create_all không sửa bảng cũ)."""
+from sqlalchemy import DateTime
+
+def upgrade(m):
+    m.add_column("cart_items", "updated_at", DateTime())
+    m.create_index("ix_cart_items_updated_at", "cart_items", ["updated_at"])
+    if m.has_table("cart_items") and not m.has_index("cart_items", "uq_cart_user_food"):
+        # Gộp các dòng trùng (user, món) trước khi thêm unique: giữ dòng id nhỏ nhất, cộng dồn số lượng
+        dupes = m.execute(
+            "SELECT user_id, food_id, MIN(id) AS keep_id, SUM(quantity) AS total FROM cart_items "
+            "GROUP BY user_id, food_id HAVING COUNT(*) > 1").fetchall()
+        for row in dupes:
+            m.execute("UPDATE cart_items SET quantity = :total WHERE id = :keep_id", total=row.total, keep_id=row.keep_id)
+            m.execute("DELETE FROM cart_items WHERE user_id = :user_id AND food_id = :food_id AND id <> :keep_id",
+                      user_id=row.user_id, food_id=row.food_id, keep_id=row.keep_id)
+        m.create_index("uq_cart_user_food", "cart_items", ["user_id", "food_id"], unique=True)
@@ -0,0 +1,5 @@
+"""Mọi truy vấn giỏ đều lọc theo user_id (hoặc user_id + food_id): uq_cart_user_food đã phủ
+cả hai, index đơn trên user_id chỉ làm chậm ghi."""
+
+def upgrade(m):
+    m.drop_index("ix_cart_items_user_id", "cart_items")
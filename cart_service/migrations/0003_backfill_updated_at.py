@@ -0,0 +1,7 @@
+"""Giỏ hàng tạo trước khi có cột updated_at (0001) mang NULL: máy dọn giỏ (cart_expiry.py) không
+bao giờ thấy chúng. Gán mốc lúc migrate -> bị dọn sau CART_TTL_HOURS nếu không được chạm tới."""
+import datetime
+
+def upgrade(m):
+    if not m.has_table("cart_items"): return
+    m.execute("UPDATE cart_items SET updated_at = :now WHERE updated_at IS NULL", now=datetime.datetime.utcnow())
@@ -1,13 +1,18 @@
-from sqlalchemy import Column, Integer
+from sqlalchemy import Column, Integer, DateTime, UniqueConstraint
 from database import Base
 
 class CartItem(Base):
     __tablename__ = "cart_items"
+    # Mỗi user chỉ có 1 dòng cho 1 món -> cộng dồn bằng upsert
+    __table_args__ = (UniqueConstraint("user_id", "food_id", name="uq_cart_user_food"),)
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, index=True)
+    user_id = Column(Integer) # đã có uq_cart_user_food (user_id, food_id) làm index
     food_id = Column(Integer)
     quantity = Column(Integer, default=1)
     
     # --- UPDATE: Lưu thêm branch_id ---
-    branch_id = Column(Integer)
\ No newline at end of file
+    branch_id = Column(Integer)
+
+    # Lần cuối giỏ được chạm tới -> dùng để dọn giỏ bỏ quên (xem cart_expiry.py)
+    updated_at = Column(DateTime, nullable=True, index=True)
\ No newline at end of file
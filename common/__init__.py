@@ -0,0 +1 @@
+# Code dùng chung cho các service (được copy vào /app/common trong mỗi image)
@@ -0,0 +1,235 @@
+"""Xác thực token dùng chung cho các service gọi User Service /verify.
+
+- ALGORITHM=RS256 (mặc định) -> verify tại chỗ bằng public key lấy từ
+  User Service /.well-known/jwks.json; cache theo `kid`, gặp kid lạ thì tải lại JWKS
+  (tối đa 1 lần / JWKS_MIN_REFRESH_SECONDS, các request đồng thời dùng chung 1 lần tải).
+- ALGORITHM=HS256 và có SECRET_KEY (khớp với User Service) -> tự giải mã JWT tại chỗ.
+- Không có key -> gọi /verify, cache kết quả theo sha256(token) tới đúng thời điểm `exp`
+  của token, LRU giới hạn AUTH_CACHE_SIZE phần tử; nhiều request cùng lúc với cùng 1 token
+  chưa có trong cache chỉ tạo ra 1 lần gọi (single-flight).
+
+Thu hồi token: mọi cách verify ở trên đều kiểm thêm RevocationList trong RAM (jti bị
+logout + token_version tối thiểu của user đã "đăng xuất mọi nơi"), đồng bộ nền từ
+User Service /revocations mỗi REVOCATION_SYNC_SECONDS -> không tốn thêm request nào
+khi verify. Token bị thu hồi có thể còn dùng được tối đa 1 chu kỳ đồng bộ ở service khác.
+"""
+import os
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+import httpx
+from fastapi import HTTPException
+from jose import JWTError, jwt
+
+USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://user_service:8001")
+AUTH_VERIFY_LOCAL = os.getenv("AUTH_VERIFY_LOCAL", "1") == "1"
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10000))
+AUTH_TIMEOUT_SECONDS = float(os.getenv("AUTH_TIMEOUT_SECONDS", 5))
+JWKS_MIN_REFRESH_SECONDS = float(os.getenv("JWKS_MIN_REFRESH_SECONDS", 10))
+JWT_ACCEPT_LEGACY_HS256 = os.getenv("JWT_ACCEPT_LEGACY_HS256", "0") == "1"
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", 5))
+
+def _bearer(authorization: str):
+    if not authorization: raise HTTPException(401, "Missing Token")
+    return authorization.replace("Bearer ", "")
+
+class RevocationList:
+    """Danh sách thu hồi trong RAM, chỉ giữ mục chưa hết hạn (tối đa ~ thời hạn access token).
+
+    - jti: token cụ thể đã logout.
+    - versions: user_id -> token_version tối thiểu; token mang `ver` nhỏ hơn bị từ chối.
+    """
+
+    def __init__(self):
+        self._jtis = {}  # jti -> exp (epoch)
+        self._versions = {}  # user_id -> (version, exp)
+
+    def add(self, entry: dict):
+        exp = entry["exp"]
+        if entry.get("jti"): self._jtis[entry["jti"]] = exp
+        if entry.get("token_version") is not None:
+            current = self._versions.get(entry["user_id"])
+            if current is None or current[0] <= entry["token_version"]:
+                self._versions[entry["user_id"]] = (entry["token_version"], exp)
+
+    def update(self, entries):
+        # Thu hồi không bao giờ bị huỷ -> chỉ cần gộp; mục hết hạn do prune() bỏ đi.
+        # Nạp toàn bộ mục còn hạn mỗi lần (bảng nhỏ) thay vì theo id tăng dần để không bỏ
+        # sót transaction commit lệch thứ tự.
+        for entry in entries: self.add(entry)
+        self.prune()
+
+    def prune(self):
+        now = time.time()
+        self._jtis = {k: exp for k, exp in self._jtis.items() if exp > now}
+        self._versions = {k: v for k, v in self._versions.items() if v[1] > now}
+
+    def is_revoked(self, payload: dict):
+        if payload.get("jti") in self._jtis: return True
+        floor = self._versions.get(payload.get("id"))
+        return floor is not None and payload.get("ver", 0) < floor[0]
+
+    def __len__(self):
+        return len(self._jtis) + len(self._versions)
+
+class TokenVerifier:
+    def __init__(self, verify_url: str, secret_key: str = None, algorithm: str = "HS256", cache_size: int = AUTH_CACHE_SIZE, jwks_url: str = None, revocations_url: str = None):
+        self.verify_url = verify_url
+        self.secret_key = secret_key
+        self.algorithm = algorithm
+        self.cache_size = cache_size
+        self.jwks_url = jwks_url if not algorithm.startswith("HS") else None
+        self._cache = OrderedDict()  # sha256(token) -> (payload, exp)
+        self._inflight = {}
+        self._jwks = {}  # kid -> JWK (public)
+        self._jwks_fetched_at = 0
+        self._jwks_inflight = None
+        self._client = None
+        self.revocations = RevocationList()
+        self.revocations_url = revocations_url
+        self._revocations_synced_at = 0
+        self._revocations_inflight = None
+        self.stats = {"local": 0, "hits": 0, "misses": 0, "remote_calls": 0, "jwks_fetches": 0, "revoked": 0, "revocation_syncs": 0}
+
+    def _http(self):
+        # 1 client dùng chung (giữ connection pool) thay vì tạo mới mỗi request
+        if self._client is None: self._client = httpx.AsyncClient(timeout=AUTH_TIMEOUT_SECONDS)
+        return self._client
+
+    async def close(self):
+        if self._client is not None: await self._client.aclose()
+
+    def _cache_get(self, key):
+        entry = self._cache.get(key)
+        if entry is None: return None
+        payload, exp = entry
+        if exp <= time.time():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return payload
+
+    def _cache_put(self, key, payload):
+        exp = payload.get("exp")
+        if not isinstance(exp, (int, float)): return
+        self._cache[key] = (payload, exp)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size: self._cache.popitem(last=False)
+
+    async def _remote(self, token: str):
+        self.stats["remote_calls"] += 1
+        try:
+            res = await self._http().get(self.verify_url, headers={"Authorization": f"Bearer {token}"})
+        except Exception as e:
+            raise HTTPException(503, f"Auth service unavailable: {e}")
+        if res.status_code != 200: raise HTTPException(401, "Invalid Token")
+        return res.json()
+
+    async def _fetch(self, key: str, token: str):
+        payload = await self._remote(token)
+        self._cache_put(key, payload)
+        return payload
+
+    # --- JWKS (RS256) ---
+    async def _fetch_jwks(self):
+        self.stats["jwks_fetches"] += 1
+        try:
+            res = await self._http().get(self.jwks_url)
+            res.raise_for_status()
+        except Exception as e:
+            raise HTTPException(503, f"Auth service unavailable: {e}")
+        # Giữ khoá cũ: token ký trước khi xoay khoá vẫn verify được
+        self._jwks.update({k["kid"]: k for k in res.json().get("keys", []) if "kid" in k})
+        self._jwks_fetched_at = time.monotonic()
+
+    async def _refresh_jwks(self):
+        if self._jwks_inflight is None:
+            if self._jwks and time.monotonic() - self._jwks_fetched_at < JWKS_MIN_REFRESH_SECONDS: return
+            self._jwks_inflight = asyncio.ensure_future(self._fetch_jwks())
+            self._jwks_inflight.add_done_callback(lambda _: setattr(self, "_jwks_inflight", None))
+        await asyncio.shield(self._jwks_inflight)
+
+    async def _verify_jwks(self, token: str):
+        try: header = jwt.get_unverified_header(token)
+        except JWTError: raise HTTPException(401, "Invalid Token")
+        if header.get("alg") == "HS256" and JWT_ACCEPT_LEGACY_HS256 and self.secret_key:
+            try: return jwt.decode(token, self.secret_key, algorithms=["HS256"])
+            except JWTError: raise HTTPException(401, "Invalid Token")
+        kid = header.get("kid")
+        if kid not in self._jwks: await self._refresh_jwks()
+        key = self._jwks.get(kid)
+        if key is None: raise HTTPException(401, "Invalid Token")
+        try: return jwt.decode(token, key, algorithms=[self.algorithm])
+        except JWTError: raise HTTPException(401, "Invalid Token")
+
+    # --- Danh sách thu hồi ---
+    async def _sync_revocations(self):
+        self.stats["revocation_syncs"] += 1
+        try:
+            res = await self._http().get(self.revocations_url)
+            res.raise_for_status()
+            self.revocations.update(res.json().get("entries", []))
+        except Exception as e:
+            # Không chặn request khi User Service lỗi; thử lại ở chu kỳ sau
+            print(f"Revocation sync failed: {e}")
+        finally:
+            self._revocations_synced_at = time.monotonic()
+
+    def _maybe_sync_revocations(self):
+        # Chạy nền, không bắt request hiện tại chờ
+        if not self.revocations_url or self._revocations_inflight is not None: return
+        if time.monotonic() - self._revocations_synced_at < REVOCATION_SYNC_SECONDS: return
+        self._revocations_inflight = asyncio.ensure_future(self._sync_revocations())
+        self._revocations_inflight.add_done_callback(lambda _: setattr(self, "_revocations_inflight", None))
+
+    def _check_revoked(self, payload: dict):
+        self._maybe_sync_revocations()
+        if self.revocations.is_revoked(payload):
+            self.stats["revoked"] += 1
+            raise HTTPException(401, "Token revoked")
+        return payload
+
+    async def warm_up(self):
+        # Lúc worker khởi động (common/workers.py): mở client, tải JWKS + danh sách thu hồi
+        # trước request đầu tiên thay vì để request đó chờ
+        self._http()
+        if self.jwks_url: await self._refresh_jwks()
+        if self.revocations_url: await self._sync_revocations()
+
+    async def verify(self, authorization: str):
+        return self._check_revoked(await self._verify(authorization))
+
+    async def _verify(self, authorization: str):
+        token = _bearer(authorization)
+        if self.jwks_url:
+            self.stats["local"] += 1
+            return await self._verify_jwks(token)
+        if self.secret_key:
+            self.stats["local"] += 1
+            try: return jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+            except JWTError: raise HTTPException(401, "Invalid Token")
+
+        key = hashlib.sha256(token.encode()).hexdigest()
+        payload = self._cache_get(key)
+        if payload is not None:
+            self.stats["hits"] += 1
+            return payload
+        self.stats["misses"] += 1
+        fut = self._inflight.get(key)
+        if fut is None:
+            fut = self._inflight[key] = asyncio.ensure_future(self._fetch(key, token))
+            fut.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield: 1 request bị huỷ không làm huỷ lần gọi mà các request khác đang chờ
+        return await asyncio.shield(fut)
+
+_verifier = None
+
+def get_verifier():
+    global _verifier
+    if _verifier is None:
+        secret = os.getenv("SECRET_KEY") if AUTH_VERIFY_LOCAL else None
+        jwks_url = f"{USER_SERVICE_URL}/.well-known/jwks.json" if AUTH_VERIFY_LOCAL else None
+        _verifier = TokenVerifier(f"{USER_SERVICE_URL}/verify", secret_key=secret, algorithm=os.getenv("ALGORITHM", "RS256"),
+                                  jwks_url=jwks_url, revocations_url=f"{USER_SERVICE_URL}/revocations")
+    return _verifier
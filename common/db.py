@@ -0,0 +1,231 @@
+"""Engine + session SQLAlchemy dùng chung cho các service.
+
+Mỗi service gọi create_database("<PREFIX>", "<tên db mặc định>") trong database.py của nó.
+Mọi tham số đọc từ env, ưu tiên biến riêng của service rồi mới tới biến chung:
+
+    <PREFIX>_DATABASE_URL / DATABASE_URL   URL đầy đủ, vd. sqlite:///./data/{db_name}.db
+                                           ({db_name} được thay bằng tên db của service;
+                                           file SQLite chạy ở chế độ WAL, xem perf/local_stack.py)
+    <PREFIX>_DB_HOST / DB_HOST             (mặc định "db"), DB_PORT (3306)
+    <PREFIX>_DB_NAME                       (mặc định: tên db truyền vào; không có biến chung)
+    DB_ROOT_USER, DB_PASSWORD
+    <PREFIX>_DB_POOL_SIZE / DB_POOL_SIZE          số kết nối giữ sẵn (mặc định 10)
+    <PREFIX>_DB_MAX_OVERFLOW / DB_MAX_OVERFLOW    kết nối tạm thêm khi pool hết (mặc định 20)
+                                                  Hai số trên là của CẢ service: chạy nhiều worker
+                                                  (WEB_CONCURRENCY, common/serve.py) thì mỗi worker
+                                                  nhận 1 phần, xem pool_budget()
+    <PREFIX>_DB_POOL_TIMEOUT / DB_POOL_TIMEOUT    giây chờ kết nối rảnh trước khi báo lỗi (10)
+    <PREFIX>_DB_POOL_RECYCLE / DB_POOL_RECYCLE    giây, đóng kết nối cũ hơn mức này; phải nhỏ
+                                                  hơn wait_timeout của MySQL (mặc định 1800)
+    <PREFIX>_DB_POOL_PRE_PING / DB_POOL_PRE_PING  ping trước khi dùng kết nối (mặc định 1)
+
+Ví dụ ORDER_DB_POOL_SIZE=30 chỉ tăng pool của order_service.
+pool_stats(engine) trả về mức dùng pool (các service công bố qua GET /metrics/db).
+
+Read replica (create_read_router): <PREFIX>_REPLICA_DATABASE_URL hoặc <PREFIX>_REPLICA_DB_HOST.
+Không cấu hình thì mọi session đọc dùng luôn primary. Các endpoint GET dùng get_read_db;
+sau khi ghi, service gọi read_router.mark_write("user_id=5", ...) để trong
+READ_YOUR_WRITES_SECONDS các request đọc mang cùng query param (hoặc cùng path) đi vào
+primary, không thấy dữ liệu cũ do replica trễ. Mốc ghim nằm trong RAM của process; chạy
+nhiều worker (common/serve.py) thì ghim thêm ra file trong WORKER_STATS_DIR/pins để ghi
+ở worker này, đọc ở worker khác vẫn đi vào primary.
+"""
+import os
+import time
+import hashlib
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+def _env(prefix: str, name: str, default, cast=str):
+    value = os.getenv(f"{prefix}_{name}", os.getenv(name))
+    if value is None or value == "": return default
+    if cast is bool: return value.lower() in ("1", "true", "yes")
+    return cast(value)
+
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", 5))
+# Query param dùng làm khoá ghim đọc-sau-ghi
+PIN_PARAMS = ("user_id", "branch_id", "order_id")
+
+def database_url(prefix: str, db_name: str, replica: bool = False):
+    # Chỉ biến riêng của service: DB_NAME chung sẽ trỏ mọi service vào cùng 1 database
+    db_name = os.getenv(f"{prefix}_DB_NAME") or db_name
+    if replica:
+        # Chỉ biến riêng của service; không cấu hình -> None (không có replica)
+        url, host = os.getenv(f"{prefix}_REPLICA_DATABASE_URL"), os.getenv(f"{prefix}_REPLICA_DB_HOST")
+        if not url and not host: return None
+    else:
+        url, host = _env(prefix, "DATABASE_URL", None), _env(prefix, "DB_HOST", "db")
+    if url: return url.replace("{db_name}", db_name)
+    user = os.getenv("DB_ROOT_USER", "root")
+    password = os.getenv("DB_PASSWORD", "123456")
+    port = (os.getenv(f"{prefix}_REPLICA_DB_PORT") if replica else None) or _env(prefix, "DB_PORT", "3306")
+    return f"mysql+pymysql://{user}:{password}@{host}:{port}/{db_name}"
+
+def pool_budget(prefix: str):
+    """(pool_size, max_overflow) của 1 worker: chia đều ngân sách kết nối của service cho WEB_CONCURRENCY worker.
+
+    Tổng kết nối tới MySQL giữ nguyên khi tăng số worker (max_connections mặc định chỉ 151).
+    """
+    workers = max(1, int(os.getenv("WEB_CONCURRENCY") or 1))
+    return max(1, _env(prefix, "DB_POOL_SIZE", 10, int) // workers), max(0, _env(prefix, "DB_MAX_OVERFLOW", 20, int) // workers)
+
+def create_db_engine(url: str, prefix: str):
+    if url.startswith("sqlite"):
+        # Chạy local / test: không có pool MySQL để tinh chỉnh
+        memory = url in ("sqlite://", "sqlite:///:memory:")
+        kwargs = {"connect_args": {"check_same_thread": False, "timeout": _env(prefix, "DB_POOL_TIMEOUT", 10, float)}}
+        if memory: kwargs["poolclass"] = StaticPool
+        engine = create_engine(url, **kwargs)
+        if not memory: _sqlite_wal(engine)
+    else:
+        pool_size, max_overflow = pool_budget(prefix)
+        engine = create_engine(
+            url,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=_env(prefix, "DB_POOL_TIMEOUT", 10, float),
+            pool_recycle=_env(prefix, "DB_POOL_RECYCLE", 1800, int),
+            pool_pre_ping=_env(prefix, "DB_POOL_PRE_PING", True, bool),
+        )
+    _track_pool(engine)
+    return engine
+
+def _sqlite_wal(engine):
+    # File SQLite (local perf stack): WAL cho phép đọc song song với 1 luồng ghi,
+    # timeout ở trên là thời gian chờ khoá ghi thay vì báo "database is locked" ngay
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_conn, record):
+        cursor = dbapi_conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+def _track_pool(engine):
+    stats = engine.pool_counters = {"connects": 0, "checkouts": 0, "peak_checked_out": 0, "invalidated": 0}
+    checked_out = {"now": 0}
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_conn, record):
+        stats["connects"] += 1
+
+    @event.listens_for(engine.pool, "checkout")
+    def on_checkout(dbapi_conn, record, proxy):
+        stats["checkouts"] += 1
+        checked_out["now"] += 1
+        stats["peak_checked_out"] = max(stats["peak_checked_out"], checked_out["now"])
+
+    @event.listens_for(engine.pool, "checkin")
+    def on_checkin(dbapi_conn, record):
+        checked_out["now"] = max(0, checked_out["now"] - 1)
+
+    @event.listens_for(engine.pool, "invalidate")
+    def on_invalidate(dbapi_conn, record, exc):
+        stats["invalidated"] += 1
+
+def pool_stats(engine):
+    pool = engine.pool
+    result = {"pool": type(pool).__name__, **getattr(engine, "pool_counters", {})}
+    if hasattr(pool, "checkedout") and hasattr(pool, "size"):
+        size, out, overflow = pool.size(), pool.checkedout(), max(0, pool.overflow())
+        capacity = size + max(0, getattr(pool, "_max_overflow", 0))
+        result.update({
+            "size": size, "checked_in": pool.checkedin(), "checked_out": out, "overflow": overflow,
+            "capacity": capacity, "utilization": round(out / capacity, 3) if capacity else None,
+        })
+    return result
+
+def create_database(prefix: str, db_name: str):
+    """(engine, SessionLocal) cho 1 service."""
+    engine = create_db_engine(database_url(prefix, db_name), prefix)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+class ReadRouter:
+    """Chọn session đọc: replica, trừ khi request đang bị ghim về primary sau 1 lần ghi."""
+
+    def __init__(self, primary_sessionmaker, replica_sessionmaker=None, replica_engine=None, pin_seconds: float = READ_YOUR_WRITES_SECONDS, pin_dir: str = None):
+        self.primary = primary_sessionmaker
+        self.replica = replica_sessionmaker
+        self.replica_engine = replica_engine
+        self.pin_seconds = pin_seconds
+        self.pin_dir = pin_dir
+        self._pins = {}  # khoá -> hạn ghim (monotonic)
+        self.stats = {"replica_reads": 0, "primary_reads": 0, "pinned_reads": 0}
+
+    # --- Ghim dùng chung giữa các worker: 1 file rỗng / khoá, mtime = hạn ghim (epoch) ---
+    def _pin_path(self, key):
+        return os.path.join(self.pin_dir, hashlib.sha1(key.encode()).hexdigest())
+
+    def _share_pins(self, keys, until):
+        try:
+            os.makedirs(self.pin_dir, exist_ok=True)
+            for key in keys:
+                path = self._pin_path(key)
+                with open(path, "a"): pass
+                os.utime(path, (until, until))
+        except OSError as e:
+            print(f"Sharing read-your-writes pins failed: {e}")
+
+    def _shared_pinned(self, keys):
+        now = time.time()
+        for key in keys:
+            try:
+                if os.stat(self._pin_path(key)).st_mtime > now: return True
+            except OSError:
+                pass
+        return False
+
+    def _prune_shared_pins(self):
+        now = time.time()
+        try:
+            for entry in os.scandir(self.pin_dir):
+                if entry.stat().st_mtime <= now: os.remove(entry.path)
+        except OSError:
+            pass
+
+    def mark_write(self, *keys):
+        if self.replica is None: return
+        keys = [key for key in keys if key]
+        now = time.monotonic()
+        if len(self._pins) > 10000:
+            self._pins = {k: t for k, t in self._pins.items() if t > now}
+            if self.pin_dir: self._prune_shared_pins()
+        for key in keys: self._pins[key] = now + self.pin_seconds
+        if self.pin_dir: self._share_pins(keys, time.time() + self.pin_seconds)
+
+    @staticmethod
+    def request_keys(request):
+        keys = [request.url.path]
+        keys += [f"{name}={request.query_params[name]}" for name in PIN_PARAMS if name in request.query_params]
+        return keys
+
+    def _pinned(self, keys):
+        now = time.monotonic()
+        if any(self._pins.get(k, 0) > now for k in keys): return True
+        return bool(self.pin_dir) and self._shared_pinned(keys)
+
+    def session(self, keys=()):
+        if self.replica is None:
+            self.stats["primary_reads"] += 1
+            return self.primary()
+        if self._pinned(keys):
+            self.stats["pinned_reads"] += 1
+            return self.primary()
+        self.stats["replica_reads"] += 1
+        return self.replica()
+
+def create_read_router(prefix: str, db_name: str, primary_sessionmaker):
+    url = database_url(prefix, db_name, replica=True)
+    if not url: return ReadRouter(primary_sessionmaker)
+    engine = create_db_engine(url, f"{prefix}_REPLICA")
+    # Launcher đặt WORKER_STATS_DIR (1 thư mục / service) khi chạy nhiều worker
+    stats_dir = os.getenv("WORKER_STATS_DIR")
+    pin_dir = os.path.join(stats_dir, "pins") if stats_dir else None
+    return ReadRouter(primary_sessionmaker, sessionmaker(autocommit=False, autoflush=False, bind=engine), engine, pin_dir=pin_dir)
+
+def db_metrics(engine, read_router=None):
+    result = pool_stats(engine)
+    if read_router is not None:
+        result["routing"] = dict(read_router.stats)
+        if read_router.replica_engine is not None: result["replica"] = pool_stats(read_router.replica_engine)
+    return result
@@ -0,0 +1,143 @@
+"""Migration có đánh số cho từng service.
+
+Mỗi service có thư mục migrations/ gồm các file NNNN_ten.py, mỗi file có hàm
+upgrade(m) nhận 1 Migrator. Lúc khởi động, sau Base.metadata.create_all (tạo bảng
+mới cho DB trống), run_migrations() chạy lần lượt các file chưa có trong bảng
+schema_migrations, mỗi file 1 transaction, rồi ghi lại version.
+
+create_all không sửa bảng đã tồn tại -> cột / index thêm sau này phải đi qua migration.
+Các thao tác của Migrator kiểm tra trước (cột, index đã có thì bỏ qua) nên DB mới tạo
+bằng create_all và DB cũ đều đi tới cùng 1 schema.
+
+Chạy tay: python -m common.migrations <thư mục service>   (từ thư mục gốc repo)
+Chạy nhiều worker (common/serve.py): process cha gọi prepare_schema() 1 lần trước khi spawn
+worker, để các worker không cùng lúc CREATE TABLE trên DB trống.
+"""
+import os
+import re
+import sys
+import datetime
+import importlib.util
+from sqlalchemy import Column, DateTime, Index, MetaData, String, Table, inspect, text
+
+MIGRATIONS_TABLE = "schema_migrations"
+# Nhiều worker khởi động cùng lúc: chỉ 1 worker chạy migration (MySQL GET_LOCK)
+MIGRATION_LOCK_TIMEOUT = int(os.getenv("MIGRATION_LOCK_TIMEOUT", 60))
+
+class Migrator:
+    def __init__(self, conn):
+        self.conn = conn
+        self.dialect = conn.dialect
+
+    def _inspector(self):
+        # Tạo mới mỗi lần: inspector cache kết quả, không thấy thay đổi vừa làm
+        return inspect(self.conn)
+
+    def has_table(self, table):
+        return self._inspector().has_table(table)
+
+    def has_column(self, table, column):
+        return column in {c["name"] for c in self._inspector().get_columns(table)}
+
+    def has_index(self, table, name):
+        insp = self._inspector()
+        names = {i["name"] for i in insp.get_indexes(table)}
+        names |= {u["name"] for u in insp.get_unique_constraints(table)}
+        return name in names
+
+    def execute(self, sql, **params):
+        return self.conn.execute(text(sql), params)
+
+    def add_column(self, table, name, type_, nullable=True, server_default=None):
+        if not self.has_table(table) or self.has_column(table, name): return False
+        ddl = f"ALTER TABLE {table} ADD COLUMN {name} {type_.compile(dialect=self.dialect)}"
+        if server_default is not None: ddl += f" DEFAULT {server_default}"
+        if not nullable: ddl += " NOT NULL"
+        self.execute(ddl)
+        return True
+
+    def create_index(self, name, table, columns, unique=False):
+        if not self.has_table(table) or self.has_index(table, name): return False
+        reflected = Table(table, MetaData(), autoload_with=self.conn)
+        Index(name, *[reflected.c[c] for c in columns], unique=unique).create(bind=self.conn)
+        return True
+
+    def drop_index(self, name, table):
+        if not self.has_table(table) or not self.has_index(table, name): return False
+        if self.dialect.name == "mysql": self.execute(f"DROP INDEX {name} ON {table}")
+        else: self.execute(f"DROP INDEX {name}")
+        return True
+
+def discover(directory):
+    """[(version, name, path)] theo thứ tự version."""
+    found = []
+    for filename in os.listdir(directory):
+        match = re.match(r"^(\d{4})_(\w+)\.py$", filename)
+        if match: found.append((match.group(1), match.group(2), os.path.join(directory, filename)))
+    return sorted(found)
+
+def _load(path):
+    spec = importlib.util.spec_from_file_location(f"migration_{os.path.basename(path)[:-3]}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def _migrations_table():
+    return Table(
+        MIGRATIONS_TABLE, MetaData(),
+        Column("version", String(16), primary_key=True),
+        Column("name", String(200)),
+        Column("applied_at", DateTime),
+    )
+
+def applied_versions(engine):
+    table = _migrations_table()
+    table.create(bind=engine, checkfirst=True)
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(table.select().with_only_columns(table.c.version))}
+
+def run_migrations(engine, directory, verbose=True):
+    """Chạy các migration còn thiếu; trả về danh sách version vừa chạy."""
+    if not os.path.isdir(directory): return []
+    table = _migrations_table()
+    table.create(bind=engine, checkfirst=True)
+    applied = []
+    with engine.connect() as lock_conn:
+        locked = engine.dialect.name == "mysql"
+        if locked:
+            got = lock_conn.execute(text("SELECT GET_LOCK(:name, :timeout)"), {"name": MIGRATIONS_TABLE, "timeout": MIGRATION_LOCK_TIMEOUT}).scalar()
+            if not got: raise RuntimeError("Timed out waiting for migration lock")
+        try:
+            done = applied_versions(engine)
+            for version, name, path in discover(directory):
+                if version in done: continue
+                module = _load(path)
+                # DDL của MySQL tự commit; các bước của migration phải chạy lại được nếu dở dang
+                with engine.begin() as conn:
+                    module.upgrade(Migrator(conn))
+                    conn.execute(table.insert().values(version=version, name=name, applied_at=datetime.datetime.utcnow()))
+                applied.append(version)
+                if verbose: print(f"Applied migration {version}_{name}")
+        finally:
+            if locked: lock_conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": MIGRATIONS_TABLE})
+    return applied
+
+def prepare_schema(service_dir, verbose=True):
+    """create_all + migrations của 1 service (như lúc main.py được import); service không có DB -> None."""
+    service_dir = os.path.abspath(service_dir)
+    if not os.path.exists(os.path.join(service_dir, "database.py")): return None
+    if service_dir not in sys.path: sys.path.insert(0, service_dir)
+    import database
+    import models  # noqa: F401  (đăng ký bảng vào Base)
+    try:
+        database.Base.metadata.create_all(bind=database.engine)
+        return run_migrations(database.engine, os.path.join(service_dir, "migrations"), verbose=verbose)
+    finally:
+        database.engine.dispose()
+
+if __name__ == "__main__":
+    # python -m common.migrations order_service
+    if len(sys.argv) != 2:
+        print("Usage: python -m common.migrations <service_dir>")
+        sys.exit(1)
+    print(prepare_schema(sys.argv[1]) or "Up to date")
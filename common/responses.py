@@ -0,0 +1,39 @@
+"""Trả JSON nhanh cho mọi service.
+
+FastAPI mặc định đưa giá trị trả về (dict, list, object SQLAlchemy) qua jsonable_encoder
+rồi json.dumps: duyệt đệ quy từng giá trị, chiếm phần lớn CPU khi danh sách dài.
+Ở đây:
+- FastJSONResponse: render bằng orjson (không có orjson thì json chuẩn, cùng kết quả);
+  đặt làm default_response_class của app.
+- Endpoint danh sách lớn tự dựng list dict từ cột (không nạp object ORM) rồi
+  return FastJSONResponse(rows): FastAPI bỏ qua jsonable_encoder và response_model
+  (response_model khi đó chỉ để mô tả schema trong /docs).
+- Nội dung đã là JSON bytes (cache, body của service khác) -> đi thẳng ra, không encode lại.
+"""
+import json
+import datetime
+from decimal import Decimal
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # orjson là tuỳ chọn: thiếu thì chậm hơn nhưng vẫn đúng
+    orjson = None
+
+def _default(value):
+    # Kiểu orjson / json không tự xử lý (Decimal từ MySQL, date khi dùng json chuẩn)
+    if isinstance(value, Decimal): return float(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)): return value.isoformat()
+    if hasattr(value, "model_dump"): return value.model_dump(mode="json")
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps(content) -> bytes:
+    """Giống JSONResponse của Starlette: UTF-8, không escape tiếng Việt, không khoảng trắng."""
+    if orjson is not None: return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        # Đã serialize sẵn -> trả nguyên
+        if isinstance(content, (bytes, bytearray, memoryview)): return bytes(content)
+        return dumps(content)
@@ -0,0 +1,105 @@
+"""Entrypoint production cho mọi service: nhiều worker uvicorn trên 1 socket chung.
+
+    python -m common.serve --port 8002                    # trong thư mục service (Docker: /app)
+    python -m common.serve --port 8005 --max-workers 1    # service giữ state trong RAM
+    python -m common.serve --port 8001 --reload           # dev: 1 process, tự nạp lại khi sửa code
+
+- Số worker: WEB_CONCURRENCY, không đặt thì = số CPU process được dùng (tính cả quota cgroup
+  của container, không phải số core của máy host), giới hạn bởi --max-workers.
+- Process cha bind socket rồi spawn các worker (uvicorn multiprocess): mọi worker accept trên
+  cùng socket, kernel chia kết nối; worker chết được khởi động lại. Worker chỉ accept sau khi
+  chạy xong startup (warm-up pool / cache, xem common/workers.py).
+- uvloop + httptools nếu đã cài (requirements.txt), thiếu thì dùng asyncio / h11 và in cảnh báo.
+- SIGTERM (docker stop): ngừng nhận kết nối mới, chờ request đang chạy tối đa GRACEFUL_TIMEOUT
+  giây (stop_grace_period của container phải lớn hơn).
+- Worker biết tổng số worker qua WEB_CONCURRENCY (vd. hashing.py chia process pool bcrypt) và
+  ghi số liệu vào WORKER_STATS_DIR cho GET /metrics/worker?all=true.
+
+Pool DB (DB_POOL_SIZE + DB_MAX_OVERFLOW) là ngân sách của cả service, chia đều cho các worker
+(common/db.py pool_budget): thêm worker không làm tăng số kết nối tới MySQL.
+Ghim đọc-sau-ghi của read replica (common/db.py) được chia sẻ qua WORKER_STATS_DIR/pins.
+"""
+import os
+import sys
+import math
+import shutil
+import argparse
+import tempfile
+import importlib.util
+
+GRACEFUL_TIMEOUT = int(os.getenv("GRACEFUL_TIMEOUT", 30))
+KEEP_ALIVE_TIMEOUT = int(os.getenv("KEEP_ALIVE_TIMEOUT", 5))
+BACKLOG = int(os.getenv("BACKLOG", 2048))
+
+def _cgroup_cpu_quota():
+    # cgroup v2: "quota period" hoặc "max period"; cgroup v1: cfs_quota_us = -1 khi không giới hạn
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f: quota, period = f.read().split()[:2]
+        if quota != "max": return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f: quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f: period = int(f.read())
+        if quota > 0: return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+def available_cpus():
+    try: cpus = len(os.sched_getaffinity(0))
+    except AttributeError: cpus = os.cpu_count() or 1
+    quota = _cgroup_cpu_quota()
+    if quota: cpus = min(cpus, max(1, math.ceil(quota)))
+    return cpus
+
+def worker_count(requested=None, max_workers=None):
+    configured = requested or os.getenv("WEB_CONCURRENCY")
+    workers = int(configured) if configured else available_cpus()
+    if max_workers: workers = min(workers, max_workers)
+    return max(1, workers)
+
+def _installed(module, fallback):
+    if importlib.util.find_spec(module) is not None: return True
+    print(f"{module} is not installed, falling back to {fallback}", file=sys.stderr)
+    return False
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chạy 1 service với nhiều worker uvicorn")
+    parser.add_argument("--app", default="main:app")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument("--workers", type=int, help="mặc định WEB_CONCURRENCY hoặc số CPU")
+    parser.add_argument("--max-workers", type=int, help="trần số worker (service giữ state trong RAM: 1)")
+    parser.add_argument("--reload", action="store_true", help="chế độ dev: 1 process, tự nạp lại code")
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    parser.add_argument("--no-access-log", action="store_true")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+    workers = 1 if args.reload else worker_count(args.workers, args.max_workers)
+    # Process con (spawn) kế thừa env: đọc được số worker và thư mục số liệu
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    stats_dir = None
+    if workers > 1:
+        # Tạo bảng + migration 1 lần ở đây: các worker import main.py cùng lúc sẽ tranh nhau CREATE TABLE.
+        # Service không có DB (gateway, không cài sqlalchemy) thì bỏ qua
+        if os.path.exists(os.path.join(os.getcwd(), "database.py")):
+            from common.migrations import prepare_schema
+            prepare_schema(os.getcwd())
+        if not os.getenv("WORKER_STATS_DIR"):
+            stats_dir = os.environ["WORKER_STATS_DIR"] = tempfile.mkdtemp(prefix=f"workers_{args.port}_")
+    loop = "uvloop" if _installed("uvloop", "asyncio") else "asyncio"
+    http = "httptools" if _installed("httptools", "h11") else "h11"
+    print(f"Serving {args.app} on {args.host}:{args.port}: {workers} worker(s), loop={loop}, http={http}", flush=True)
+    try:
+        uvicorn.run(
+            args.app, host=args.host, port=args.port, workers=workers, reload=args.reload,
+            loop=loop, http=http, backlog=BACKLOG, timeout_keep_alive=KEEP_ALIVE_TIMEOUT,
+            timeout_graceful_shutdown=GRACEFUL_TIMEOUT, log_level=args.log_level, access_log=not args.no_access_log,
+        )
+    finally:
+        if stats_dir: shutil.rmtree(stats_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
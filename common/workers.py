@@ -0,0 +1,169 @@
+"""Trạng thái riêng của từng worker khi service chạy nhiều process (python -m common.serve).
+
+setup_worker(app, engines={...}, warmups=[...]) gọi ngay sau khi tạo app:
+- Startup: mở sẵn kết nối DB cho pool (WORKER_WARMUP_CONNECTIONS, mặc định = pool_size)
+  và chạy các hàm warm-up (vd. tải JWKS). uvicorn chỉ accept trên socket chung sau khi
+  startup xong, nên worker mới không nhận request khi pool / cache còn trống.
+  Warm-up lỗi (vd. User Service chưa lên) chỉ in log, không chặn worker khởi động.
+- Đếm request / đang xử lý / lỗi 5xx / thời gian xử lý của worker (ASGI middleware).
+- GET /metrics/worker: số liệu của worker trả lời request (pid, event loop, pool DB, CPU).
+  Kết nối đi vào worker bất kỳ nên mỗi worker ghi snapshot ra WORKER_STATS_DIR (launcher
+  đặt, 1 thư mục cho mỗi service) mỗi WORKER_STATS_SECONDS; ?all=true trả về mọi worker.
+"""
+import os
+import json
+import time
+import asyncio
+import inspect
+import resource
+from fastapi import Query
+
+WORKER_WARMUP_CONNECTIONS = os.getenv("WORKER_WARMUP_CONNECTIONS")
+WORKER_STATS_SECONDS = float(os.getenv("WORKER_STATS_SECONDS", 5))
+
+class WorkerStats:
+    def __init__(self, engines=None, stats_dir=None):
+        self.pid = os.getpid()
+        self.engines = {name: e for name, e in (engines or {}).items() if e is not None}
+        self.stats_dir = stats_dir
+        self.started_at = time.time()
+        self.warmup_ms = None
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+
+    def snapshot(self):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        try: loop = type(asyncio.get_running_loop()).__module__.split(".")[0]
+        except RuntimeError: loop = None
+        return {
+            "pid": self.pid, "ready": self.warmup_ms is not None, "warmup_ms": self.warmup_ms,
+            "uptime_seconds": round(time.time() - self.started_at, 1), "event_loop": loop,
+            "requests": self.requests, "in_flight": self.in_flight, "peak_in_flight": self.peak_in_flight, "errors_5xx": self.errors,
+            "avg_ms": round(self.busy_seconds * 1000 / self.requests, 3) if self.requests else None,
+            "cpu_seconds": round(usage.ru_utime + usage.ru_stime, 3), "max_rss_mb": round(usage.ru_maxrss / 1024, 1),
+            "db": self._db_stats(),
+        }
+
+    def _db_stats(self):
+        if not self.engines: return {}
+        # Import khi cần: gateway không có DB (không cài sqlalchemy) vẫn dùng được module này
+        from common.db import pool_stats
+        return {name: pool_stats(engine) for name, engine in self.engines.items()}
+
+    # --- Snapshot chia sẻ giữa các worker ---
+    def _path(self, pid):
+        return os.path.join(self.stats_dir, f"{pid}.json")
+
+    def write(self):
+        if not self.stats_dir: return
+        tmp = self._path(self.pid) + ".tmp"
+        with open(tmp, "w") as f: json.dump({**self.snapshot(), "written_at": time.time()}, f)
+        os.replace(tmp, self._path(self.pid))
+
+    def remove(self):
+        if self.stats_dir:
+            try: os.remove(self._path(self.pid))
+            except FileNotFoundError: pass
+
+    def all_workers(self):
+        """Snapshot mới nhất của mọi worker còn sống (của chính worker này thì lấy trực tiếp)."""
+        workers = {self.pid: self.snapshot()}
+        if self.stats_dir and os.path.isdir(self.stats_dir):
+            for filename in os.listdir(self.stats_dir):
+                if not filename.endswith(".json") or not filename[:-5].isdigit(): continue
+                pid = int(filename[:-5])
+                if pid in workers: continue
+                try:
+                    os.kill(pid, 0)
+                    with open(os.path.join(self.stats_dir, filename)) as f: workers[pid] = json.load(f)
+                except ProcessLookupError:
+                    # Worker đã chết (bị restart): dọn snapshot cũ
+                    try: os.remove(os.path.join(self.stats_dir, filename))
+                    except FileNotFoundError: pass
+                except (OSError, ValueError):
+                    pass
+        return sorted(workers.values(), key=lambda w: w["pid"])
+
+class RequestCounter:
+    """ASGI middleware: cộng số liệu request vào WorkerStats (không đụng tới body)."""
+
+    def __init__(self, app, stats: WorkerStats):
+        self.app = app
+        self.stats = stats
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http": return await self.app(scope, receive, send)
+        stats = self.stats
+        stats.in_flight += 1
+        stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        status = [500]
+
+        async def send_status(message):
+            if message["type"] == "http.response.start": status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            stats.in_flight -= 1
+            stats.requests += 1
+            stats.busy_seconds += time.perf_counter() - start
+            if status[0] >= 500: stats.errors += 1
+
+def warm_pool(engine, connections=None):
+    """Mở sẵn `connections` kết nối (mặc định = pool_size) rồi trả lại pool; trả về số kết nối đã mở."""
+    size = engine.pool.size() if hasattr(engine.pool, "size") else 1
+    n = min(size, int(connections if connections is not None else WORKER_WARMUP_CONNECTIONS or size))
+    conns = []
+    try:
+        # Giữ cả n kết nối cùng lúc -> pool phải mở n kết nối khác nhau
+        for _ in range(n): conns.append(engine.connect())
+        for conn in conns: conn.exec_driver_sql("SELECT 1")
+    finally:
+        for conn in conns: conn.close()
+    return n
+
+def setup_worker(app, engines=None, warmups=()):
+    stats = app.state.worker_stats = WorkerStats(engines, os.getenv("WORKER_STATS_DIR") or None)
+    app.add_middleware(RequestCounter, stats=stats)
+    tasks = []
+
+    async def _write_loop():
+        while True:
+            await asyncio.sleep(WORKER_STATS_SECONDS)
+            try: stats.write()
+            except OSError as e: print(f"Worker stats write failed: {e}")
+
+    @app.on_event("startup")
+    async def warm_up_worker():
+        start = time.perf_counter()
+        for name, engine in stats.engines.items():
+            try: await asyncio.to_thread(warm_pool, engine)
+            except Exception as e: print(f"Worker {stats.pid}: warm-up of {name} pool failed: {e}")
+        for warmup in warmups:
+            try:
+                result = warmup()
+                if inspect.isawaitable(result): await result
+            except Exception as e: print(f"Worker {stats.pid}: warm-up {getattr(warmup, '__qualname__', warmup)} failed: {e}")
+        stats.warmup_ms = round((time.perf_counter() - start) * 1000, 1)
+        if stats.stats_dir:
+            os.makedirs(stats.stats_dir, exist_ok=True)
+            stats.write()
+            if WORKER_STATS_SECONDS > 0: tasks.append(asyncio.create_task(_write_loop()))
+
+    @app.on_event("shutdown")
+    async def remove_worker_stats():
+        for task in tasks: task.cancel()
+        stats.remove()
+
+    @app.get("/metrics/worker")
+    async def get_worker_metrics(all_workers: bool = Query(False, alias="all")):
+        if not all_workers: return stats.snapshot()
+        workers = stats.all_workers()
+        return {"workers": workers, "count": len(workers), "requests": sum(w["requests"] for w in workers)}
+
+    return stats
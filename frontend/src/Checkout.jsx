@@ -67,13 +67,10 @@ function Checkout() {
         }
 
         setLoading(true);
-        const userId = localStorage.getItem('user_id');
 
         try {
+            // Server tự đọc giỏ hàng, tạo đơn, xoá giỏ và thanh toán trong 1 lần gọi
             const orderPayload = {
-                user_id: userId ? parseInt(userId) : null,
-                branch_id: branch_id,
-                items: items.map(item => ({ food_id: item.food_id, quantity: item.quantity })),
                 coupon_code: coupon ? coupon.code : null,
                 customer_name: customerInfo.name,
                 customer_phone: customerInfo.phone,
@@ -81,18 +78,17 @@ function Checkout() {
                 note: customerInfo.note
             };
 
-            const orderRes = await api.post('/checkout', orderPayload);
-            const { order_id, total_price } = orderRes.data;
-
-            await api.post('/pay', { order_id: order_id, amount: total_price });
+            const orderRes = await api.post('/checkout/cart', orderPayload);
+            if (orderRes.data.payment && orderRes.data.payment.status === 'FAILED') {
+                toast.warning("Đã tạo đơn nhưng thanh toán chưa thành công");
+            }
 
             setStep(3);
             toast.success("Đặt hàng thành công! 🚀");
-            try { await api.delete('/cart'); } catch(e) {}
 
         } catch (err) {
             console.error(err);
-            toast.error("Lỗi xử lý đơn hàng");
+            toast.error(err.response?.data?.detail || "Lỗi xử lý đơn hàng");
         } finally {
             setLoading(false);
         }
@@ -16,9 +16,10 @@ function Login() {
         try {
             const res = await api.post('/login', { email, password });
             
-            const { access_token, role, seller_mode, branch_id, id } = res.data;
+            const { access_token, refresh_token, role, seller_mode, branch_id, id } = res.data;
 
             localStorage.setItem('access_token', access_token);
+            localStorage.setItem('refresh_token', refresh_token);
             localStorage.setItem('role', role);
             if (seller_mode) localStorage.setItem('seller_mode', seller_mode);
             if (branch_id) localStorage.setItem('branch_id', branch_id);
@@ -1,7 +1,7 @@
 import { useState, useEffect, useMemo } from 'react'; // Thêm useMemo
 import { useNavigate } from 'react-router-dom';
 import { toast } from 'react-toastify';
-import api from './api';
+import api, { logout } from './api';
 
 function SellerDashboard() {
     const navigate = useNavigate();
@@ -108,7 +108,7 @@ function SellerDashboard() {
         <div className="seller-container">
             <header className="seller-header">
                 <div><h2>💼 Kênh Người Bán ({sellerMode === 'owner' ? 'Chủ' : 'NV'})</h2>{branchId && <small>Chi nhánh ID: {branchId}</small>}</div>
-                <button onClick={() => { localStorage.clear(); navigate('/'); }} className="logout-btn">Đăng xuất</button>
+                <button onClick={async () => { await logout(); navigate('/'); }} className="logout-btn">Đăng xuất</button>
             </header>
 
             {/* --- KHU VỰC THỐNG KÊ (MỚI) --- */}
@@ -1,7 +1,7 @@
 import { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { toast } from 'react-toastify';
-import api from './api';
+import api, { logout } from './api';
 
 function Shop() {
     const [foods, setFoods] = useState([]);
@@ -69,8 +69,8 @@ function Shop() {
         }
     };
 
-    const handleLogout = () => {
-        localStorage.clear();
+    const handleLogout = async () => {
+        await logout();
         navigate('/');
         toast.info("Đã đăng xuất.");
     };
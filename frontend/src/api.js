@@ -19,4 +19,43 @@ api.interceptors.request.use((config) => {
     return config;
 });
 
+// Access token hết hạn -> đổi refresh token lấy token mới rồi gửi lại request (1 lần).
+// Nhiều request cùng 401 dùng chung 1 lần refresh vì refresh token chỉ dùng được 1 lần.
+let refreshing = null;
+
+const refreshTokens = async () => {
+    const refresh_token = localStorage.getItem('refresh_token');
+    if (!refresh_token) throw new Error('No refresh token');
+    const res = await axios.post(`${API_URL}/token/refresh`, { refresh_token });
+    localStorage.setItem('access_token', res.data.access_token);
+    localStorage.setItem('refresh_token', res.data.refresh_token);
+    return res.data.access_token;
+};
+
+api.interceptors.response.use(null, async (error) => {
+    const original = error.config;
+    if (error.response?.status !== 401 || !original || original._retried || original.url === '/token/refresh') {
+        return Promise.reject(error);
+    }
+    original._retried = true;
+    try {
+        refreshing = refreshing || refreshTokens().finally(() => { refreshing = null; });
+        const token = await refreshing;
+        original.headers.Authorization = `Bearer ${token}`;
+        return api(original);
+    } catch {
+        return Promise.reject(error);
+    }
+});
+
+// Thu hồi token phía server rồi xoá phiên ở trình duyệt
+export const logout = async () => {
+    try {
+        await api.post('/logout', { refresh_token: localStorage.getItem('refresh_token') });
+    } catch {
+        // Token đã hết hạn / server lỗi: vẫn xoá phiên ở trình duyệt
+    }
+    localStorage.clear();
+};
+
 export default api;
\ No newline at end of file
@@ -2,8 +2,11 @@ import os
 import httpx
 from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from common.responses import FastJSONResponse
+from common.workers import setup_worker
 
-app = FastAPI(title="API Gateway")
+app = FastAPI(title="API Gateway", default_response_class=FastJSONResponse)
+setup_worker(app)
 
 # ==================================================================
 # 0. CẤU HÌNH CORS (Cho phép React truy cập)
@@ -61,6 +64,15 @@ async def login(req: Request): return await forward_request(USER_SERVICE_URL, "l
 @app.api_route("/register", methods=["POST"])
 async def register(req: Request): return await forward_request(USER_SERVICE_URL, "register", req)
 
+@app.api_route("/token/refresh", methods=["POST"])
+async def token_refresh(req: Request): return await forward_request(USER_SERVICE_URL, "token/refresh", req)
+
+@app.api_route("/logout", methods=["POST"])
+async def logout(req: Request): return await forward_request(USER_SERVICE_URL, "logout", req)
+
+@app.api_route("/logout/all", methods=["POST"])
+async def logout_all(req: Request): return await forward_request(USER_SERVICE_URL, "logout/all", req)
+
 @app.api_route("/users/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
 async def users(path: str, req: Request): return await forward_request(USER_SERVICE_URL, f"users/{path}", req)
 
@@ -70,7 +82,7 @@ async def users(path: str, req: Request): return await forward_request(USER_SERV
 @app.api_route("/foods", methods=["GET", "POST"])
 async def foods_root(req: Request): return await forward_request(RESTAURANT_SERVICE_URL, "foods", req)
 
-@app.api_route("/foods/{path:path}", methods=["GET", "DELETE", "PUT"])
+@app.api_route("/foods/{path:path}", methods=["GET", "POST", "DELETE", "PUT"])
 async def foods_path(path: str, req: Request): return await forward_request(RESTAURANT_SERVICE_URL, f"foods/{path}", req)
 
 # Chi nhánh (QUAN TRỌNG: Để lấy tên quán)
@@ -97,13 +109,30 @@ async def cart(req: Request): return await forward_request(CART_SERVICE_URL, "ca
 @app.api_route("/checkout", methods=["POST"])
 async def checkout(req: Request): return await forward_request(ORDER_SERVICE_URL, "checkout", req)
 
+@app.api_route("/checkout/{path:path}", methods=["POST"])
+async def checkout_path(path: str, req: Request): return await forward_request(ORDER_SERVICE_URL, f"checkout/{path}", req)
+
 @app.api_route("/orders", methods=["GET"])
 async def orders(req: Request): return await forward_request(ORDER_SERVICE_URL, "orders", req)
 
-@app.api_route("/orders/{path:path}", methods=["GET", "PUT"])
-async def orders_path(path: str, req: Request): return await forward_request(ORDER_SERVICE_URL, f"orders/{path}", req)
+# Chỉ mở các đường dành cho người dùng; /orders/ledger* (đối soát) và PUT /orders/{id}/paid
+# (Payment Service gọi) là nội bộ, không có xác thực
+@app.api_route("/orders/my-orders", methods=["GET"])
+async def my_orders(req: Request): return await forward_request(ORDER_SERVICE_URL, "orders/my-orders", req)
+
+@app.api_route("/orders/popular", methods=["GET"])
+async def popular_orders(req: Request): return await forward_request(ORDER_SERVICE_URL, "orders/popular", req)
+
+@app.api_route("/orders/{order_id:int}", methods=["GET"])
+async def order_detail(order_id: int, req: Request): return await forward_request(ORDER_SERVICE_URL, f"orders/{order_id}", req)
+
+@app.api_route("/orders/{order_id:int}/status", methods=["PUT"])
+async def order_status(order_id: int, req: Request): return await forward_request(ORDER_SERVICE_URL, f"orders/{order_id}/status", req)
 
 
 # --- PAYMENT SERVICE ---
 @app.api_route("/pay", methods=["POST"])
-async def pay(req: Request): return await forward_request(PAYMENT_SERVICE_URL, "pay", req)
\ No newline at end of file
+async def pay(req: Request): return await forward_request(PAYMENT_SERVICE_URL, "pay", req)
+
+# Lịch sử / export giao dịch (/payments, /payments/export) không mở qua gateway:
+# chưa có xác thực, chỉ đối soát / kế toán gọi thẳng Payment Service trong mạng nội bộ
\ No newline at end of file
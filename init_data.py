@@ -1,10 +1,11 @@
+import os
 import httpx
 import asyncio
 from jose import jwt
 from datetime import datetime, timedelta
 
 # --- CẤU HÌNH ---
-GATEWAY_URL = "http://localhost:8000" 
+GATEWAY_URL = os.getenv("GATEWAY_URL", "http://localhost:8000")
 SECRET_KEY = "thay_doi_chuoi_nay_thanh_mat_ma_bi_mat_nhe" # Phải khớp với User Service
 ALGORITHM = "HS256"
 
@@ -1,19 +1,54 @@
 import os
+import asyncio
 import httpx
 from fastapi import FastAPI, Depends, HTTPException, Request
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel
-from database import SessionLocal, engine, Base
+from datetime import datetime, timedelta
+from database import SessionLocal, engine, Base, read_router
+from common.db import db_metrics
+from common.migrations import run_migrations
+from common.responses import FastJSONResponse
+from common.workers import setup_worker
 import models
+from popularity import PopularDishes, WINDOWS
 
 # Tạo lại bảng nếu chưa có (Lưu ý: Nếu bảng cũ thiếu cột, nên xóa bảng cũ đi để code tự tạo lại)
 Base.metadata.create_all(bind=engine)
+run_migrations(engine, os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations"))
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
+# Chạy 1 worker (bộ đếm món bán chạy nằm trong RAM); warm-up + /metrics/worker: common/workers.py
+setup_worker(app, engines={"primary": engine, "replica": read_router.replica_engine})
 
 # URL các service khác
 RESTAURANT_SERVICE_URL = os.getenv("RESTAURANT_SERVICE_URL", "http://restaurant_service:8002")
+CART_SERVICE_URL = os.getenv("CART_SERVICE_URL", "http://cart_service:8005")
+PAYMENT_SERVICE_URL = os.getenv("PAYMENT_SERVICE_URL", "http://payment_service:8004")
+
+# Top món bán chạy (đếm xấp xỉ trong RAM + snapshot định kỳ ra file)
+POPULAR_CAPACITY = int(os.getenv("POPULAR_CAPACITY", 50))
+POPULAR_SNAPSHOT_PATH = os.getenv("POPULAR_SNAPSHOT_PATH", "popular_dishes.json")
+POPULAR_SNAPSHOT_SECONDS = float(os.getenv("POPULAR_SNAPSHOT_SECONDS", 60))
+popular_dishes = PopularDishes(capacity=POPULAR_CAPACITY)
+
+async def _snapshot_popular_loop():
+    while True:
+        await asyncio.sleep(POPULAR_SNAPSHOT_SECONDS)
+        try: await asyncio.to_thread(popular_dishes.snapshot, POPULAR_SNAPSHOT_PATH)
+        except Exception as e: print(f"Popular snapshot failed: {e}")
+
+@app.on_event("startup")
+async def load_popular_dishes():
+    try: popular_dishes.load(POPULAR_SNAPSHOT_PATH)
+    except Exception as e: print(f"Popular snapshot load failed: {e}")
+    if POPULAR_SNAPSHOT_SECONDS > 0: asyncio.create_task(_snapshot_popular_loop())
+
+@app.on_event("shutdown")
+def save_popular_dishes():
+    try: popular_dishes.snapshot(POPULAR_SNAPSHOT_PATH)
+    except Exception as e: print(f"Popular snapshot failed: {e}")
 
 def get_db():
     db = SessionLocal()
@@ -22,6 +57,19 @@ def get_db():
     finally:
         db.close()
 
+# Session cho endpoint chỉ đọc: replica, hoặc primary nếu vừa ghi (common/db.py)
+def get_read_db(request: Request):
+    db = read_router.session(read_router.request_keys(request))
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Mức dùng connection pool + định tuyến đọc (common/db.py)
+@app.get("/metrics/db")
+def get_db_metrics():
+    return db_metrics(engine, read_router)
+
 # --- INPUT MODELS ---
 class OrderItemCreate(BaseModel):
     food_id: int
@@ -39,52 +87,137 @@ class OrderCreate(BaseModel):
     delivery_address: str
     note: Optional[str] = None
 
-# ==========================================
-# API 1: TẠO ĐƠN HÀNG (/checkout)
-# ==========================================
-@app.post("/checkout")
-async def create_order(payload: OrderCreate, db: Session = Depends(get_db)):
+# --- COUPON RESERVATION (Restaurant Service) ---
+async def release_coupon(reservation_id: int):
+    try:
+        async with httpx.AsyncClient() as client:
+            await client.post(f"{RESTAURANT_SERVICE_URL}/coupons/reservations/{reservation_id}/release")
+    except Exception as e: print(f"Coupon release failed: {e}")
+
+async def confirm_coupon(order, db: Session):
+    # Chốt lượt coupon khi đơn đã thanh toán. Reservation đã bị trả về pool (409) thì giữ 1 lượt
+    # mới; coupon hết lượt thì bỏ giảm giá và tính lại giá đơn, không để vượt max_redemptions
+    try:
+        async with httpx.AsyncClient() as client:
+            res = await client.post(f"{RESTAURANT_SERVICE_URL}/coupons/reservations/{order.coupon_reservation_id}/confirm", params={"order_id": order.id})
+            if res.status_code == 200: return True
+            if res.status_code != 409: raise RuntimeError(f"confirm returned {res.status_code}: {res.text}")
+            res = await client.post(f"{RESTAURANT_SERVICE_URL}/coupons/reserve",
+                                    json={"code": order.coupon_code, "branch_id": order.branch_id, "user_id": order.user_id})
+            if res.status_code == 200:
+                reservation_id = res.json()["reservation_id"]
+                confirmed = await client.post(f"{RESTAURANT_SERVICE_URL}/coupons/reservations/{reservation_id}/confirm", params={"order_id": order.id})
+                if confirmed.status_code != 200: raise RuntimeError(f"confirm returned {confirmed.status_code}: {confirmed.text}")
+                order.coupon_reservation_id = reservation_id
+                db.commit()
+                return True
+            if res.status_code >= 500: raise RuntimeError(f"reserve returned {res.status_code}: {res.text}")
+    except Exception as e:
+        # Lỗi tạm thời: reservation vẫn được gia hạn tới khi hết COUPON_HOLD_MAX_SECONDS
+        print(f"Coupon confirm failed for order {order.id}: {e}")
+        return False
+    print(f"Coupon {order.coupon_code} no longer available for order {order.id}: discount {order.discount_amount} removed, order repriced")
+    order.total_price += order.discount_amount or 0
+    order.discount_amount = 0
+    order.coupon_reservation_id = None
+    db.commit()
+    mark_order_written(order)
+    return False
+
+# Đơn còn chờ thanh toán giữ lượt coupon: gia hạn reservation mỗi COUPON_HOLD_REFRESH_SECONDS
+# (phải nhỏ hơn COUPON_RESERVATION_TTL_SECONDS của Restaurant Service). Đơn bỏ dở quá
+# COUPON_HOLD_MAX_SECONDS thì thôi gia hạn, lượt tự trả về pool khi hết hạn.
+COUPON_HOLD_REFRESH_SECONDS = float(os.getenv("COUPON_HOLD_REFRESH_SECONDS", 300))
+COUPON_HOLD_MAX_SECONDS = float(os.getenv("COUPON_HOLD_MAX_SECONDS", 86400))
+
+def _held_reservation_ids():
+    db = SessionLocal()
+    try:
+        since = datetime.utcnow() - timedelta(seconds=COUPON_HOLD_MAX_SECONDS)
+        return [rid for (rid,) in db.query(models.Order.coupon_reservation_id).filter(
+            models.Order.status == "PENDING_PAYMENT", models.Order.coupon_reservation_id.isnot(None), models.Order.created_at > since).all()]
+    finally:
+        db.close()
+
+async def extend_coupon_holds():
+    ids = await asyncio.to_thread(_held_reservation_ids)
+    async with httpx.AsyncClient() as client:
+        for i in range(0, len(ids), 500):
+            res = await client.post(f"{RESTAURANT_SERVICE_URL}/coupons/reservations/extend", json={"reservation_ids": ids[i:i + 500]})
+            res.raise_for_status()
+    return len(ids)
+
+async def _extend_coupon_holds_loop():
+    while True:
+        await asyncio.sleep(COUPON_HOLD_REFRESH_SECONDS)
+        try: await extend_coupon_holds()
+        except Exception as e: print(f"Coupon hold refresh failed: {e}")
+
+@app.on_event("startup")
+async def start_coupon_hold_refresh():
+    if COUPON_HOLD_REFRESH_SECONDS > 0: asyncio.create_task(_extend_coupon_holds_loop())
+
+# --- TÍNH GIÁ: 1 lần gọi Restaurant Service cho cả giỏ ---
+async def price_items(client: httpx.AsyncClient, items: List[OrderItemCreate]):
+    ids = sorted({item.food_id for item in items})
+    try:
+        resp = await client.get(f"{RESTAURANT_SERVICE_URL}/foods/batch", params={"ids": ",".join(map(str, ids))})
+    except Exception:
+        raise HTTPException(status_code=503, detail="Lỗi kết nối Restaurant Service")
+    if resp.status_code != 200:
+        raise HTTPException(status_code=503, detail="Lỗi kết nối Restaurant Service")
+    foods = {f['id']: f for f in resp.json()}
+
     total_price = 0
     order_items_data = []
+    for item in items:
+        food_data = foods.get(item.food_id)
+        if not food_data:
+            raise HTTPException(status_code=400, detail=f"Món ăn ID {item.food_id} lỗi.")
+        # Giá = Giá gốc * (1 - %giảm/100)
+        final_item_price = food_data['price'] * (1 - food_data.get('discount', 0)/100)
+        total_price += final_item_price * item.quantity
+        order_items_data.append({
+            "food_id": item.food_id,
+            "food_name": food_data['name'],
+            "price": final_item_price,
+            "quantity": item.quantity
+        })
+    return total_price, order_items_data
+
+def mark_order_written(*orders):
+    # Danh sách đơn của user / quán này đọc từ primary thêm một lúc (xem common/db.py)
+    for o in orders:
+        read_router.mark_write(f"user_id={o.user_id}" if o.user_id else None, f"branch_id={o.branch_id}", f"/orders/{o.id}")
+
+async def place_order(payload: OrderCreate, db: Session):
+    if not payload.items:
+        raise HTTPException(status_code=400, detail="Đơn hàng trống")
 
     async with httpx.AsyncClient() as client:
-        # 1. Tính tiền (Gọi Restaurant Service lấy giá gốc)
-        for item in payload.items:
-            try:
-                resp = await client.get(f"{RESTAURANT_SERVICE_URL}/foods/{item.food_id}")
-                if resp.status_code != 200:
-                    raise HTTPException(status_code=400, detail=f"Món ăn ID {item.food_id} lỗi.")
-                
-                food_data = resp.json()
-                # Giá = Giá gốc * (1 - %giảm/100)
-                final_item_price = food_data['price'] * (1 - food_data.get('discount', 0)/100)
-                total_price += final_item_price * item.quantity
-
-                order_items_data.append({
-                    "food_id": item.food_id,
-                    "food_name": food_data['name'],
-                    "price": final_item_price,
-                    "quantity": item.quantity
-                })
-            except Exception:
-                raise HTTPException(status_code=503, detail="Lỗi kết nối Restaurant Service")
+        # 1. Tính tiền (giá gốc lấy từ Restaurant Service)
+        total_price, order_items_data = await price_items(client, payload.items)
 
-        # 2. Xử lý Coupon
+        # 2. Xử lý Coupon: giữ chỗ 1 lượt dùng (xác nhận khi thanh toán, tự trả lại khi hết hạn)
         discount_amount = 0
+        reservation_id = None
         if payload.coupon_code:
             try:
-                coupon_resp = await client.get(
-                    f"{RESTAURANT_SERVICE_URL}/coupons/verify", 
-                    params={"code": payload.coupon_code, "branch_id": payload.branch_id}
+                coupon_resp = await client.post(
+                    f"{RESTAURANT_SERVICE_URL}/coupons/reserve", 
+                    json={"code": payload.coupon_code, "branch_id": payload.branch_id, "user_id": payload.user_id}
                 )
-                if coupon_resp.status_code == 200:
-                    data = coupon_resp.json()
-                    discount_amount = (total_price * data['discount_percent']) / 100
-            except: pass
+            except Exception:
+                raise HTTPException(status_code=503, detail="Lỗi kết nối Restaurant Service")
+            if coupon_resp.status_code != 200:
+                raise HTTPException(status_code=400, detail=f"Coupon: {coupon_resp.json().get('detail', 'Invalid')}")
+            data = coupon_resp.json()
+            discount_amount = (total_price * data['discount_percent']) / 100
+            reservation_id = data['reservation_id']
 
         final_price = max(0, total_price - discount_amount)
 
-    # 3. Lưu Order vào DB
+    # 3. Lưu Order + Order Items trong 1 transaction
     new_order = models.Order(
         user_id=payload.user_id,          # Lưu ID người mua
         user_name=payload.customer_name,  # Lưu tên người nhận
@@ -95,32 +228,102 @@ async def create_order(payload: OrderCreate, db: Session = Depends(get_db)):
         total_price=final_price,
         coupon_code=payload.coupon_code,
         discount_amount=discount_amount,
+        coupon_reservation_id=reservation_id,
         status="PENDING_PAYMENT"
     )
     
-    db.add(new_order)
-    db.commit()
-    db.refresh(new_order)
-
-    # Lưu Order Items
-    for item in order_items_data:
-        new_item = models.OrderItem(
-            order_id=new_order.id,
-            food_id=item['food_id'],
-            food_name=item['food_name'],
-            price=item['price'],
-            quantity=item['quantity']
-        )
-        db.add(new_item)
-    
-    db.commit()
+    try:
+        db.add(new_order)
+        db.flush()
+        db.add_all([models.OrderItem(order_id=new_order.id, **item) for item in order_items_data])
+        db.commit()
+    except Exception:
+        db.rollback()
+        if reservation_id: await release_coupon(reservation_id)
+        raise HTTPException(status_code=500, detail="Lỗi lưu đơn hàng")
 
+    mark_order_written(new_order)
+    popular_dishes.record(payload.branch_id, order_items_data)
+    return new_order, order_items_data
+
+# ==========================================
+# API 1: TẠO ĐƠN HÀNG (/checkout)
+# ==========================================
+@app.post("/checkout")
+async def create_order(payload: OrderCreate, db: Session = Depends(get_db)):
+    new_order, _ = await place_order(payload, db)
     return {
         "order_id": new_order.id, 
-        "total_price": final_price, 
+        "total_price": new_order.total_price, 
         "status": "PENDING_PAYMENT"
     }
 
+# ==========================================
+# API 1b: ĐẶT HÀNG TỪ GIỎ (/checkout/cart)
+# Đọc giỏ ở Cart Service -> tạo đơn -> xoá giỏ (sau khi đơn đã commit) -> thanh toán
+# ==========================================
+class CartCheckout(BaseModel):
+    customer_name: str
+    customer_phone: str
+    delivery_address: str
+    note: Optional[str] = None
+    coupon_code: Optional[str] = None
+    pay: bool = True
+
+@app.post("/checkout/cart")
+async def checkout_cart(payload: CartCheckout, request: Request, db: Session = Depends(get_db)):
+    token = request.headers.get("Authorization")
+    if not token: raise HTTPException(status_code=401, detail="Missing Token")
+    headers = {"Authorization": token}
+
+    async with httpx.AsyncClient() as client:
+        try:
+            cart_res = await client.get(f"{CART_SERVICE_URL}/cart", headers=headers)
+        except Exception:
+            raise HTTPException(status_code=503, detail="Lỗi kết nối Cart Service")
+        if cart_res.status_code == 401: raise HTTPException(status_code=401, detail="Invalid Token")
+        if cart_res.status_code != 200: raise HTTPException(status_code=503, detail="Lỗi đọc giỏ hàng")
+        cart_items = cart_res.json()
+    if not cart_items: raise HTTPException(status_code=400, detail="Giỏ hàng trống")
+
+    order_payload = OrderCreate(
+        branch_id=cart_items[0]['branch_id'],
+        items=[OrderItemCreate(food_id=i['food_id'], quantity=i['quantity']) for i in cart_items],
+        coupon_code=payload.coupon_code,
+        user_id=cart_items[0]['user_id'],
+        customer_name=payload.customer_name,
+        customer_phone=payload.customer_phone,
+        delivery_address=payload.delivery_address,
+        note=payload.note,
+    )
+    new_order, order_items_data = await place_order(order_payload, db)
+
+    # Đơn đã commit -> mới xoá giỏ; lỗi ở đây không làm hỏng đơn
+    result = {
+        "order_id": new_order.id,
+        "branch_id": new_order.branch_id,
+        "total_price": new_order.total_price,
+        "discount_amount": new_order.discount_amount,
+        "items": order_items_data,
+        "status": new_order.status,
+        "cart_cleared": False,
+        "payment": None,
+    }
+    async with httpx.AsyncClient() as client:
+        try:
+            clear_res = await client.delete(f"{CART_SERVICE_URL}/cart", headers=headers)
+            result["cart_cleared"] = clear_res.status_code == 200
+        except Exception as e: print(f"Cart clear failed for order {new_order.id}: {e}")
+
+        if payload.pay:
+            try:
+                pay_res = await client.post(f"{PAYMENT_SERVICE_URL}/pay", json={"order_id": new_order.id, "amount": new_order.total_price})
+                result["payment"] = pay_res.json() if pay_res.status_code == 200 else {"status": "FAILED", "detail": pay_res.text}
+                if pay_res.status_code == 200 and pay_res.json().get("status") == "SUCCESS": result["status"] = "PAID"
+            except Exception as e:
+                result["payment"] = {"status": "FAILED", "detail": str(e)}
+    return result
+
 # ==========================================
 # CÁC API KHÁC (ĐẢM BẢO KHÔNG BỊ THIẾU)
 # ==========================================
@@ -128,25 +331,94 @@ async def create_order(payload: OrderCreate, db: Session = Depends(get_db)):
 # Lấy danh sách tất cả đơn (Dành cho Admin/Seller)
 # Sửa lại hàm get_orders trong order_service/main.py
 
-@app.get("/orders")
-def get_orders(branch_id: Optional[int] = None, db: Session = Depends(get_db)):
-    query = db.query(models.Order)
+# Field trả về của danh sách đơn: mọi cột của bảng orders (không kèm items)
+ORDER_COLUMNS = [c.name for c in models.Order.__table__.columns]
+
+class OrderOut(BaseModel):
+    id: int
+    user_id: Optional[int] = None
+    user_name: Optional[str] = None
+    branch_id: Optional[int] = None
+    total_price: Optional[float] = None
+    status: Optional[str] = None
+    created_at: Optional[datetime] = None
+    delivery_address: Optional[str] = None
+    customer_phone: Optional[str] = None
+    note: Optional[str] = None
+    coupon_code: Optional[str] = None
+    discount_amount: Optional[float] = None
+    coupon_reservation_id: Optional[int] = None
+
+def order_rows(query):
+    # Đọc cột thay vì object ORM, serialize thẳng bằng orjson (không qua jsonable_encoder)
+    return FastJSONResponse([row._asdict() for row in query])
+
+@app.get("/orders", response_model=List[OrderOut])
+def get_orders(branch_id: Optional[int] = None, db: Session = Depends(get_read_db)):
+    query = db.query(*[getattr(models.Order, c) for c in ORDER_COLUMNS])
     
     # Nếu có branch_id thì lọc, không thì lấy hết (cho Admin tổng)
     if branch_id:
         query = query.filter(models.Order.branch_id == branch_id)
     
     # Sắp xếp đơn mới nhất lên đầu
-    return query.order_by(models.Order.created_at.desc()).all()
+    return order_rows(query.order_by(models.Order.created_at.desc()))
 
 # Lấy lịch sử đơn hàng của 1 user (Dành cho Buyer xem "Đơn của tôi")
-@app.get("/orders/my-orders")
-def get_my_orders(user_id: int, db: Session = Depends(get_db)):
-    return db.query(models.Order).filter(models.Order.user_id == user_id).order_by(models.Order.created_at.desc()).all()
+@app.get("/orders/my-orders", response_model=List[OrderOut])
+def get_my_orders(user_id: int, db: Session = Depends(get_read_db)):
+    query = db.query(*[getattr(models.Order, c) for c in ORDER_COLUMNS]).filter(models.Order.user_id == user_id)
+    return order_rows(query.order_by(models.Order.created_at.desc()))
+
+# Món bán chạy của 1 chi nhánh (window=today | 7d), trả lời từ bộ đếm trong RAM
+@app.get("/orders/popular")
+def get_popular_dishes(branch_id: int, window: str = "today", limit: int = 10):
+    if window not in WINDOWS: raise HTTPException(status_code=400, detail="window must be 'today' or '7d'")
+    return popular_dishes.top(branch_id, window, max(1, min(limit, POPULAR_CAPACITY)))
+
+# Nội bộ (User Service gọi): trong các user_ids, ai đã từng đặt đơn ở chi nhánh này
+CUSTOMER_LOOKUP_LIMIT = int(os.getenv("CUSTOMER_LOOKUP_LIMIT", 1000))
+
+@app.get("/orders/customers")
+def get_branch_customers(branch_id: int, user_ids: str, db: Session = Depends(get_read_db)):
+    try: ids = {int(x) for x in user_ids.split(",") if x.strip()}
+    except ValueError: raise HTTPException(status_code=400, detail="user_ids must be comma-separated integers")
+    if len(ids) > CUSTOMER_LOOKUP_LIMIT: raise HTTPException(status_code=400, detail=f"Too many ids (max {CUSTOMER_LOOKUP_LIMIT})")
+    if not ids: return []
+    rows = db.query(models.Order.user_id).filter(models.Order.user_id.in_(ids), models.Order.branch_id == branch_id).distinct()
+    return [r.user_id for r in rows]
+
+# --- SỔ ĐƠN HÀNG CHO ĐỐI SOÁT (Payment Service gọi) ---
+# Trạng thái coi như đã thanh toán
+PAID_STATUSES = ("PAID", "SHIPPING", "COMPLETED")
+LEDGER_PAGE_LIMIT = int(os.getenv("LEDGER_PAGE_LIMIT", 5000))
+
+class PaidBatch(BaseModel):
+    order_ids: List[int]
+
+# Keyset theo id tăng dần: bên đối soát đọc lần lượt từng trang, không OFFSET
+@app.get("/orders/ledger")
+def get_order_ledger(after_id: int = 0, limit: int = 1000, db: Session = Depends(get_db)):
+    limit = max(1, min(limit, LEDGER_PAGE_LIMIT))
+    rows = db.query(models.Order.id, models.Order.status, models.Order.total_price).filter(
+        models.Order.id > after_id).order_by(models.Order.id).limit(limit).all()
+    return FastJSONResponse([{"id": r.id, "status": r.status, "total_price": r.total_price} for r in rows])
+
+# Sửa hàng loạt đơn đã có thanh toán nhưng vẫn PENDING_PAYMENT
+@app.post("/orders/ledger/paid")
+async def mark_orders_paid(payload: PaidBatch, db: Session = Depends(get_db)):
+    if len(payload.order_ids) > LEDGER_PAGE_LIMIT: raise HTTPException(status_code=400, detail=f"Too many ids (max {LEDGER_PAGE_LIMIT})")
+    orders = db.query(models.Order).filter(models.Order.id.in_(payload.order_ids), models.Order.status == "PENDING_PAYMENT").all()
+    for order in orders: order.status = "PAID"
+    db.commit()
+    mark_order_written(*orders)
+    for order in orders:
+        if order.coupon_reservation_id: await confirm_coupon(order, db)
+    return {"updated": [o.id for o in orders]}
 
 # Lấy chi tiết 1 đơn hàng
 @app.get("/orders/{order_id}")
-def get_order_detail(order_id: int, db: Session = Depends(get_db)):
+def get_order_detail(order_id: int, db: Session = Depends(get_read_db)):
     order = db.query(models.Order).filter(models.Order.id == order_id).first()
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
@@ -154,13 +426,18 @@ def get_order_detail(order_id: int, db: Session = Depends(get_db)):
 
 # Cập nhật trạng thái thanh toán (Payment Service gọi)
 @app.put("/orders/{order_id}/paid")
-def mark_order_paid(order_id: int, db: Session = Depends(get_db)):
+async def mark_order_paid(order_id: int, db: Session = Depends(get_db)):
     order = db.query(models.Order).filter(models.Order.id == order_id).first()
     if not order:
         raise HTTPException(status_code=404, detail="Order not found")
+    # Gọi lại (retry từ Payment) không chốt coupon lần 2
+    if order.status in PAID_STATUSES: return {"message": "Order already paid"}
     
     order.status = "PAID"
     db.commit()
+    mark_order_written(order)
+    # Thanh toán xong -> chốt lượt dùng coupon
+    if order.coupon_reservation_id: await confirm_coupon(order, db)
     return {"message": "Order paid"}
 
 # Cập nhật trạng thái giao hàng (Seller gọi: Shipping, Delivered...)
@@ -172,4 +449,5 @@ def update_status(order_id: int, status: str, db: Session = Depends(get_db)):
     
     order.status = status
     db.commit()
+    mark_order_written(order)
     return {"message": f"Updated to {status}"}
\ No newline at end of file
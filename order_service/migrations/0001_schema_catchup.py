@@ -0,0 +1,5 @@
+"""Cột thêm vào orders sau bản đầu (create_all không sửa bảng cũ)."""
+from sqlalchemy import Integer
+
+def upgrade(m):
+    m.add_column("orders", "coupon_reservation_id", Integer())
@@ -0,0 +1,10 @@
+"""Danh sách đơn của quán / của user luôn ORDER BY created_at DESC: index ghép
+(branch_id, created_at), (user_id, created_at) cho phép đọc thẳng theo thứ tự, không sort.
+Index đơn cũ trên branch_id / user_id là tiền tố của index mới nên bỏ."""
+
+def upgrade(m):
+    m.create_index("ix_orders_branch_created", "orders", ["branch_id", "created_at"])
+    m.create_index("ix_orders_user_created", "orders", ["user_id", "created_at"])
+    m.drop_index("ix_orders_branch_id", "orders")
+    m.drop_index("ix_orders_user_id", "orders")
+    m.create_index("ix_order_items_order_id", "order_items", ["order_id"])
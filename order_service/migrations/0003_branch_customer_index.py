@@ -0,0 +1,5 @@
+"""GET /orders/customers (User Service kiểm tra seller chỉ xem khách của chi nhánh mình):
+index (branch_id, user_id) trả lời DISTINCT user_id thẳng từ index, không quét đơn của cả chi nhánh."""
+
+def upgrade(m):
+    m.create_index("ix_orders_branch_user", "orders", ["branch_id", "user_id"])
@@ -1,19 +1,26 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from database import Base
 import datetime
 
 class Order(Base):
     __tablename__ = "orders"
+    # Đơn của quán / của user luôn lấy mới nhất trước -> index ghép (..., created_at), không phải sort
+    __table_args__ = (
+        Index("ix_orders_branch_created", "branch_id", "created_at"),
+        Index("ix_orders_user_created", "user_id", "created_at"),
+        # GET /orders/customers: user nào đã đặt ở chi nhánh này, đọc gọn trong index
+        Index("ix_orders_branch_user", "branch_id", "user_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     
     # Người mua
-    user_id = Column(Integer, index=True, nullable=True) # ID tài khoản (nếu có)
+    user_id = Column(Integer, nullable=True) # ID tài khoản (nếu có)
     user_name = Column(String(100)) # Tên người nhận hàng
     
     # Thông tin đơn
-    branch_id = Column(Integer, index=True)
+    branch_id = Column(Integer)
     total_price = Column(Float)
     status = Column(String(50), default="PENDING_PAYMENT")
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
@@ -26,6 +33,7 @@ class Order(Base):
     # Khuyến mãi
     coupon_code = Column(String(50), nullable=True)
     discount_amount = Column(Float, default=0.0)
+    coupon_reservation_id = Column(Integer, nullable=True) # Lượt coupon đang giữ chỗ bên Restaurant
 
     items = relationship("OrderItem", back_populates="order")
 
@@ -33,7 +41,7 @@ class OrderItem(Base):
     __tablename__ = "order_items"
 
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"))
+    order_id = Column(Integer, ForeignKey("orders.id"), index=True)
     
     food_id = Column(Integer)
     food_name = Column(String(200))
@@ -0,0 +1,101 @@
+import os
+import json
+import threading
+import datetime
+
+WINDOWS = {"today": 1, "7d": 7}
+
+class SpaceSaving:
+    """Đếm top-K xấp xỉ (thuật toán Space-Saving) với bộ nhớ cố định = capacity.
+
+    Mỗi món giữ [count, error]; count có thể bị đếm dư tối đa error đơn vị.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counters = {}
+
+    def add(self, key, n: int = 1):
+        entry = self.counters.get(key)
+        if entry is not None:
+            entry[0] += n
+        elif len(self.counters) < self.capacity:
+            self.counters[key] = [n, 0]
+        else:
+            # Thay món có count nhỏ nhất, kế thừa count của nó làm sai số
+            victim = min(self.counters, key=lambda k: self.counters[k][0])
+            min_count = self.counters.pop(victim)[0]
+            self.counters[key] = [min_count + n, min_count]
+
+    def merge_into(self, acc: dict):
+        for key, (count, error) in self.counters.items():
+            slot = acc.setdefault(key, [0, 0])
+            slot[0] += count
+            slot[1] += error
+
+class PopularDishes:
+    """Top món bán chạy theo chi nhánh, chia bucket theo ngày (UTC) để có cửa sổ trượt."""
+
+    def __init__(self, capacity: int = 50, days: int = 7):
+        self.capacity = capacity
+        self.days = days
+        self._buckets = {}  # branch_id -> {day_ordinal: SpaceSaving}
+        self._names = {}    # food_id -> food_name
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _today():
+        return datetime.datetime.utcnow().date().toordinal()
+
+    def record(self, branch_id: int, items, when: datetime.datetime = None):
+        day = (when or datetime.datetime.utcnow()).date().toordinal()
+        with self._lock:
+            days = self._buckets.setdefault(branch_id, {})
+            sketch = days.get(day)
+            if sketch is None:
+                sketch = days[day] = SpaceSaving(self.capacity)
+                # Bỏ các ngày đã trượt ra khỏi cửa sổ
+                for old in [d for d in days if d <= day - self.days]: del days[old]
+            for item in items:
+                sketch.add(item['food_id'], item['quantity'])
+                self._names[item['food_id']] = item.get('food_name')
+
+    def top(self, branch_id: int, window: str = "today", limit: int = 10):
+        # Chi phí chỉ phụ thuộc capacity * số ngày, không phụ thuộc số đơn
+        first_day = self._today() - WINDOWS[window] + 1
+        acc = {}
+        with self._lock:
+            for day, sketch in self._buckets.get(branch_id, {}).items():
+                if day >= first_day: sketch.merge_into(acc)
+            ranked = sorted(acc.items(), key=lambda kv: -kv[1][0])[:limit]
+            return [{"food_id": food_id, "food_name": self._names.get(food_id), "count": count, "max_overcount": error} for food_id, (count, error) in ranked]
+
+    # --- SNAPSHOT: ghi ra file để restart không phải quét lại order_items ---
+    def snapshot(self, path: str):
+        with self._lock:
+            data = {
+                "capacity": self.capacity,
+                "names": self._names,
+                "buckets": {str(b): {str(d): s.counters for d, s in days.items()} for b, days in self._buckets.items()},
+            }
+            payload = json.dumps(data)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(payload)
+        os.replace(tmp, path)
+
+    def load(self, path: str):
+        if not os.path.exists(path): return False
+        with open(path) as f:
+            data = json.load(f)
+        oldest = self._today() - self.days + 1
+        with self._lock:
+            self._names = {int(k): v for k, v in data.get("names", {}).items()}
+            self._buckets = {}
+            for b, days in data.get("buckets", {}).items():
+                for d, counters in days.items():
+                    if int(d) < oldest: continue
+                    sketch = SpaceSaving(self.capacity)
+                    sketch.counters = {int(k): list(v) for k, v in counters.items()}
+                    self._buckets.setdefault(int(b), {})[int(d)] = sketch
+        return True
@@ -1,18 +1,9 @@
-import os
-from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from common.db import create_database, create_read_router
 
-DB_USER = os.getenv("DB_ROOT_USER", "root")
-DB_PASS = os.getenv("DB_PASSWORD", "123456")
+# Kết nối + pool cấu hình qua env (xem common/db.py): PAYMENT_DB_HOST, PAYMENT_DATABASE_URL, PAYMENT_DB_POOL_SIZE...
+engine, SessionLocal = create_database("PAYMENT", "payment_db")
+# GET đọc từ replica nếu có PAYMENT_REPLICA_DATABASE_URL / PAYMENT_REPLICA_DB_HOST
+read_router = create_read_router("PAYMENT", "payment_db", SessionLocal)
 
-# Mặc định trỏ về 'db'
-DB_HOST = os.getenv("PAYMENT_DB_HOST", "db")
-DB_NAME = "payment_db"
-
-SQLALCHEMY_DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASS}@{DB_HOST}/{DB_NAME}"
-
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-Base = declarative_base()
\ No newline at end of file
+Base = declarative_base()
@@ -1,15 +1,50 @@
+import os
+import io
+import asyncio
+import csv
+import json
 import httpx
+from datetime import datetime
+from typing import List, Optional
 from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from database import SessionLocal, engine, Base
+from database import SessionLocal, engine, Base, read_router
+from common.db import db_metrics
+from common.migrations import run_migrations
+from common.responses import FastJSONResponse
+from common.workers import setup_worker
 import models
+from reconcile import Reconciler
+from providers import create_provider, verify_signature
+from processing import PaymentWorkers
 from pydantic import BaseModel
 import uuid
 
+PAYMENTS_PAGE_LIMIT = int(os.getenv("PAYMENTS_PAGE_LIMIT", 200))
+# Số dòng mỗi lần đọc từ server-side cursor khi export
+PAYMENTS_EXPORT_CHUNK_SIZE = int(os.getenv("PAYMENTS_EXPORT_CHUNK_SIZE", 1000))
+# sync: /pay thành công ngay trong request (như cũ)
+# async: /pay tạo payment PENDING, worker gửi sang provider, kết quả về qua webhook
+PAYMENT_MODE = os.getenv("PAYMENT_MODE", "sync")
+ORDER_SERVICE_URL = os.getenv("ORDER_SERVICE_URL", "http://order_service:8003")
+
 # Tạo bảng
 Base.metadata.create_all(bind=engine)
+run_migrations(engine, os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations"))
+
+app = FastAPI(default_response_class=FastJSONResponse)
+setup_worker(app, engines={"primary": engine, "replica": read_router.replica_engine})
+payment_workers = PaymentWorkers(SessionLocal, create_provider()) if PAYMENT_MODE == "async" else None
+
+@app.on_event("startup")
+async def start_payment_workers():
+    if payment_workers: await payment_workers.start()
 
-app = FastAPI()
+@app.on_event("shutdown")
+async def stop_payment_workers():
+    if payment_workers: await payment_workers.stop()
 
 def get_db():
     db = SessionLocal()
@@ -18,6 +53,19 @@ def get_db():
     finally:
         db.close()
 
+# Session cho endpoint chỉ đọc: replica, hoặc primary nếu vừa ghi (common/db.py)
+def get_read_db(request: Request):
+    db = read_router.session(read_router.request_keys(request))
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Mức dùng connection pool + định tuyến đọc (common/db.py)
+@app.get("/metrics/db")
+def get_db_metrics():
+    return db_metrics(engine, read_router)
+
 # --- INPUT MODEL ---
 class PaymentRequest(BaseModel):
     order_id: int
@@ -27,8 +75,43 @@ class PaymentRequest(BaseModel):
 # ==========================================
 # API THANH TOÁN (GIẢ LẬP)
 # ==========================================
+def _active_payment(db: Session, order_id: int):
+    return db.query(models.Payment).filter(
+        models.Payment.order_id == order_id, models.Payment.status.in_(("PENDING", "SUCCESS"))
+    ).order_by(models.Payment.id).first()
+
+async def create_pending_payment(payload: PaymentRequest, db: Session):
+    # Đơn đã có payment đang xử lý / thành công -> trả lại payment đó (client gửi lại /pay)
+    existing = _active_payment(db, payload.order_id)
+    if existing is None:
+        existing = models.Payment(
+            order_id=payload.order_id,
+            active_order_id=payload.order_id,
+            amount=payload.amount,
+            transaction_id=f"PAY_{uuid.uuid4().hex[:8].upper()}",
+            status="PENDING",
+        )
+        try:
+            db.add(existing)
+            db.commit()
+            db.refresh(existing)
+            read_router.mark_write(f"order_id={payload.order_id}")
+        except IntegrityError:
+            # Request khác cùng đơn vừa chèn trước (uq_payments_active_order) -> dùng payment đó
+            db.rollback()
+            existing = _active_payment(db, payload.order_id)
+            if existing is None: raise HTTPException(409, "Payment is being created, please retry")
+    if existing.status == "PENDING" and not existing.provider_ref: payment_workers.enqueue(existing.id)
+    return {
+        "message": "Đang xử lý thanh toán" if existing.status == "PENDING" else "Thanh toán thành công",
+        "transaction_id": existing.transaction_id,
+        "order_id": existing.order_id,
+        "status": existing.status,
+    }
+
 @app.post("/pay")
 async def process_payment(payload: PaymentRequest, db: Session = Depends(get_db)):
+    if payment_workers: return await create_pending_payment(payload, db)
     # 1. (Giả lập) Kiểm tra số dư hoặc gọi cổng thanh toán thật
     # Ở đây mặc định là thành công luôn
     
@@ -44,10 +127,11 @@ async def process_payment(payload: PaymentRequest, db: Session = Depends(get_db)
     )
     db.add(new_payment)
     db.commit()
+    read_router.mark_write(f"order_id={payload.order_id}")
     
     # 4. GỌI SANG ORDER SERVICE ĐỂ CONFIRM
     # (Đây là bước quan trọng nhất)
-    order_service_url = f"http://order_service:8003/orders/{payload.order_id}/paid"
+    order_service_url = f"{ORDER_SERVICE_URL}/orders/{payload.order_id}/paid"
     
     async with httpx.AsyncClient() as client:
         try:
@@ -68,6 +152,125 @@ async def process_payment(payload: PaymentRequest, db: Session = Depends(get_db)
         "status": "SUCCESS"
     }
 
-@app.get("/payments")
-def get_history(db: Session = Depends(get_db)):
-    return db.query(models.Payment).all()
\ No newline at end of file
+# ==========================================
+# WEBHOOK TỪ CỔNG THANH TOÁN (chế độ async)
+# ==========================================
+async def notify_order_paid(order_id: int):
+    # Lỗi ở đây không làm hỏng webhook: payment đã SUCCESS, đối soát (reconcile.py) sẽ sửa đơn
+    try:
+        async with httpx.AsyncClient(timeout=10) as client:
+            res = await client.put(f"{ORDER_SERVICE_URL}/orders/{order_id}/paid")
+            if res.status_code != 200: print(f"Order {order_id} paid callback failed: {res.text}")
+    except Exception as e:
+        print(f"Order {order_id} paid callback failed: {e}")
+
+@app.post("/payments/webhook")
+async def payment_webhook(request: Request, db: Session = Depends(get_db)):
+    body = await request.body()
+    if not verify_signature(body, request.headers.get("X-Signature")): raise HTTPException(401, "Invalid signature")
+    event = json.loads(body)
+    if event.get("status") not in ("SUCCESS", "FAILED"): raise HTTPException(400, "Invalid status")
+    payment = db.query(models.Payment).filter(models.Payment.transaction_id == event.get("transaction_id")).first()
+    if payment is None: raise HTTPException(404, "Payment not found")
+
+    # Chỉ chuyển PENDING -> kết quả 1 lần; provider gửi lại cùng sự kiện thì bỏ qua
+    changed = db.query(models.Payment).filter(models.Payment.id == payment.id, models.Payment.status == "PENDING").update({
+        models.Payment.status: event["status"],
+        # Thất bại -> nhả khoá, đơn được /pay lại
+        models.Payment.active_order_id: payment.active_order_id if event["status"] == "SUCCESS" else None,
+        models.Payment.provider_ref: payment.provider_ref or event.get("provider_ref"),
+        models.Payment.updated_at: datetime.utcnow(),
+    }, synchronize_session=False)
+    db.commit()
+    read_router.mark_write(f"order_id={payment.order_id}")
+    if not changed:
+        db.refresh(payment)
+        if payment.status != event["status"]: raise HTTPException(409, f"Payment already {payment.status}")
+        return {"message": "Duplicate event ignored", "status": payment.status}
+    if event["status"] == "SUCCESS": await notify_order_paid(payment.order_id)
+    return {"message": "Payment updated", "status": event["status"]}
+
+# ==========================================
+# LỊCH SỬ THANH TOÁN
+# ==========================================
+EXPORT_COLUMNS = ["id", "order_id", "amount", "transaction_id", "status", "created_at"]
+
+def filter_payments(query, order_id=None, status=None, created_from=None, created_to=None):
+    if order_id is not None: query = query.filter(models.Payment.order_id == order_id)
+    if status: query = query.filter(models.Payment.status == status)
+    if created_from: query = query.filter(models.Payment.created_at >= created_from)
+    if created_to: query = query.filter(models.Payment.created_at < created_to)
+    return query
+
+def payment_row(row):
+    return {
+        "id": row.id, "order_id": row.order_id, "amount": row.amount, "transaction_id": row.transaction_id,
+        "status": row.status, "created_at": row.created_at.isoformat() if row.created_at else None,
+    }
+
+class PaymentOut(BaseModel):
+    id: int
+    order_id: Optional[int] = None
+    amount: Optional[float] = None
+    transaction_id: Optional[str] = None
+    status: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class PaymentPage(BaseModel):
+    items: List[PaymentOut]
+    next_before_id: Optional[int] = None
+
+# Keyset pagination: mới nhất trước, trang sau truyền before_id = next_before_id của trang trước
+@app.get("/payments", response_model=PaymentPage)
+def get_history(limit: int = 50, before_id: Optional[int] = None, order_id: Optional[int] = None, status: Optional[str] = None,
+                created_from: Optional[datetime] = None, created_to: Optional[datetime] = None, db: Session = Depends(get_read_db)):
+    limit = max(1, min(limit, PAYMENTS_PAGE_LIMIT))
+    query = filter_payments(db.query(*[getattr(models.Payment, c) for c in EXPORT_COLUMNS]), order_id, status, created_from, created_to)
+    if before_id is not None: query = query.filter(models.Payment.id < before_id)
+    rows = query.order_by(models.Payment.id.desc()).limit(limit + 1).all()
+    items = [payment_row(r) for r in rows[:limit]]
+    return FastJSONResponse({"items": items, "next_before_id": items[-1]["id"] if len(rows) > limit else None})
+
+def _export_rows(fmt: str, filters: dict):
+    # Session riêng: generator chạy sau khi request handler (và get_db) đã trả về.
+    # stream_results + yield_per -> server-side cursor, bộ nhớ không phụ thuộc số dòng.
+    # Export lớn đọc từ replica (nếu có) để không giữ kết nối của primary.
+    db = read_router.session()
+    try:
+        query = filter_payments(db.query(*[getattr(models.Payment, c) for c in EXPORT_COLUMNS]), **filters)
+        query = query.order_by(models.Payment.id).execution_options(stream_results=True).yield_per(PAYMENTS_EXPORT_CHUNK_SIZE)
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        if fmt == "csv": writer.writerow(EXPORT_COLUMNS)
+        for i, row in enumerate(query, 1):
+            if fmt == "csv": writer.writerow([v.isoformat() if isinstance(v, datetime) else v for v in row])
+            else: buf.write(json.dumps(payment_row(row)) + "\n")
+            # Gửi theo từng chunk thay vì từng dòng
+            if i % PAYMENTS_EXPORT_CHUNK_SIZE == 0:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+    finally:
+        db.close()
+
+@app.get("/payments/export")
+def export_payments(format: str = "ndjson", order_id: Optional[int] = None, status: Optional[str] = None,
+                    created_from: Optional[datetime] = None, created_to: Optional[datetime] = None):
+    if format not in ("ndjson", "csv"): raise HTTPException(400, "format must be ndjson or csv")
+    filters = {"order_id": order_id, "status": status, "created_from": created_from, "created_to": created_to}
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(_export_rows(format, filters), media_type=media_type,
+                             headers={"Content-Disposition": f"attachment; filename=payments.{format}"})
+
+# ==========================================
+# ĐỐI SOÁT PAYMENT <-> ORDER (xem reconcile.py)
+# ==========================================
+reconcile_lock = asyncio.Lock()
+
+@app.post("/reconcile")
+async def run_reconcile(repair: bool = False):
+    # Mỗi lần chạy quét toàn bộ 2 bảng -> không cho chạy chồng
+    if reconcile_lock.locked(): raise HTTPException(409, "Reconciliation already running")
+    async with reconcile_lock:
+        return await asyncio.to_thread(Reconciler(SessionLocal, repair=repair).run)
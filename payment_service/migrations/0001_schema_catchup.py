@@ -0,0 +1,9 @@
+"""Cột / index thêm vào payments sau bản đầu (create_all không sửa bảng cũ)."""
+from sqlalchemy import DateTime, String
+
+def upgrade(m):
+    m.add_column("payments", "updated_at", DateTime())
+    m.add_column("payments", "provider_ref", String(100))
+    m.create_index("ix_payments_status", "payments", ["status"])
+    m.create_index("ix_payments_created_at", "payments", ["created_at"])
+    m.create_index("ix_payments_provider_ref", "payments", ["provider_ref"])
@@ -0,0 +1,12 @@
+"""Khoá chống tạo trùng payment cho 1 đơn (/pay chế độ async)."""
+from sqlalchemy import Integer
+
+def upgrade(m):
+    m.add_column("payments", "active_order_id", Integer())
+    # Dữ liệu cũ: mỗi đơn giữ khoá ở payment PENDING / SUCCESS đầu tiên (bảng dẫn xuất: MySQL
+    # không cho UPDATE bảng đang SELECT trong subquery)
+    m.execute(
+        "UPDATE payments SET active_order_id = order_id WHERE active_order_id IS NULL AND id IN ("
+        "SELECT id FROM (SELECT MIN(id) AS id FROM payments WHERE status IN ('PENDING', 'SUCCESS') GROUP BY order_id) AS first_active)"
+    )
+    m.create_index("uq_payments_active_order", "payments", ["active_order_id"], unique=True)
@@ -1,9 +1,11 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime
+from sqlalchemy import Column, Integer, String, Float, DateTime, Index
 from database import Base
 import datetime
 
 class Payment(Base):
     __tablename__ = "payments"
+    # 1 payment PENDING / SUCCESS cho mỗi đơn (chế độ async): 2 request /pay cùng lúc không tạo 2 giao dịch
+    __table_args__ = (Index("uq_payments_active_order", "active_order_id", unique=True),)
 
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(Integer, index=True)
@@ -12,5 +14,13 @@ class Payment(Base):
     # Mã giao dịch (Ví dụ: PAY_123456)
     transaction_id = Column(String(100), unique=True)
     
-    status = Column(String(50), default="SUCCESS")
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
\ No newline at end of file
+    # PENDING -> SUCCESS / FAILED (chế độ async), SUCCESS ngay (chế độ sync)
+    status = Column(String(50), default="SUCCESS", index=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, nullable=True)
+
+    # Mã giao dịch phía cổng thanh toán (chế độ async)
+    provider_ref = Column(String(100), nullable=True, index=True)
+
+    # = order_id khi PENDING / SUCCESS, NULL khi FAILED (cho phép thanh toán lại)
+    active_order_id = Column(Integer, nullable=True)
@@ -0,0 +1,165 @@
+"""Worker gửi payment PENDING sang provider (PAYMENT_MODE=async).
+
+/pay chỉ ghi 1 dòng PENDING rồi đưa id vào hàng đợi; PAYMENT_WORKERS task nền lấy ra,
+gọi provider.submit() và lưu provider_ref. Kết quả về sau qua webhook nên worker không
+phải chờ provider xử lý xong -> số worker không phụ thuộc độ trễ của provider.
+
+Payment PENDING chưa có provider_ref (hàng đợi đầy, process restart, submit lỗi hết số
+lần thử) được quét lại mỗi PAYMENT_REQUEUE_SECONDS và đưa vào hàng đợi lần nữa, khi đã tạo
+quá PAYMENT_SUBMIT_TIMEOUT_SECONDS (trẻ hơn thì có thể worker khác đang submit). Payment đã
+có provider_ref nhưng quá PAYMENT_WEBHOOK_TIMEOUT_SECONDS chưa có webhook (webhook thất bại,
+simulator bị dừng giữa chừng) cũng được submit lại để provider gửi lại kết quả. Vì vậy
+1 giao dịch có thể được submit hơn 1 lần: provider phải dùng transaction_id làm khoá idempotency.
+
+Chạy nhiều worker (common/serve.py): mỗi worker xử lý hàng đợi của payment nó nhận, nhưng chỉ
+worker giữ khoá file WORKER_STATS_DIR/payment_requeue.lock quét lại. Worker đó chết thì OS
+nhả khoá, worker khác nhận ở chu kỳ quét sau.
+"""
+import os
+import fcntl
+import asyncio
+import datetime
+from sqlalchemy import and_, or_
+import models
+
+PAYMENT_WORKERS = int(os.getenv("PAYMENT_WORKERS", 4))
+PAYMENT_QUEUE_LIMIT = int(os.getenv("PAYMENT_QUEUE_LIMIT", 1000))
+PAYMENT_SUBMIT_RETRIES = int(os.getenv("PAYMENT_SUBMIT_RETRIES", 3))
+PAYMENT_REQUEUE_SECONDS = float(os.getenv("PAYMENT_REQUEUE_SECONDS", 30))
+PAYMENT_WEBHOOK_TIMEOUT_SECONDS = float(os.getenv("PAYMENT_WEBHOOK_TIMEOUT_SECONDS", 300))
+# Lâu hơn 1 lượt submit đầy đủ (PAYMENT_SUBMIT_RETRIES lần + chờ giữa các lần)
+PAYMENT_SUBMIT_TIMEOUT_SECONDS = float(os.getenv("PAYMENT_SUBMIT_TIMEOUT_SECONDS", 60))
+
+def _ago(seconds):
+    return datetime.datetime.utcnow() - datetime.timedelta(seconds=seconds)
+
+def _stale_filter():
+    # Quét lại: chưa gửi được sang provider (đủ lâu để không worker nào còn đang submit),
+    # hoặc đã gửi mà chờ webhook quá lâu
+    Payment = models.Payment
+    return or_(
+        and_(Payment.provider_ref.is_(None), or_(Payment.updated_at.is_(None), Payment.updated_at < _ago(PAYMENT_SUBMIT_TIMEOUT_SECONDS))),
+        Payment.updated_at < _ago(PAYMENT_WEBHOOK_TIMEOUT_SECONDS),
+    )
+
+def _submittable_filter():
+    # Lấy từ hàng đợi: payment mới từ /pay (chưa có provider_ref) hoặc dòng quét lại ở trên
+    return or_(models.Payment.provider_ref.is_(None), models.Payment.updated_at < _ago(PAYMENT_WEBHOOK_TIMEOUT_SECONDS))
+
+class PaymentWorkers:
+    def __init__(self, session_factory, provider, workers: int = PAYMENT_WORKERS, queue_limit: int = PAYMENT_QUEUE_LIMIT):
+        self.session_factory = session_factory
+        self.provider = provider
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.queue = None  # tạo trong start(), gắn với event loop của app
+        self._queued = set()
+        self._tasks = []
+        self._requeue_lock = None
+        self.stats = {"submitted": 0, "submit_errors": 0, "requeued": 0, "dropped": 0}
+
+    def enqueue(self, payment_id: int):
+        # Đầy thì bỏ qua: payment vẫn PENDING trong DB, vòng quét lại sẽ nhặt lên
+        if payment_id in self._queued: return True
+        if self.queue is None: return False
+        try: self.queue.put_nowait(payment_id)
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            return False
+        self._queued.add(payment_id)
+        return True
+
+    def _load(self, payment_id):
+        db = self.session_factory()
+        try:
+            p = db.query(models.Payment).filter(
+                models.Payment.id == payment_id, models.Payment.status == "PENDING", _submittable_filter()
+            ).first()
+            if p is None: return None
+            return {"transaction_id": p.transaction_id, "order_id": p.order_id, "amount": p.amount}
+        finally:
+            db.close()
+
+    def _save_ref(self, payment_id, provider_ref):
+        db = self.session_factory()
+        try:
+            # Submit lại cùng giao dịch: provider trả về cùng provider_ref, chỉ làm mới updated_at
+            db.query(models.Payment).filter(
+                models.Payment.id == payment_id, models.Payment.status == "PENDING",
+                or_(models.Payment.provider_ref.is_(None), models.Payment.provider_ref == provider_ref),
+            ).update(
+                {models.Payment.provider_ref: provider_ref, models.Payment.updated_at: datetime.datetime.utcnow()}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    async def _process(self, payment_id):
+        payment = await asyncio.to_thread(self._load, payment_id)
+        if payment is None: return
+        for attempt in range(PAYMENT_SUBMIT_RETRIES):
+            try:
+                provider_ref = await self.provider.submit(**payment)
+                break
+            except Exception as e:
+                self.stats["submit_errors"] += 1
+                print(f"Provider submit failed for payment {payment_id}: {e}")
+                await asyncio.sleep(2 ** attempt)
+        else:
+            return
+        await asyncio.to_thread(self._save_ref, payment_id, provider_ref)
+        self.stats["submitted"] += 1
+
+    async def _worker(self):
+        while True:
+            payment_id = await self.queue.get()
+            try:
+                await self._process(payment_id)
+            except Exception as e:
+                print(f"Payment worker error ({payment_id}): {e}")
+            finally:
+                self._queued.discard(payment_id)
+                self.queue.task_done()
+
+    def _stale_ids(self):
+        db = self.session_factory()
+        try:
+            return [pid for (pid,) in db.query(models.Payment.id).filter(
+                models.Payment.status == "PENDING", _stale_filter()
+            ).order_by(models.Payment.id).limit(self.queue_limit).all()]
+        finally:
+            db.close()
+
+    def _owns_requeue(self):
+        stats_dir = os.getenv("WORKER_STATS_DIR")
+        if self._requeue_lock is not None or not stats_dir: return True
+        os.makedirs(stats_dir, exist_ok=True)
+        lock = open(os.path.join(stats_dir, "payment_requeue.lock"), "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return False
+        self._requeue_lock = lock
+        return True
+
+    async def requeue(self):
+        if not self._owns_requeue(): return
+        for payment_id in await asyncio.to_thread(self._stale_ids):
+            if payment_id not in self._queued and self.enqueue(payment_id): self.stats["requeued"] += 1
+
+    async def _requeue_loop(self):
+        while True:
+            await asyncio.sleep(PAYMENT_REQUEUE_SECONDS)
+            try: await self.requeue()
+            except Exception as e: print(f"Payment requeue failed: {e}")
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.queue_limit)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        await self.requeue()
+        if PAYMENT_REQUEUE_SECONDS > 0: self._tasks.append(asyncio.create_task(self._requeue_loop()))
+
+    async def stop(self):
+        for task in self._tasks: task.cancel()
+        await self.provider.close()
+        if self._requeue_lock is not None: self._requeue_lock.close()
@@ -0,0 +1,91 @@
+"""Cổng thanh toán cho chế độ PAYMENT_MODE=async.
+
+Provider chỉ cần nhận giao dịch (submit) và trả về mã phía provider; kết quả cuối cùng
+(SUCCESS / FAILED) được provider gửi về POST /payments/webhook, ký HMAC-SHA256 bằng
+PAYMENT_WEBHOOK_SECRET trong header X-Signature.
+
+PAYMENT_PROVIDER=simulator (mặc định): SimulatedProvider, giả lập cổng thật chạy tại chỗ
+với độ trễ PROVIDER_LATENCY_SECONDS (± PROVIDER_LATENCY_JITTER) và tỉ lệ từ chối
+PROVIDER_FAILURE_RATE. Cổng thật chỉ cần cài đặt lại submit().
+
+submit() phải idempotent theo transaction_id: cùng giao dịch có thể được gửi lại (quét lại
+payment PENDING, process restart) và provider trả về đúng provider_ref cũ.
+"""
+import os
+import abc
+import hmac
+import json
+import random
+import asyncio
+import hashlib
+import httpx
+
+PAYMENT_PROVIDER = os.getenv("PAYMENT_PROVIDER", "simulator")
+PAYMENT_WEBHOOK_SECRET = os.getenv("PAYMENT_WEBHOOK_SECRET", "doi_chuoi_nay_khi_chay_that")
+PAYMENT_WEBHOOK_URL = os.getenv("PAYMENT_WEBHOOK_URL", "http://payment_service:8004/payments/webhook")
+PROVIDER_LATENCY_SECONDS = float(os.getenv("PROVIDER_LATENCY_SECONDS", 2.0))
+PROVIDER_LATENCY_JITTER = float(os.getenv("PROVIDER_LATENCY_JITTER", 1.0))
+PROVIDER_FAILURE_RATE = float(os.getenv("PROVIDER_FAILURE_RATE", 0.05))
+
+def sign(body: bytes, secret: str = PAYMENT_WEBHOOK_SECRET):
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+def verify_signature(body: bytes, signature: str, secret: str = PAYMENT_WEBHOOK_SECRET):
+    return bool(signature) and hmac.compare_digest(sign(body, secret), signature)
+
+class PaymentProvider(abc.ABC):
+    name = "base"
+
+    @abc.abstractmethod
+    async def submit(self, transaction_id: str, order_id: int, amount: float):
+        """Gửi giao dịch sang provider, trả về provider_ref. Lỗi tạm thời -> raise để worker thử lại."""
+
+    async def close(self):
+        pass
+
+class SimulatedProvider(PaymentProvider):
+    name = "simulator"
+
+    def __init__(self, webhook_url: str = PAYMENT_WEBHOOK_URL, latency: float = PROVIDER_LATENCY_SECONDS,
+                 jitter: float = PROVIDER_LATENCY_JITTER, failure_rate: float = PROVIDER_FAILURE_RATE):
+        self.webhook_url = webhook_url
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._client = None
+        self._callbacks = {}  # transaction_id -> task gửi webhook
+
+    def _http(self):
+        if self._client is None: self._client = httpx.AsyncClient(timeout=10)
+        return self._client
+
+    async def submit(self, transaction_id: str, order_id: int, amount: float):
+        # Như cổng thật: transaction_id là khoá idempotency. provider_ref suy ra từ transaction_id
+        # (mọi worker trả về cùng mã), giao dịch đang chờ webhook thì không tạo thêm callback
+        provider_ref = f"SIM_{hashlib.sha256(transaction_id.encode()).hexdigest()[:12].upper()}"
+        if transaction_id in self._callbacks: return provider_ref
+        task = self._callbacks[transaction_id] = asyncio.create_task(self._callback(provider_ref, transaction_id, amount))
+        task.add_done_callback(lambda _: self._callbacks.pop(transaction_id, None))
+        return provider_ref
+
+    async def _callback(self, provider_ref: str, transaction_id: str, amount: float):
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        status = "FAILED" if random.random() < self.failure_rate else "SUCCESS"
+        body = json.dumps({"provider_ref": provider_ref, "transaction_id": transaction_id, "status": status, "amount": amount}).encode()
+        # Cổng thật cũng gửi lại webhook khi không nhận được 2xx
+        for attempt in range(3):
+            try:
+                res = await self._http().post(self.webhook_url, content=body, headers={"Content-Type": "application/json", "X-Signature": sign(body)})
+                if res.status_code < 500: return
+            except Exception as e:
+                print(f"Simulated webhook failed ({provider_ref}): {e}")
+            await asyncio.sleep(2 ** attempt)
+
+    async def close(self):
+        # Webhook chưa gửi bị huỷ: payment vẫn PENDING, processing.py submit lại sau PAYMENT_WEBHOOK_TIMEOUT_SECONDS
+        for task in list(self._callbacks.values()): task.cancel()
+        if self._client is not None: await self._client.aclose()
+
+def create_provider():
+    if PAYMENT_PROVIDER == "simulator": return SimulatedProvider()
+    raise ValueError(f"Unknown PAYMENT_PROVIDER: {PAYMENT_PROVIDER}")
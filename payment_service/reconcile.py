@@ -0,0 +1,132 @@
+"""Đối soát payment_db.payments với order_db.orders.
+
+Hai phía được đọc tăng dần theo order_id và ghép kiểu merge-join:
+- payments: server-side cursor (stream_results + yield_per), gom các dòng liên tiếp cùng order_id;
+- orders: Order Service GET /orders/ledger, keyset theo id, từng trang RECONCILE_CHUNK_SIZE.
+Bộ nhớ chỉ giữ 1 trang đơn hàng + 1 chunk thanh toán, không phụ thuộc số dòng.
+
+Các loại lệch:
+- paid_without_payment: đơn PAID/SHIPPING/COMPLETED nhưng không có payment SUCCESS
+- payment_without_paid: có payment SUCCESS nhưng đơn vẫn PENDING_PAYMENT (sửa được với --repair)
+- payment_on_cancelled: có payment SUCCESS nhưng đơn đã huỷ (cần hoàn tiền thủ công)
+- duplicate_payment: nhiều payment SUCCESS cho 1 đơn
+- amount_mismatch: số tiền payment khác total_price
+- orphan_payment: payment cho đơn không tồn tại
+
+Chạy tay: python reconcile.py [--repair]   (in từng dòng lệch dạng NDJSON, tổng kết ở stderr)
+"""
+import os
+import sys
+import json
+import httpx
+import models
+
+ORDER_SERVICE_URL = os.getenv("ORDER_SERVICE_URL", "http://order_service:8003")
+RECONCILE_CHUNK_SIZE = int(os.getenv("RECONCILE_CHUNK_SIZE", 1000))
+RECONCILE_REPAIR_BATCH_SIZE = int(os.getenv("RECONCILE_REPAIR_BATCH_SIZE", 200))
+# Số dòng lệch mẫu giữ lại trong báo cáo cho mỗi loại
+RECONCILE_SAMPLE_LIMIT = int(os.getenv("RECONCILE_SAMPLE_LIMIT", 20))
+AMOUNT_TOLERANCE = 0.01
+
+PAID_STATUSES = ("PAID", "SHIPPING", "COMPLETED")
+KINDS = ("paid_without_payment", "payment_without_paid", "payment_on_cancelled", "duplicate_payment", "amount_mismatch", "orphan_payment")
+
+def iter_payment_groups(session_factory, chunk_size: int = RECONCILE_CHUNK_SIZE):
+    """(order_id, [payment, ...]) tăng dần theo order_id."""
+    db = session_factory()
+    try:
+        query = db.query(models.Payment.order_id, models.Payment.id, models.Payment.amount, models.Payment.status, models.Payment.transaction_id)
+        query = query.filter(models.Payment.order_id.isnot(None)).order_by(models.Payment.order_id, models.Payment.id).execution_options(stream_results=True).yield_per(chunk_size)
+        current, group = None, []
+        for row in query:
+            if row.order_id != current and group:
+                yield current, group
+                group = []
+            current = row.order_id
+            group.append({"id": row.id, "amount": row.amount, "status": row.status, "transaction_id": row.transaction_id})
+        if group: yield current, group
+    finally:
+        db.close()
+
+def iter_orders(client: httpx.Client, chunk_size: int = RECONCILE_CHUNK_SIZE):
+    after_id = 0
+    while True:
+        res = client.get(f"{ORDER_SERVICE_URL}/orders/ledger", params={"after_id": after_id, "limit": chunk_size})
+        res.raise_for_status()
+        page = res.json()
+        yield from page
+        if len(page) < chunk_size: return
+        after_id = page[-1]["id"]
+
+def check_order(order_id, order, payments):
+    """Danh sách (loại lệch, chi tiết) cho 1 đơn và các payment của nó."""
+    success = [p for p in payments if p["status"] == "SUCCESS"]
+    found = []
+    if order is None:
+        if success: found.append(("orphan_payment", {"order_id": order_id, "payments": success}))
+        return found
+    detail = {"order_id": order["id"], "order_status": order["status"], "total_price": order["total_price"], "payments": success}
+    if order["status"] in PAID_STATUSES and not success: found.append(("paid_without_payment", detail))
+    if success and order["status"] == "PENDING_PAYMENT": found.append(("payment_without_paid", detail))
+    if success and order["status"] == "CANCELLED": found.append(("payment_on_cancelled", detail))
+    if len(success) > 1: found.append(("duplicate_payment", detail))
+    elif success and abs(success[0]["amount"] - (order["total_price"] or 0)) > AMOUNT_TOLERANCE:
+        found.append(("amount_mismatch", detail))
+    return found
+
+def merge_join(orders, payment_groups):
+    """(order_id, order | None, [payment, ...]) cho mọi order_id xuất hiện ở ít nhất 1 phía."""
+    order = next(orders, None)
+    group = next(payment_groups, None)
+    while order is not None or group is not None:
+        if group is None or (order is not None and order["id"] < group[0]):
+            yield order["id"], order, []
+            order = next(orders, None)
+        elif order is None or group[0] < order["id"]:
+            yield group[0], None, group[1]
+            group = next(payment_groups, None)
+        else:
+            yield order["id"], order, group[1]
+            order = next(orders, None)
+            group = next(payment_groups, None)
+
+class Reconciler:
+    def __init__(self, session_factory, repair: bool = False):
+        self.session_factory = session_factory
+        self.repair = repair
+        self.report = {
+            "orders_scanned": 0, "payment_orders_scanned": 0, "repaired": 0,
+            "mismatches": {k: 0 for k in KINDS}, "samples": {k: [] for k in KINDS},
+        }
+        self._to_repair = []
+
+    def _flush_repairs(self, client):
+        if not self._to_repair: return
+        res = client.post(f"{ORDER_SERVICE_URL}/orders/ledger/paid", json={"order_ids": self._to_repair})
+        res.raise_for_status()
+        self.report["repaired"] += len(res.json().get("updated", []))
+        self._to_repair = []
+
+    def run(self, on_mismatch=None):
+        with httpx.Client(timeout=30) as client:
+            for order_id, order, payments in merge_join(iter_orders(client), iter_payment_groups(self.session_factory)):
+                if order is not None: self.report["orders_scanned"] += 1
+                if payments: self.report["payment_orders_scanned"] += 1
+                for kind, detail in check_order(order_id, order, payments):
+                    self.report["mismatches"][kind] += 1
+                    if len(self.report["samples"][kind]) < RECONCILE_SAMPLE_LIMIT: self.report["samples"][kind].append(detail)
+                    if on_mismatch: on_mismatch(kind, detail)
+                    if self.repair and kind == "payment_without_paid":
+                        self._to_repair.append(order_id)
+                        if len(self._to_repair) >= RECONCILE_REPAIR_BATCH_SIZE: self._flush_repairs(client)
+            if self.repair: self._flush_repairs(client)
+        return self.report
+
+if __name__ == "__main__":
+    from database import SessionLocal
+    repair = "--repair" in sys.argv[1:]
+    report = Reconciler(SessionLocal, repair=repair).run(
+        on_mismatch=lambda kind, detail: print(json.dumps({"kind": kind, **detail}), flush=True))
+    report.pop("samples")
+    print(json.dumps(report), file=sys.stderr)
+    sys.exit(1 if any(report["mismatches"].values()) else 0)
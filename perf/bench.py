@@ -0,0 +1,351 @@
+"""Micro-benchmark từng handler nóng, chạy trong process qua httpx.ASGITransport.
+
+    python perf/bench.py                        # chạy tất cả, so với lần chạy trước
+    python perf/bench.py --only search_foods,login --iterations 500
+    python perf/bench.py --baseline perf/baselines/main.json --fail-on-regression   # dùng trong CI
+
+Mỗi lần chạy sinh DB SQLite mới bằng perf/seed.py (cùng tham số -> cùng dữ liệu), nạp từng
+service (startup / shutdown như khi chạy thật), mọi lời gọi sang service khác đi vào 1
+upstream giả trả lời ngay (httpx.MockTransport) -> chỉ đo chi phí của chính handler.
+
+Ngoài thời gian, mỗi benchmark đếm số câu SQL và số lời gọi upstream trên 1 request: hai số
+này không nhiễu, nên 1 PR thêm 1 query hay 1 round trip hiện ra ngay cả khi thời gian
+chưa đổi rõ. Thời gian được so bằng kiểm định Mann-Whitney U trên toàn bộ mẫu: chỉ báo
+chậm / nhanh hơn khi p < --alpha VÀ median lệch quá --min-change. Thời gian chỉ so được giữa
+2 lần chạy liền nhau trên cùng 1 máy đang rảnh (máy ảo dùng chung có thể lệch vài chục %
+giữa các lần chạy): để kiểm 1 PR, chạy trên nhánh chính rồi chạy ngay trên nhánh PR.
+
+Kết quả ghi vào --output (mặc định perf/.bench/last.json, lần trước chuyển thành previous.json).
+"""
+import os
+import gc
+import sys
+import json
+import math
+import time
+import shutil
+import asyncio
+import argparse
+import platform
+import tempfile
+import datetime
+import subprocess
+import statistics
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from services import ROOT, import_service, sqlite_url
+
+BENCH_DIR = os.path.join(ROOT, "perf", ".bench")
+SEED_ARGS = {"branches": 20, "foods_per_branch": 20, "buyers": 200, "orders_per_buyer": 5}
+STUB_HOSTS = {"USER_SERVICE_URL": "http://user.stub", "RESTAURANT_SERVICE_URL": "http://restaurant.stub",
+              "ORDER_SERVICE_URL": "http://order.stub", "PAYMENT_SERVICE_URL": "http://payment.stub",
+              "CART_SERVICE_URL": "http://cart.stub"}
+BENCH_SECRET = "bench-secret"
+
+# ==========================================
+# UPSTREAM GIẢ
+# ==========================================
+class Upstream:
+    """Trả lời thay cho các service khác; đếm số lời gọi để phát hiện round trip mới."""
+
+    def __init__(self, manifest):
+        self.manifest = manifest
+        self.calls = 0
+        branches = [{"id": b, "name": f"Quán Perf {b}", "address": "", "phone": ""} for b in range(1, manifest["branches"] + 1)]
+        self.branches = json.dumps(branches).encode()
+
+    def handler(self, request):
+        import httpx
+        self.calls += 1
+        path = request.url.path
+        if path == "/foods/batch":
+            ids = [int(i) for i in request.url.params["ids"].split(",") if i]
+            return httpx.Response(200, json=[{"id": i, "name": f"Món {i}", "price": 50000.0, "discount": 10} for i in ids])
+        if path == "/coupons/reserve":
+            return httpx.Response(200, json={"reservation_id": self.calls, "code": self.manifest["coupon_code"], "discount_percent": 10})
+        if path == "/revocations":
+            return httpx.Response(200, json={"entries": []})
+        if path == "/branches":
+            return httpx.Response(200, content=self.branches, headers={"Content-Type": "application/json"})
+        return httpx.Response(200, json={})
+
+@contextmanager
+def stubbed_upstreams(upstream):
+    # Service tạo httpx.AsyncClient() ở nhiều chỗ: thay class để mọi client mới dùng transport giả,
+    # client nào tự truyền transport (client benchmark) giữ nguyên
+    import httpx
+    transport = httpx.MockTransport(upstream.handler)
+    original = httpx.AsyncClient
+
+    class StubbedAsyncClient(original):
+        def __init__(self, *args, **kwargs):
+            kwargs.setdefault("transport", transport)
+            super().__init__(*args, **kwargs)
+
+    httpx.AsyncClient = StubbedAsyncClient
+    try:
+        yield
+    finally:
+        httpx.AsyncClient = original
+
+class QueryCounter:
+    def __init__(self, engine):
+        from sqlalchemy import event
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self._on_execute)
+
+    def _on_execute(self, *args):
+        self.count += 1
+
+@contextmanager
+def lifespan(app):
+    """Chạy startup / shutdown của app (ASGITransport không tự gửi sự kiện lifespan)."""
+    loop = asyncio.get_event_loop()
+    queue, sent = asyncio.Queue(), asyncio.Queue()
+    task = loop.create_task(app({"type": "lifespan", "asgi": {"version": "3.0"}, "state": {}}, queue.get, sent.put))
+    loop.run_until_complete(queue.put({"type": "lifespan.startup"}))
+    message = loop.run_until_complete(sent.get())
+    if message["type"] != "lifespan.startup.complete": raise RuntimeError(message.get("message", "startup failed"))
+    try:
+        yield
+    finally:
+        loop.run_until_complete(queue.put({"type": "lifespan.shutdown"}))
+        loop.run_until_complete(sent.get())
+        loop.run_until_complete(task)
+
+def bench_token(user_id, role="buyer", branch_id=None):
+    from jose import jwt
+    claims = {"sub": f"buyer{user_id}@perf.local", "id": user_id, "role": role, "branch_id": branch_id, "ver": 0,
+              "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=1)}
+    return {"Authorization": f"Bearer {jwt.encode(claims, BENCH_SECRET, algorithm='HS256')}"}
+
+# ==========================================
+# CÁC BENCHMARK: (service, hàm sinh request thứ i)
+# ==========================================
+def _dish(manifest, i):
+    return manifest["dishes"][i % len(manifest["dishes"])]
+
+def search_foods(manifest, i):
+    return "GET", "/foods/search", {"params": {"q": _dish(manifest, i).split()[0]}}
+
+def get_food_options(manifest, i):
+    return "GET", "/foods/options", {"params": {"name": _dish(manifest, i)}}
+
+def add_to_cart(manifest, i):
+    user_id = i % manifest["buyers"] + 1
+    foods = manifest["foods"]["1"]
+    return "POST", "/cart", {"json": {"food_id": foods[i % len(foods)], "quantity": 1, "branch_id": 1}, "headers": bench_token(user_id)}
+
+def create_order(manifest, i):
+    foods = manifest["foods"]["1"]
+    body = {"branch_id": 1, "items": [{"food_id": foods[(i + k) % len(foods)], "quantity": 1 + k} for k in range(3)],
+            "coupon_code": manifest["coupon_code"] if i % 2 else None, "user_id": i % manifest["buyers"] + 1,
+            "customer_name": "Bench", "customer_phone": "0900000000", "delivery_address": "Bench"}
+    return "POST", "/checkout", {"json": body}
+
+def login(manifest, i):
+    email = manifest["buyer_email"].format(i % manifest["buyers"] + 1)
+    return "POST", "/login", {"json": {"email": email, "password": manifest["password"]}}
+
+def forward_request(manifest, i):
+    return "GET", "/branches", {}
+
+# Danh sách lớn: chi phí serialize theo số dòng
+def list_foods(manifest, i):
+    return "GET", "/foods", {}
+
+def list_branches(manifest, i):
+    return "GET", "/branches", {}
+
+def branch_orders(manifest, i):
+    return "GET", "/orders", {"params": {"branch_id": i % manifest["branches"] + 1}}
+
+BENCHMARKS = {
+    "search_foods": ("restaurant_service", search_foods),
+    "get_food_options": ("restaurant_service", get_food_options),
+    "add_to_cart": ("cart_service", add_to_cart),
+    "create_order": ("order_service", create_order),
+    "login": ("user_service", login),
+    "forward_request": ("gateway_service", forward_request),
+    "list_foods": ("restaurant_service", list_foods),
+    "list_branches": ("restaurant_service", list_branches),
+    "branch_orders": ("order_service", branch_orders),
+}
+
+# ==========================================
+# CHẠY
+# ==========================================
+def run_service(service, names, manifest, iterations, warmup):
+    import httpx
+    import common.auth
+    common.auth._verifier = None  # mỗi service 1 verifier mới (client cũ đã đóng ở shutdown trước)
+    upstream = Upstream(manifest)
+    path = os.path.join(ROOT, service)
+    results = {}
+    with stubbed_upstreams(upstream):
+        main = import_service(service, modules=("main",))["main"]
+        # Process con của user_service (băm mật khẩu, spawn) cần import được module của service
+        sys.path.insert(0, path)
+        database = sys.modules.get("database")
+        counter = QueryCounter(database.engine) if database is not None and hasattr(database, "engine") else None
+        loop = asyncio.get_event_loop()
+        try:
+            with lifespan(main.app):
+                client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench")
+                for name in names:
+                    make_request = BENCHMARKS[name][1]
+
+                    async def call(i):
+                        method, url, kwargs = make_request(manifest, i)
+                        res = await client.request(method, url, **kwargs)
+                        if res.status_code >= 400: raise RuntimeError(f"{name}: {method} {url} -> {res.status_code} {res.text[:200]}")
+
+                    async def measure():
+                        for i in range(warmup): await call(i)
+                        gc.collect()
+                        queries, calls = counter.count if counter else 0, upstream.calls
+                        samples = []
+                        for i in range(warmup, warmup + iterations):
+                            start = time.perf_counter()
+                            await call(i)
+                            samples.append((time.perf_counter() - start) * 1000)
+                        return samples, ((counter.count if counter else 0) - queries) / iterations, (upstream.calls - calls) / iterations
+
+                    samples, queries_per_op, calls_per_op = loop.run_until_complete(measure())
+                    results[name] = summarize(samples, queries_per_op, calls_per_op)
+                    print(f"{name:<18} median {results[name]['median_ms']:8.3f} ms   {queries_per_op:5.2f} SQL/op   {calls_per_op:4.2f} upstream/op", flush=True)
+                loop.run_until_complete(client.aclose())
+        finally:
+            sys.path.remove(path)
+    return results
+
+def summarize(samples, queries_per_op, calls_per_op):
+    ordered = sorted(samples)
+    return {
+        "iterations": len(samples),
+        "median_ms": round(statistics.median(samples), 4),
+        "mean_ms": round(statistics.fmean(samples), 4),
+        "stdev_ms": round(statistics.stdev(samples), 4) if len(samples) > 1 else 0.0,
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+        "ops_per_sec": round(1000 / statistics.fmean(samples), 1),
+        "queries_per_op": round(queries_per_op, 3),
+        "upstream_calls_per_op": round(calls_per_op, 3),
+        "samples_ms": [round(s, 4) for s in samples],
+    }
+
+def run(names, iterations, warmup):
+    from seed import seed
+    # Cấu hình phải có trước khi import service (các module đọc env lúc import)
+    data_dir = tempfile.mkdtemp(prefix="food_delivery_bench_")
+    env = {**STUB_HOSTS, "DATABASE_URL": sqlite_url(data_dir), "ALGORITHM": "HS256", "SECRET_KEY": BENCH_SECRET,
+           "JWT_KEYS_DIR": os.path.join(data_dir, "keys"), "HASH_WORKERS": "1", "REVOCATION_SYNC_SECONDS": "3600"}
+    for key, value in env.items(): os.environ[key] = value
+    for prefix in ("USER", "RESTAURANT", "ORDER", "PAYMENT", "CART"): os.environ.pop(f"{prefix}_DATABASE_URL", None)
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    try:
+        manifest = seed(data_dir, **SEED_ARGS)
+        by_service = {}
+        for name in names: by_service.setdefault(BENCHMARKS[name][0], []).append(name)
+        results = {}
+        for service, service_names in by_service.items():
+            results.update(run_service(service, service_names, manifest, iterations, warmup))
+        return {"meta": run_meta(iterations, warmup), "benchmarks": results}
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+def run_meta(iterations, warmup):
+    try: commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError: commit = None
+    return {"created_at": datetime.datetime.utcnow().isoformat(timespec="seconds"), "commit": commit, "python": platform.python_version(),
+            "machine": platform.machine(), "cpus": os.cpu_count(), "iterations": iterations, "warmup": warmup,
+            "seed": SEED_ARGS, "bcrypt_rounds": int(os.environ["BCRYPT_ROUNDS"])}
+
+# ==========================================
+# SO SÁNH
+# ==========================================
+def mann_whitney_p(a, b):
+    """p-value 2 phía của kiểm định Mann-Whitney U (xấp xỉ chuẩn, hiệu chỉnh giá trị trùng)."""
+    n1, n2 = len(a), len(b)
+    if not n1 or not n2: return 1.0
+    ranked = sorted([(v, 0) for v in a] + [(v, 1) for v in b])
+    rank_sum, tie_term, i = 0.0, 0, 0
+    while i < len(ranked):
+        j = i
+        while j + 1 < len(ranked) and ranked[j + 1][0] == ranked[i][0]: j += 1
+        rank = (i + j) / 2 + 1
+        rank_sum += rank * sum(1 for k in range(i, j + 1) if ranked[k][1] == 0)
+        tie_term += (j - i + 1) ** 3 - (j - i + 1)
+        i = j + 1
+    u = rank_sum - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1))))
+    if sigma == 0: return 1.0
+    z = max(0.0, abs(u - n1 * n2 / 2) - 0.5) / sigma
+    return math.erfc(z / math.sqrt(2))
+
+def compare(old, new, alpha=0.01, min_change=0.05):
+    """[(tên, verdict, chi tiết)] cho các benchmark có ở cả 2 lần chạy."""
+    rows = []
+    for name, cur in new["benchmarks"].items():
+        prev = old.get("benchmarks", {}).get(name)
+        if prev is None: continue
+        ratio = cur["median_ms"] / prev["median_ms"] if prev["median_ms"] else 1.0
+        p = mann_whitney_p(prev["samples_ms"], cur["samples_ms"])
+        verdict = "same"
+        if p < alpha and ratio > 1 + min_change: verdict = "slower"
+        elif p < alpha and ratio < 1 - min_change: verdict = "faster"
+        # Thêm câu SQL / round trip là hồi quy dù thời gian chưa đổi đáng kể
+        extra = []
+        for key, label in (("queries_per_op", "SQL"), ("upstream_calls_per_op", "upstream")):
+            diff = cur[key] - prev[key]
+            if abs(diff) >= 0.01: extra.append(f"{diff:+.2f} {label}/op")
+            if diff >= 0.01: verdict = "regression" if verdict != "slower" else "slower"
+        rows.append((name, verdict, {"old_median_ms": prev["median_ms"], "new_median_ms": cur["median_ms"],
+                                     "change": round(ratio - 1, 4), "p_value": round(p, 5), "counters": extra}))
+    return rows
+
+def print_comparison(rows, old_meta, new_meta):
+    print(f"\nSo với {old_meta.get('created_at')} (commit {old_meta.get('commit')}):")
+    if (old_meta.get("machine"), old_meta.get("cpus"), old_meta.get("python")) != (new_meta.get("machine"), new_meta.get("cpus"), new_meta.get("python")):
+        print("Cảnh báo: 2 lần chạy khác máy / phiên bản Python, so thời gian không có ý nghĩa")
+    for name, verdict, d in rows:
+        counters = ("  " + ", ".join(d["counters"])) if d["counters"] else ""
+        print(f"{name:<18} {d['old_median_ms']:9.3f} -> {d['new_median_ms']:9.3f} ms  {d['change'] * 100:+6.1f}%  p={d['p_value']:.4f}  {verdict.upper()}{counters}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark các handler nóng")
+    parser.add_argument("--only", help="danh sách benchmark, cách nhau bởi dấu phẩy: " + ",".join(BENCHMARKS))
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "last.json"))
+    parser.add_argument("--baseline", help="file kết quả để so (mặc định: --output của lần chạy trước)")
+    parser.add_argument("--alpha", type=float, default=0.01)
+    parser.add_argument("--min-change", type=float, default=0.05, help="lệch median tối thiểu để báo chậm / nhanh hơn (0.05 = 5%%)")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown: parser.error(f"unknown benchmark: {', '.join(unknown)}")
+    baseline_path = args.baseline or args.output
+    baseline = None
+    if os.path.exists(baseline_path):
+        with open(baseline_path, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    result = run(names, args.iterations, args.warmup)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    if not args.baseline and os.path.exists(args.output):
+        shutil.copyfile(args.output, os.path.join(os.path.dirname(os.path.abspath(args.output)), "previous.json"))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=1)
+    if baseline is None:
+        print(f"\nNo baseline yet, saved {args.output}")
+        sys.exit(0)
+    rows = compare(baseline, result, args.alpha, args.min_change)
+    print_comparison(rows, baseline.get("meta", {}), result["meta"])
+    regressions = [name for name, verdict, _ in rows if verdict in ("slower", "regression")]
+    sys.exit(1 if regressions and args.fail_on_regression else 0)
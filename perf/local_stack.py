@@ -0,0 +1,126 @@
+"""Chạy cả hệ thống trên 1 máy, không docker / MySQL / mạng ngoài: 6 service uvicorn trên
+localhost, mỗi service 1 file SQLite trong --data-dir, mọi URL giữa các service trỏ về localhost.
+
+    python perf/local_stack.py --seed --buyers 2000      # sinh dữ liệu rồi chạy
+    python perf/local_stack.py --memory                  # DB trên tmpfs (/dev/shm), mất khi tắt máy
+    python perf/local_stack.py --print-env               # in biến môi trường để tự chạy từng service
+    python perf/local_stack.py --workers 4               # nhiều worker như production (common/serve.py)
+
+Các service trùng tên module (main, models, database) nên mỗi service chạy trong 1 process
+con riêng; process này chỉ khởi động, chờ sẵn sàng rồi dừng tất cả khi Ctrl-C.
+Gateway ở http://127.0.0.1:8000 (cộng --port-offset).
+"""
+import os
+import sys
+import time
+import shlex
+import shutil
+import signal
+import argparse
+import subprocess
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from services import ROOT, SERVICES, SINGLE_WORKER, URL_ENV, service_urls, sqlite_url
+
+READY_TIMEOUT_SECONDS = float(os.getenv("PERF_READY_TIMEOUT_SECONDS", 60))
+
+def stack_env(data_dir: str, host: str = "127.0.0.1", port_offset: int = 0):
+    """Biến môi trường chung cho cả 6 service (ghi đè cấu hình docker-compose)."""
+    urls = service_urls(host, port_offset)
+    env = {
+        **urls,
+        "DATABASE_URL": sqlite_url(data_dir),
+        "JWT_KEYS_DIR": os.path.join(os.path.abspath(data_dir), "keys"),
+        "PAYMENT_WEBHOOK_URL": f"{urls['PAYMENT_SERVICE_URL']}/payments/webhook",
+        "PYTHONPATH": ROOT,
+    }
+    # Biến DB riêng của service (vd. ORDER_DATABASE_URL trong .env) sẽ thắng DATABASE_URL
+    for _, _, prefix, _ in SERVICES:
+        if prefix: env[f"{prefix}_DATABASE_URL"] = env["DATABASE_URL"]
+    return env
+
+def start_service(name: str, port: int, env: dict, host: str, log_level: str, workers: int = 1):
+    service_dir = os.path.join(ROOT, name)
+    # Cùng entrypoint với docker-compose; order / cart luôn 1 worker
+    cmd = [sys.executable, "-m", "common.serve", "--host", host, "--port", str(port), "--log-level", log_level,
+           "--workers", str(1 if name in SINGLE_WORKER else workers)]
+    return subprocess.Popen(cmd, cwd=service_dir, env={**os.environ, **env, "PYTHONPATH": os.pathsep.join([ROOT, service_dir])})
+
+def wait_ready(url: str, process, timeout: float = READY_TIMEOUT_SECONDS):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None: return False
+        try:
+            # uvicorn chỉ nhận kết nối sau khi chạy xong startup -> có phản hồi (kể cả 404) là sẵn sàng
+            httpx.get(f"{url}/", timeout=1)
+            return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    return False
+
+def stop(processes):
+    for _, process in processes:
+        if process.poll() is None: process.send_signal(signal.SIGINT)
+    for _, process in processes:
+        try: process.wait(timeout=10)
+        except subprocess.TimeoutExpired: process.kill()
+
+def run(data_dir: str, host: str = "127.0.0.1", port_offset: int = 0, log_level: str = "warning", workers: int = 1):
+    env = stack_env(data_dir, host, port_offset)
+    processes = []
+    # kill / docker stop gửi SIGTERM: dừng các process con như Ctrl-C
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        # Gateway khởi động sau cùng (nằm cuối SERVICES), các service khác không phụ thuộc thứ tự
+        for name, port, _, _ in SERVICES:
+            process = start_service(name, port + port_offset, env, host, log_level, workers)
+            processes.append((name, process))
+            if not wait_ready(env[URL_ENV[name]], process):
+                raise RuntimeError(f"{name} did not start on port {port + port_offset}")
+            print(f"{name:<20} {env[URL_ENV[name]]}", flush=True)
+        print(f"Local stack ready, data in {os.path.abspath(data_dir)} (Ctrl-C to stop)", flush=True)
+        while True:
+            for name, process in processes:
+                if process.poll() is not None: raise RuntimeError(f"{name} exited with code {process.returncode}")
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop(processes)
+
+def default_data_dir(memory: bool):
+    if memory and os.path.isdir("/dev/shm"): return f"/dev/shm/food_delivery_perf_{os.getpid()}"
+    return os.path.join(ROOT, ".perf_data")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chạy 6 service trên localhost với SQLite")
+    parser.add_argument("--data-dir")
+    parser.add_argument("--memory", action="store_true", help="đặt DB trên tmpfs, xoá khi dừng")
+    parser.add_argument("--reset", action="store_true", help="xoá dữ liệu cũ trong --data-dir trước khi chạy")
+    parser.add_argument("--seed", action="store_true", help="sinh dữ liệu (perf/seed.py) trước khi chạy")
+    parser.add_argument("--branches", type=int, default=50)
+    parser.add_argument("--foods-per-branch", type=int, default=20)
+    parser.add_argument("--buyers", type=int, default=1000)
+    parser.add_argument("--orders-per-buyer", type=int, default=5)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port-offset", type=int, default=0)
+    parser.add_argument("--log-level", default="warning")
+    parser.add_argument("--workers", type=int, default=1, help="số worker mỗi service (trừ order / cart)")
+    parser.add_argument("--print-env", action="store_true", help="chỉ in biến môi trường (dạng export) rồi thoát")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or default_data_dir(args.memory)
+    if args.print_env:
+        for key, value in stack_env(data_dir, args.host, args.port_offset).items(): print(f"export {key}={shlex.quote(value)}")
+        sys.exit(0)
+    if args.reset and os.path.isdir(data_dir): shutil.rmtree(data_dir)
+    os.makedirs(data_dir, exist_ok=True)
+    if args.seed:
+        from seed import seed
+        print(seed(data_dir, args.branches, args.foods_per_branch, args.buyers, args.orders_per_buyer)["counts"], flush=True)
+    try:
+        run(data_dir, args.host, args.port_offset, args.log_level, args.workers)
+    finally:
+        if args.memory and not args.data_dir: shutil.rmtree(data_dir, ignore_errors=True)
@@ -0,0 +1,221 @@
+"""Kịch bản tải theo hành trình người dùng thật, chạy qua Gateway.
+
+    python perf/local_stack.py --seed                     # hoặc docker-compose + dữ liệu tương tự
+    locust -f perf/locustfile.py --config perf/locust.conf
+
+- Buyer: xem danh sách quán -> tìm món -> mở lựa chọn theo tên -> thêm vào giỏ ->
+  checkout + thanh toán (tỉ lệ --checkout-ratio, còn lại bỏ giỏ) -> xem đơn của mình.
+- Seller: owner / staff của quán theo dõi dashboard đơn, chuyển trạng thái
+  PAID -> SHIPPING -> COMPLETED; owner thỉnh thoảng thêm (rồi xoá) món.
+Tài khoản, quán, tên món lấy từ manifest.json do perf/seed.py sinh ra.
+
+Tỉ lệ buyer / seller, thời gian nghĩ giữa các bước, số user (-u / -r) chỉnh trong
+perf/locust.conf hoặc tham số dòng lệnh. Khi kết thúc in p50/p95/p99 theo endpoint, so với
+ngưỡng trong --slo-file (perf/slo.json), ghi báo cáo JSON vào --report và trả exit code 1
+nếu vi phạm SLO -> dùng được làm bước chặn trong CI trước khi deploy.
+"""
+import os
+import json
+import time
+import random
+from locust import HttpUser, SequentialTaskSet, events, task
+
+PERF_DIR = os.path.dirname(os.path.abspath(__file__))
+STATUS_FLOW = {"PAID": "SHIPPING", "SHIPPING": "COMPLETED"}
+# Món do seller thêm trong lúc chạy tải, vượt số này thì xoá bớt món cũ nhất
+SELLER_MAX_ADDED_FOODS = 5
+
+@events.init_command_line_parser.add_listener
+def add_arguments(parser):
+    group = parser.add_argument_group("food delivery")
+    group.add_argument("--manifest", default=os.path.join(os.path.dirname(PERF_DIR), ".perf_data", "manifest.json"), help="manifest.json của perf/seed.py")
+    group.add_argument("--buyer-weight", type=int, default=9)
+    group.add_argument("--seller-weight", type=int, default=1)
+    group.add_argument("--think-min", type=float, default=1.0, help="giây nghĩ tối thiểu giữa 2 bước")
+    group.add_argument("--think-max", type=float, default=3.0)
+    group.add_argument("--checkout-ratio", type=float, default=0.3, help="tỉ lệ hành trình buyer đi tới thanh toán")
+    group.add_argument("--slo-file", default=os.path.join(PERF_DIR, "slo.json"))
+    group.add_argument("--report", default="", help="đường dẫn file báo cáo JSON (mặc định không ghi)")
+
+MANIFEST = {}
+
+@events.init.add_listener
+def on_init(environment, **kwargs):
+    options = environment.parsed_options
+    if options is None: return
+    with open(options.manifest, encoding="utf-8") as f:
+        MANIFEST.update(json.load(f))
+    BuyerUser.weight = options.buyer_weight
+    SellerUser.weight = options.seller_weight
+
+def think(user):
+    options = user.environment.parsed_options
+    return random.uniform(options.think_min, options.think_max)
+
+class AuthenticatedUser(HttpUser):
+    abstract = True
+    wait_time = think
+
+    def login(self, email):
+        self.email = email
+        with self.client.post("/login", json={"email": email, "password": MANIFEST["password"]}, name="/login", catch_response=True) as res:
+            if res.status_code != 200:
+                res.failure(f"login {res.status_code}")
+                self.tokens = None
+                return
+            self.tokens = res.json()
+
+    def refresh(self):
+        res = self.client.post("/token/refresh", json={"refresh_token": self.tokens["refresh_token"]}, name="/token/refresh")
+        if res.status_code == 200: self.tokens = res.json()
+        else: self.login(self.email)
+
+    def api(self, method, path, name=None, expect=(), **kwargs):
+        """Gọi Gateway kèm token; access token hết hạn -> refresh rồi gọi lại 1 lần.
+        expect: mã lỗi là kết quả hợp lệ của kịch bản (không tính là failure)."""
+        if not self.tokens: self.login(self.email)
+        for attempt in range(2):
+            headers = {"Authorization": f"Bearer {self.tokens['access_token']}"} if self.tokens else {}
+            with self.client.request(method, path, name=name or path, headers=headers, catch_response=True, **kwargs) as res:
+                if res.status_code == 401 and attempt == 0 and self.tokens:
+                    # Không tính lần 401 do token hết hạn là lỗi của endpoint
+                    res.success()
+                    self.refresh()
+                    continue
+                if res.status_code in expect: res.success()
+                return res
+
+class BuyerJourney(SequentialTaskSet):
+    def on_start(self):
+        self.dish = None
+        self.option = None
+
+    @task
+    def browse_branches(self):
+        self.user.api("GET", "/branches")
+
+    @task
+    def search(self):
+        dish = random.choice(MANIFEST["dishes"])
+        self.dish = dish
+        self.user.api("GET", "/foods/search", params={"q": dish.split()[0]})
+
+    @task
+    def open_options(self):
+        res = self.user.api("GET", "/foods/options", params={"name": self.dish})
+        options = res.json() if res is not None and res.status_code == 200 else []
+        self.option = random.choice(options) if options else None
+
+    @task
+    def add_to_cart(self):
+        if self.option is None: return self.interrupt()
+        item = {"food_id": self.option["food_id"], "branch_id": self.option["branch_id"], "quantity": random.randint(1, 3)}
+        res = self.user.api("POST", "/cart", json=item, expect=(409,))
+        if res is not None and res.status_code == 409:
+            # Giỏ còn món quán khác từ hành trình trước: xoá giỏ rồi thêm lại
+            self.user.api("DELETE", "/cart")
+            self.user.api("POST", "/cart", json=item)
+
+    @task
+    def checkout(self):
+        if random.random() >= self.user.environment.parsed_options.checkout_ratio:
+            self.user.api("DELETE", "/cart")
+            return
+        self.user.api("GET", "/cart")
+        body = {"customer_name": f"Buyer {self.user.user_id}", "customer_phone": "0900000000", "delivery_address": "Perf", "coupon_code": random.choice([None, MANIFEST["coupon_code"]])}
+        self.user.api("POST", "/checkout/cart", json=body)
+
+    @task
+    def my_orders(self):
+        self.user.api("GET", "/orders/my-orders", params={"user_id": self.user.user_id})
+        self.interrupt(reschedule=False)
+
+class BuyerUser(AuthenticatedUser):
+    weight = 9
+    tasks = [BuyerJourney]
+
+    def on_start(self):
+        self.user_id = random.randint(1, MANIFEST["buyers"])
+        self.login(MANIFEST["buyer_email"].format(self.user_id))
+
+class SellerUser(AuthenticatedUser):
+    weight = 1
+
+    def on_start(self):
+        seller = random.choice(MANIFEST["sellers"])
+        self.branch_id = seller["branch_id"]
+        self.is_owner = seller["seller_mode"] == "owner"
+        self.orders = []
+        self.added_foods = []
+        self.login(seller["email"])
+
+    @task(6)
+    def poll_dashboard(self):
+        res = self.api("GET", "/orders", params={"branch_id": self.branch_id})
+        if res is not None and res.status_code == 200:
+            self.orders = [o for o in res.json() if o.get("status") in STATUS_FLOW][:50]
+
+    @task(3)
+    def update_status(self):
+        if not self.orders: return
+        order = self.orders.pop(random.randrange(len(self.orders)))
+        self.api("PUT", f"/orders/{order['id']}/status", name="/orders/[id]/status", params={"status": STATUS_FLOW[order["status"]]})
+
+    @task(1)
+    def add_dish(self):
+        if not self.is_owner: return
+        body = {"name": f"Món Mới {self.branch_id}-{int(time.time() * 1000) % 100000}", "price": random.randrange(20, 150) * 1000, "discount": 0}
+        res = self.api("POST", "/foods", json=body)
+        if res is not None and res.status_code == 200: self.added_foods.append(res.json()["id"])
+        if len(self.added_foods) > SELLER_MAX_ADDED_FOODS:
+            self.api("DELETE", f"/foods/{self.added_foods.pop(0)}", name="/foods/[id]")
+
+# ==========================================
+# BÁO CÁO + SLO
+# ==========================================
+def endpoint_report(stats):
+    rows = []
+    for entry in sorted(stats.entries.values(), key=lambda e: (e.name, e.method)):
+        if not entry.num_requests: continue
+        rows.append({
+            "endpoint": f"{entry.method} {entry.name}", "requests": entry.num_requests, "failures": entry.num_failures,
+            "error_rate": round(entry.num_failures / entry.num_requests, 4), "rps": round(entry.total_rps, 2),
+            "p50": entry.get_response_time_percentile(0.50), "p95": entry.get_response_time_percentile(0.95),
+            "p99": entry.get_response_time_percentile(0.99), "max": round(entry.max_response_time or 0, 1),
+        })
+    return rows
+
+def check_slo(rows, slo):
+    """Danh sách vi phạm: ngưỡng riêng của endpoint, không có thì dùng "default"."""
+    violations = []
+    for row in rows:
+        limits = {**slo.get("default", {}), **slo.get("endpoints", {}).get(row["endpoint"], {})}
+        for metric in ("p50", "p95", "p99", "error_rate"):
+            if metric in limits and row[metric] > limits[metric]:
+                violations.append({"endpoint": row["endpoint"], "metric": metric, "value": row[metric], "limit": limits[metric]})
+    total = sum(r["requests"] for r in rows)
+    if total < slo.get("min_requests", 0):
+        violations.append({"endpoint": "*", "metric": "requests", "value": total, "limit": slo["min_requests"]})
+    return violations
+
+def print_report(rows, violations):
+    print(f"\n{'endpoint':<34}{'reqs':>8}{'fail%':>8}{'p50':>8}{'p95':>8}{'p99':>8}")
+    for r in rows:
+        print(f"{r['endpoint']:<34}{r['requests']:>8}{r['error_rate'] * 100:>7.2f}%{r['p50']:>8.0f}{r['p95']:>8.0f}{r['p99']:>8.0f}")
+    for v in violations:
+        print(f"SLO FAIL {v['endpoint']} {v['metric']}={v['value']} {'<' if v['metric'] == 'requests' else '>'} {v['limit']}")
+    print("SLO PASS" if not violations else f"SLO FAIL ({len(violations)} violations)")
+
+@events.quitting.add_listener
+def on_quitting(environment, **kwargs):
+    options = environment.parsed_options
+    if options is None or (environment.runner is not None and type(environment.runner).__name__ == "WorkerRunner"): return
+    rows = endpoint_report(environment.stats)
+    with open(options.slo_file, encoding="utf-8") as f:
+        slo = json.load(f)
+    violations = check_slo(rows, slo)
+    print_report(rows, violations)
+    if options.report:
+        with open(options.report, "w", encoding="utf-8") as f:
+            json.dump({"endpoints": rows, "violations": violations, "passed": not violations, "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S")}, f, ensure_ascii=False, indent=2)
+    if violations: environment.process_exit_code = 1
@@ -0,0 +1,169 @@
+"""Sinh dữ liệu mẫu cỡ lớn thẳng vào DB SQLite của từng service (không qua HTTP).
+
+    python perf/seed.py --data-dir .perf_data --branches 200 --foods-per-branch 30 --buyers 5000
+
+Tạo quán (toạ độ quanh TP.HCM), món (tên lặp lại giữa các quán để /foods/options có
+nhiều lựa chọn), coupon, tài khoản buyer / owner / staff (cùng mật khẩu --password),
+sổ địa chỉ, lịch sử đơn + payment khớp nhau. Cùng --random-seed -> cùng dữ liệu.
+Ghi manifest.json vào data dir (tài khoản, quán, tên món, coupon) cho locust / bench dùng.
+Chạy trên DB trống: các bảng được xoá dữ liệu cũ trước khi sinh.
+"""
+import os
+import sys
+import json
+import random
+import argparse
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from services import open_service_db, sqlite_url
+from sqlalchemy import delete, insert
+
+DISHES = [
+    "Cơm Tấm Sườn Bì", "Phở Bò Tái", "Bún Bò Huế", "Bún Chả Hà Nội", "Bánh Mì Thịt", "Bánh Mì Chảo",
+    "Hủ Tiếu Nam Vang", "Mì Quảng", "Cơm Gà Xối Mỡ", "Bún Đậu Mắm Tôm", "Gỏi Cuốn", "Chả Giò",
+    "Bánh Xèo", "Cao Lầu", "Bò Kho", "Cà Ri Gà", "Lẩu Thái", "Cơm Chiên Dương Châu", "Mì Xào Bò",
+    "Trà Sữa Trân Châu", "Cà Phê Sữa Đá", "Sinh Tố Bơ", "Chè Ba Màu", "Nước Mía",
+]
+STATUSES = [("COMPLETED", 60), ("PAID", 10), ("SHIPPING", 10), ("PENDING_PAYMENT", 10), ("CANCELLED", 10)]
+PAID = ("PAID", "SHIPPING", "COMPLETED")
+CHUNK = 2000
+
+def bulk_insert(db, model, rows):
+    for i in range(0, len(rows), CHUNK): db.execute(insert(model), rows[i:i + CHUNK])
+
+def clear(db, *models):
+    for model in models: db.execute(delete(model))
+
+def seed_restaurants(rng, url, branches, foods_per_branch):
+    database, models = open_service_db("restaurant_service", url)
+    db = database.SessionLocal()
+    try:
+        clear(db, models.FoodRating, models.OrderReview, models.FoodRatingStats, models.BranchRatingStats,
+              models.CouponRedemption, models.CouponCounterShard, models.Coupon, models.Food, models.Branch)
+        bulk_insert(db, models.Branch, [{
+            "id": b, "name": f"Quán Perf {b}", "address": f"{b} Đường Số {b % 50}", "phone": f"09{b:08d}",
+            "latitude": 10.77 + rng.uniform(-0.15, 0.15), "longitude": 106.70 + rng.uniform(-0.15, 0.15),
+        } for b in range(1, branches + 1)])
+        foods, food_id = [], 0
+        for b in range(1, branches + 1):
+            for name in rng.sample(DISHES, min(foods_per_branch, len(DISHES))):
+                food_id += 1
+                foods.append({"id": food_id, "name": name, "price": rng.randrange(20, 150) * 1000,
+                              "discount": rng.choice([0, 0, 0, 5, 10, 20]), "branch_id": b})
+            for i in range(len(DISHES), foods_per_branch):
+                food_id += 1
+                foods.append({"id": food_id, "name": f"Món Riêng {b}-{i}", "price": rng.randrange(20, 150) * 1000, "discount": 0, "branch_id": b})
+        bulk_insert(db, models.Food, foods)
+        bulk_insert(db, models.Coupon, [{"id": b, "code": "PERF10", "discount_percent": 10, "branch_id": b, "is_active": True} for b in range(1, branches + 1)])
+        db.commit()
+        return foods
+    finally:
+        db.close()
+
+def seed_users(rng, url, branches, buyers, password):
+    from passlib.context import CryptContext
+    database, models = open_service_db("user_service", url)
+    # Cùng 1 mật khẩu cho mọi tài khoản -> băm 1 lần (bcrypt cost như User Service)
+    hashed = CryptContext(schemes=["bcrypt"], bcrypt__rounds=int(os.getenv("BCRYPT_ROUNDS", 12))).hash(password)
+    db = database.SessionLocal()
+    try:
+        clear(db, models.RevokedToken, models.RefreshToken, models.UserAddress, models.User)
+        users, addresses = [], []
+        for i in range(1, buyers + 1):
+            users.append({"id": i, "name": f"Buyer {i}", "email": f"buyer{i}@perf.local", "hashed_password": hashed,
+                          "role": "buyer", "phone": f"08{i:08d}", "address": f"{i} Nguyễn Huệ", "token_version": 0})
+            for n in range(rng.randint(1, 3)):
+                addresses.append({"user_id": i, "title": ["Nhà", "Công ty", "Khác"][n], "address": f"{i}/{n} Lê Lợi", "phone": f"08{i:08d}"})
+        sellers = []
+        for b in range(1, branches + 1):
+            for mode in ("owner", "staff"):
+                uid = len(users) + 1
+                users.append({"id": uid, "name": f"{mode.title()} {b}", "email": f"{mode}{b}@perf.local", "hashed_password": hashed,
+                              "role": "seller", "seller_mode": mode, "managed_branch_id": b, "token_version": 0})
+                sellers.append({"email": f"{mode}{b}@perf.local", "branch_id": b, "seller_mode": mode})
+        bulk_insert(db, models.User, users)
+        bulk_insert(db, models.UserAddress, addresses)
+        db.commit()
+        return sellers
+    finally:
+        db.close()
+
+def seed_orders(rng, order_url, payment_url, foods, buyers, orders_per_buyer, days):
+    o_database, o_models = open_service_db("order_service", order_url)
+    p_database, p_models = open_service_db("payment_service", payment_url)
+    by_branch = {}
+    for f in foods: by_branch.setdefault(f["branch_id"], []).append(f)
+    branch_ids = list(by_branch)
+    statuses, weights = zip(*STATUSES)
+    now = datetime.datetime.utcnow()
+    orders, items, payments = [], [], []
+    order_id = 0
+    for user_id in range(1, buyers + 1):
+        for _ in range(orders_per_buyer):
+            order_id += 1
+            branch_id = rng.choice(branch_ids)
+            picked = rng.sample(by_branch[branch_id], min(rng.randint(1, 4), len(by_branch[branch_id])))
+            total = 0.0
+            for f in picked:
+                qty = rng.randint(1, 3)
+                price = f["price"] * (1 - f["discount"] / 100)
+                total += price * qty
+                items.append({"order_id": order_id, "food_id": f["id"], "food_name": f["name"], "price": price, "quantity": qty})
+            status = rng.choices(statuses, weights)[0]
+            created_at = now - datetime.timedelta(seconds=rng.randrange(days * 86400))
+            orders.append({"id": order_id, "user_id": user_id, "user_name": f"Buyer {user_id}", "branch_id": branch_id,
+                           "total_price": total, "status": status, "created_at": created_at, "delivery_address": f"{user_id} Nguyễn Huệ",
+                           "customer_phone": f"08{user_id:08d}", "discount_amount": 0.0})
+            if status in PAID:
+                payments.append({"order_id": order_id, "amount": total, "transaction_id": f"PAY_SEED_{order_id}", "status": "SUCCESS",
+                                 "created_at": created_at, "updated_at": created_at})
+    db = o_database.SessionLocal()
+    try:
+        clear(db, o_models.OrderItem, o_models.Order)
+        bulk_insert(db, o_models.Order, orders)
+        bulk_insert(db, o_models.OrderItem, items)
+        db.commit()
+    finally:
+        db.close()
+    db = p_database.SessionLocal()
+    try:
+        clear(db, p_models.Payment)
+        bulk_insert(db, p_models.Payment, payments)
+        db.commit()
+    finally:
+        db.close()
+    return len(orders), len(payments)
+
+def seed(data_dir, branches=50, foods_per_branch=20, buyers=1000, orders_per_buyer=5, days=90, password="perf123", random_seed=42):
+    os.makedirs(data_dir, exist_ok=True)
+    rng = random.Random(random_seed)
+    url = sqlite_url(data_dir)
+    foods = seed_restaurants(rng, url, branches, foods_per_branch)
+    sellers = seed_users(rng, url, branches, buyers, password)
+    order_count, payment_count = seed_orders(rng, url, url, foods, buyers, orders_per_buyer, days)
+    # Chỉ các quán / món / tài khoản cần cho kịch bản tải, không phải toàn bộ dữ liệu
+    manifest = {
+        "password": password, "buyers": buyers, "buyer_email": "buyer{}@perf.local",
+        "branches": branches, "sellers": sellers, "coupon_code": "PERF10",
+        "dishes": sorted({f["name"] for f in foods if not f["name"].startswith("Món Riêng")}),
+        "foods": {str(b): [f["id"] for f in foods if f["branch_id"] == b] for b in range(1, branches + 1)},
+        "counts": {"foods": len(foods), "orders": order_count, "payments": payment_count},
+    }
+    with open(os.path.join(data_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    return manifest
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sinh dữ liệu mẫu cho local perf stack")
+    parser.add_argument("--data-dir", default=".perf_data")
+    parser.add_argument("--branches", type=int, default=50)
+    parser.add_argument("--foods-per-branch", type=int, default=20)
+    parser.add_argument("--buyers", type=int, default=1000)
+    parser.add_argument("--orders-per-buyer", type=int, default=5)
+    parser.add_argument("--days", type=int, default=90, help="lịch sử đơn trải trong bao nhiêu ngày")
+    parser.add_argument("--password", default="perf123")
+    parser.add_argument("--random-seed", type=int, default=42)
+    args = parser.parse_args()
+    manifest = seed(args.data_dir, args.branches, args.foods_per_branch, args.buyers, args.orders_per_buyer, args.days, args.password, args.random_seed)
+    print(json.dumps({"data_dir": args.data_dir, **manifest["counts"], "branches": args.branches, "buyers": args.buyers}))
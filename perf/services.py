@@ -0,0 +1,54 @@
+"""Thông tin 6 service cho các công cụ đo hiệu năng chạy tại chỗ (không docker, không MySQL)."""
+import os
+import sys
+import importlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path: sys.path.insert(0, ROOT)
+
+# (thư mục, port, tiền tố env của DB, tên db) - gateway không có DB
+SERVICES = [
+    ("user_service", 8001, "USER", "user_db"),
+    ("restaurant_service", 8002, "RESTAURANT", "restaurant_db"),
+    ("order_service", 8003, "ORDER", "order_db"),
+    ("payment_service", 8004, "PAYMENT", "payment_db"),
+    ("cart_service", 8005, "CART", "cart_db"),
+    ("gateway_service", 8000, None, None),
+]
+URL_ENV = {
+    "user_service": "USER_SERVICE_URL", "restaurant_service": "RESTAURANT_SERVICE_URL",
+    "order_service": "ORDER_SERVICE_URL", "payment_service": "PAYMENT_SERVICE_URL",
+    "cart_service": "CART_SERVICE_URL", "gateway_service": "GATEWAY_URL",
+}
+# Giữ state trong RAM của process -> luôn chạy 1 worker (như docker-compose.yml)
+SINGLE_WORKER = ("order_service", "cart_service")
+PREFIXES = {name: prefix for name, _, prefix, _ in SERVICES if prefix}
+# Module trùng tên giữa các service, phải gỡ khỏi sys.modules trước khi nạp service khác
+SERVICE_MODULES = ("main", "database", "models")
+
+def service_urls(host: str = "127.0.0.1", port_offset: int = 0):
+    return {URL_ENV[name]: f"http://{host}:{port + port_offset}" for name, port, _, _ in SERVICES}
+
+def sqlite_url(data_dir: str):
+    # {db_name} được common/db.py thay bằng tên db của từng service
+    return f"sqlite:///{os.path.abspath(data_dir)}/{{db_name}}.db"
+
+def import_service(name: str, modules=("database", "models")):
+    """Nạp các module của 1 service vào process hiện tại; trả về dict tên -> module."""
+    path = os.path.join(ROOT, name)
+    for module in SERVICE_MODULES: sys.modules.pop(module, None)
+    sys.path.insert(0, path)
+    try:
+        return {module: importlib.import_module(module) for module in modules}
+    finally:
+        sys.path.remove(path)
+
+def open_service_db(name: str, database_url: str):
+    """(database, models) của service trên database_url, schema đã tạo + migrate như lúc app khởi động."""
+    from common.migrations import run_migrations
+    os.environ[f"{PREFIXES[name]}_DATABASE_URL"] = database_url
+    loaded = import_service(name)
+    database = loaded["database"]
+    database.Base.metadata.create_all(bind=database.engine)
+    run_migrations(database.engine, os.path.join(ROOT, name, "migrations"), verbose=False)
+    return database, loaded["models"]
@@ -0,0 +1,129 @@
+import os
+import random
+import datetime
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import models
+
+COUPON_SHARDS = int(os.getenv("COUPON_SHARDS", 8))
+COUPON_RESERVATION_TTL_SECONDS = int(os.getenv("COUPON_RESERVATION_TTL_SECONDS", 900))
+COUPON_RELEASE_BATCH_SIZE = int(os.getenv("COUPON_RELEASE_BATCH_SIZE", 500))
+
+class CouponError(Exception):
+    """Lỗi nghiệp vụ coupon; main.py trả về HTTP status_code + detail."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def create_shards(db: Session, coupon: models.Coupon):
+    # Chia đều max_redemptions cho các shard (shard đầu nhận phần dư)
+    if not coupon.max_redemptions: return
+    shards = max(1, min(COUPON_SHARDS, coupon.max_redemptions))
+    base, extra = divmod(coupon.max_redemptions, shards)
+    rows = [{"coupon_id": coupon.id, "shard_no": i, "remaining": base + (1 if i < extra else 0)} for i in range(shards)]
+    db.execute(insert(models.CouponCounterShard).values(rows))
+
+def find_active(db: Session, code: str, branch_id: int):
+    # Đi đúng index ix_coupons_code_branch_active
+    return db.query(models.Coupon).filter(models.Coupon.code == code.upper(), models.Coupon.branch_id == branch_id, models.Coupon.is_active == True).first()
+
+def has_remaining(db: Session, coupon: models.Coupon):
+    if not coupon.max_redemptions: return True
+    return db.query(models.CouponCounterShard.shard_no).filter(models.CouponCounterShard.coupon_id == coupon.id, models.CouponCounterShard.remaining > 0).first() is not None
+
+def _take_shard(db: Session, coupon_id: int):
+    # Trừ có điều kiện (remaining > 0) trên 1 shard ngẫu nhiên, hết thì thử shard kế tiếp
+    shard_nos = [s for (s,) in db.query(models.CouponCounterShard.shard_no).filter(models.CouponCounterShard.coupon_id == coupon_id).all()]
+    if not shard_nos: return None
+    start = random.randrange(len(shard_nos))
+    for shard_no in shard_nos[start:] + shard_nos[:start]:
+        taken = db.query(models.CouponCounterShard).filter(
+            models.CouponCounterShard.coupon_id == coupon_id,
+            models.CouponCounterShard.shard_no == shard_no,
+            models.CouponCounterShard.remaining > 0,
+        ).update({models.CouponCounterShard.remaining: models.CouponCounterShard.remaining - 1}, synchronize_session=False)
+        if taken: return shard_no
+    return None
+
+def _return_shard(db: Session, coupon_id: int, shard_no):
+    if shard_no is None: return
+    db.query(models.CouponCounterShard).filter(
+        models.CouponCounterShard.coupon_id == coupon_id, models.CouponCounterShard.shard_no == shard_no
+    ).update({models.CouponCounterShard.remaining: models.CouponCounterShard.remaining + 1}, synchronize_session=False)
+
+def reserve(db: Session, coupon: models.Coupon, user_id: int = None):
+    slot = None
+    if coupon.per_user_limit:
+        if not user_id: raise CouponError(400, "Login required for this coupon")
+        used = {s for (s,) in db.query(models.CouponRedemption.slot).filter(models.CouponRedemption.coupon_id == coupon.id, models.CouponRedemption.user_id == user_id).all()}
+        free = [s for s in range(1, coupon.per_user_limit + 1) if s not in used]
+        if not free: raise CouponError(409, "Coupon usage limit reached")
+        slot = free[0]
+
+    redemption = models.CouponRedemption(
+        coupon_id=coupon.id, user_id=user_id, slot=slot, status="RESERVED",
+        expires_at=datetime.datetime.utcnow() + datetime.timedelta(seconds=COUPON_RESERVATION_TTL_SECONDS),
+    )
+    try:
+        # Ghi dòng redemption trước: 2 request cùng user tranh 1 slot sẽ vỡ unique ở đây
+        db.add(redemption)
+        db.flush()
+        if coupon.max_redemptions:
+            redemption.shard_no = _take_shard(db, coupon.id)
+            if redemption.shard_no is None:
+                db.rollback()
+                raise CouponError(409, "Coupon sold out")
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise CouponError(409, "Coupon usage limit reached")
+    return redemption
+
+def confirm(db: Session, reservation_id: int, order_id: int = None):
+    updated = db.query(models.CouponRedemption).filter(
+        models.CouponRedemption.id == reservation_id, models.CouponRedemption.status == "RESERVED"
+    ).update({models.CouponRedemption.status: "CONFIRMED", models.CouponRedemption.order_id: order_id}, synchronize_session=False)
+    db.commit()
+    if updated: return True
+    # Đã CONFIRMED trước đó thì coi như thành công (idempotent)
+    return db.query(models.CouponRedemption.id).filter(models.CouponRedemption.id == reservation_id, models.CouponRedemption.status == "CONFIRMED").first() is not None
+
+def extend(db: Session, reservation_ids):
+    # Order Service gọi định kỳ cho đơn còn chờ thanh toán: lượt đang giữ không bị trả về pool
+    if not reservation_ids: return 0
+    extended = db.query(models.CouponRedemption).filter(
+        models.CouponRedemption.id.in_(reservation_ids), models.CouponRedemption.status == "RESERVED"
+    ).update({models.CouponRedemption.expires_at: datetime.datetime.utcnow() + datetime.timedelta(seconds=COUPON_RESERVATION_TTL_SECONDS)},
+             synchronize_session=False)
+    db.commit()
+    return extended
+
+def _release(db: Session, redemption: models.CouponRedemption):
+    deleted = db.query(models.CouponRedemption).filter(
+        models.CouponRedemption.id == redemption.id, models.CouponRedemption.status == "RESERVED"
+    ).delete(synchronize_session=False)
+    if deleted: _return_shard(db, redemption.coupon_id, redemption.shard_no)
+    return deleted
+
+def release(db: Session, reservation_id: int):
+    redemption = db.query(models.CouponRedemption).filter(models.CouponRedemption.id == reservation_id).first()
+    released = bool(redemption and _release(db, redemption))
+    db.commit()
+    return released
+
+def release_expired(db: Session, batch_size: int = COUPON_RELEASE_BATCH_SIZE):
+    # Trả lượt của các reservation quá hạn, mỗi batch 1 transaction ngắn
+    total = 0
+    while True:
+        expired = db.query(models.CouponRedemption).filter(
+            models.CouponRedemption.status == "RESERVED", models.CouponRedemption.expires_at < datetime.datetime.utcnow()
+        ).limit(batch_size).all()
+        if not expired: break
+        for redemption in expired:
+            total += _release(db, redemption)
+        db.commit()
+        if len(expired) < batch_size: break
+    return total
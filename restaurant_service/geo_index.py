@@ -0,0 +1,96 @@
+import math
+import heapq
+import threading
+
+EARTH_RADIUS_KM = 6371.0
+# Cùng bán kính với haversine: lưới và khoảng cách thật không lệch nhau ở mép bán kính tìm
+KM_PER_DEG_LAT = EARTH_RADIUS_KM * math.pi / 180
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+class GeoGridIndex:
+    """Lưới ô vuông (cell_deg độ) trong RAM: cell -> {branch_id: (lat, lon, data)}.
+
+    Tìm kiếm đi theo từng vòng ô quanh điểm cần tìm và dừng khi vòng tiếp theo
+    chắc chắn xa hơn bán kính (hoặc xa hơn kết quả thứ k), nên chỉ chạm vào các
+    chi nhánh ở gần chứ không quét toàn bộ.
+    """
+
+    def __init__(self, cell_deg: float = 0.02):
+        self.cell_deg = cell_deg
+        # Số cột kinh độ: cột cuối (gần +180) nằm cạnh cột 0 (-180)
+        self.lon_cells = math.ceil(360 / cell_deg)
+        self._cells = {}
+        self._where = {}
+        self._lock = threading.Lock()
+        self.max_id = 0
+
+    def __len__(self):
+        return len(self._where)
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_deg), math.floor(((lon + 180) % 360) / self.cell_deg) % self.lon_cells)
+
+    def add(self, branch_id: int, lat: float, lon: float, data: dict = None):
+        with self._lock:
+            self._remove(branch_id)
+            cell = self._cell(lat, lon)
+            self._cells.setdefault(cell, {})[branch_id] = (lat, lon, data or {})
+            self._where[branch_id] = cell
+            self.max_id = max(self.max_id, branch_id)
+
+    def _remove(self, branch_id):
+        cell = self._where.pop(branch_id, None)
+        if cell is None: return
+        bucket = self._cells.get(cell)
+        bucket.pop(branch_id, None)
+        if not bucket: del self._cells[cell]
+
+    def remove(self, branch_id: int):
+        with self._lock:
+            self._remove(branch_id)
+
+    def clear(self):
+        with self._lock:
+            self._cells, self._where, self.max_id = {}, {}, 0
+
+    def nearby(self, lat: float, lon: float, radius_km: float, k: int):
+        cy, cx = self._cell(lat, lon)
+        cell_h = self.cell_deg * KM_PER_DEG_LAT
+        # Ô hẹp nhất theo kinh độ nằm ở vĩ độ xa xích đạo nhất trong bán kính tìm
+        max_lat = min(89.9, abs(lat) + radius_km / KM_PER_DEG_LAT + self.cell_deg)
+        cell_w = cell_h * max(0.01, math.cos(math.radians(max_lat)))
+        min_extent = min(cell_h, cell_w)
+        max_ring = int(radius_km / min_extent) + 1
+
+        best = []  # max-heap theo khoảng cách: (-dist, id, item)
+        visited = set()  # vòng rộng quấn qua kinh tuyến 180 có thể gặp lại cùng 1 ô
+        with self._lock:
+            for ring in range(max_ring + 1):
+                for dy in range(-ring, ring + 1):
+                    step = 1 if abs(dy) == ring else 2 * ring
+                    for dx in range(-ring, ring + 1, step or 1):
+                        cell = (cy + dy, (cx + dx) % self.lon_cells)
+                        if cell in visited: continue
+                        visited.add(cell)
+                        bucket = self._cells.get(cell)
+                        if not bucket: continue
+                        for branch_id, (blat, blon, data) in bucket.items():
+                            dist = haversine_km(lat, lon, blat, blon)
+                            if dist > radius_km: continue
+                            item = (-dist, branch_id, (blat, blon, data))
+                            if len(best) < k: heapq.heappush(best, item)
+                            elif dist < -best[0][0]: heapq.heapreplace(best, item)
+                # Mọi điểm ở vòng sau cách ít nhất ring * min_extent
+                bound = ring * min_extent
+                if bound > radius_km: break
+                if len(best) >= k and -best[0][0] <= bound: break
+
+        results = []
+        for neg_dist, branch_id, (blat, blon, data) in sorted(best, key=lambda x: (-x[0], x[1])):
+            results.append({**data, "id": branch_id, "latitude": blat, "longitude": blon, "distance_km": round(-neg_dist, 3)})
+        return results
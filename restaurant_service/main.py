@@ -1,14 +1,47 @@
+import os
+import io
+import csv
+import json
+import asyncio
 import httpx
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, HTTPException, Request, UploadFile, File
+from sqlalchemy import func, insert
 from sqlalchemy.orm import Session
-from database import SessionLocal, engine, Base
+from database import SessionLocal, engine, Base, read_router
+from common.db import db_metrics
+from common.migrations import run_migrations
 import models
+import ratings
+import coupons
+from geo_index import GeoGridIndex
+from common.auth import get_verifier
+from common.responses import FastJSONResponse
+from common.workers import setup_worker
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List, Optional
 
 Base.metadata.create_all(bind=engine)
+run_migrations(engine, os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations"))
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
+verifier = get_verifier()
+# Warm-up pool + JWKS trước khi worker nhận request, số liệu ở /metrics/worker (common/workers.py)
+setup_worker(app, engines={"primary": engine, "replica": read_router.replica_engine}, warmups=[verifier.warm_up])
+
+ORDER_SERVICE_URL = os.getenv("ORDER_SERVICE_URL", "http://order_service:8003")
+
+# Số dòng mỗi lệnh INSERT nhiều dòng khi import menu
+MENU_IMPORT_CHUNK_SIZE = int(os.getenv("MENU_IMPORT_CHUNK_SIZE", 200))
+MENU_IMPORT_MAX_ERRORS = int(os.getenv("MENU_IMPORT_MAX_ERRORS", 100))
+
+# Chỉ mục không gian trong RAM cho /branches/nearby
+GEO_CELL_DEG = float(os.getenv("GEO_CELL_DEG", 0.02))
+GEO_INDEX_REFRESH_SECONDS = float(os.getenv("GEO_INDEX_REFRESH_SECONDS", 30))
+NEARBY_MAX_RADIUS_KM = float(os.getenv("NEARBY_MAX_RADIUS_KM", 50))
+NEARBY_MAX_LIMIT = int(os.getenv("NEARBY_MAX_LIMIT", 100))
+branch_index = GeoGridIndex(cell_deg=GEO_CELL_DEG)
+
+COUPON_RELEASE_INTERVAL_SECONDS = float(os.getenv("COUPON_RELEASE_INTERVAL_SECONDS", 60))
 
 def get_db():
     db = SessionLocal()
@@ -17,15 +50,70 @@ def get_db():
     finally:
         db.close()
 
-async def verify_user(request: Request):
-    token = request.headers.get("Authorization")
-    if not token: raise HTTPException(401, "Missing Token")
+# Session cho endpoint chỉ đọc: replica, hoặc primary nếu vừa ghi (common/db.py)
+def get_read_db(request: Request):
+    db = read_router.session(read_router.request_keys(request))
     try:
-        async with httpx.AsyncClient() as client:
-            res = await client.get("http://user_service:8001/verify", headers={"Authorization": token})
-            if res.status_code != 200: raise HTTPException(401, "Invalid Token")
-            return res.json()
-    except Exception as e: raise HTTPException(401, str(e))
+        yield db
+    finally:
+        db.close()
+
+# Mức dùng connection pool + định tuyến đọc (common/db.py)
+@app.get("/metrics/db")
+def get_db_metrics():
+    return db_metrics(engine, read_router)
+
+# --- CHỈ MỤC CHI NHÁNH THEO TOẠ ĐỘ ---
+def _index_branch(b):
+    if b.latitude is None or b.longitude is None: return
+    branch_index.add(b.id, b.latitude, b.longitude, {"name": b.name, "address": b.address, "phone": b.phone})
+
+def load_branch_index(full: bool = False):
+    # full=True: dựng lại toàn bộ; ngược lại chỉ nạp các chi nhánh mới (id > max_id),
+    # để các worker khác cũng thấy chi nhánh vừa được tạo
+    db = SessionLocal()
+    try:
+        if full: branch_index.clear()
+        query = db.query(models.Branch).filter(models.Branch.latitude.isnot(None), models.Branch.id > branch_index.max_id)
+        for b in query.order_by(models.Branch.id).yield_per(1000):
+            _index_branch(b)
+    finally:
+        db.close()
+
+async def _refresh_branch_index_loop():
+    while True:
+        await asyncio.sleep(GEO_INDEX_REFRESH_SECONDS)
+        try: await asyncio.to_thread(load_branch_index)
+        except Exception as e: print(f"Geo index refresh failed: {e}")
+
+@app.on_event("shutdown")
+async def close_verifier():
+    await verifier.close()
+
+@app.on_event("startup")
+async def build_branch_index():
+    load_branch_index(full=True)
+    if GEO_INDEX_REFRESH_SECONDS > 0: asyncio.create_task(_refresh_branch_index_loop())
+
+# --- TRẢ LƯỢT COUPON KHI RESERVATION HẾT HẠN ---
+def _release_expired_coupons():
+    db = SessionLocal()
+    try: return coupons.release_expired(db)
+    finally: db.close()
+
+async def _release_coupons_loop():
+    while True:
+        await asyncio.sleep(COUPON_RELEASE_INTERVAL_SECONDS)
+        try: await asyncio.to_thread(_release_expired_coupons)
+        except Exception as e: print(f"Coupon release failed: {e}")
+
+@app.on_event("startup")
+async def start_coupon_release():
+    if COUPON_RELEASE_INTERVAL_SECONDS > 0: asyncio.create_task(_release_coupons_loop())
+
+async def verify_user(request: Request):
+    # Giải mã tại chỗ nếu có key, ngược lại gọi /verify có cache (common/auth.py)
+    return await verifier.verify(request.headers.get("Authorization"))
 
 # --- API REVIEW ---
 class FoodRatingInput(BaseModel):
@@ -41,8 +129,10 @@ class ReviewInput(BaseModel):
 @app.post("/reviews")
 async def create_review(payload: ReviewInput, request: Request, db: Session = Depends(get_db)):
     user = await verify_user(request)
+    scores = [payload.rating_general] + [item.score for item in payload.items]
+    if any(score not in ratings.STARS for score in scores): raise HTTPException(400, "Score must be 1-5")
     async with httpx.AsyncClient() as client:
-        check_url = f"http://order_service:8003/orders/{payload.order_id}/check-review"
+        check_url = f"{ORDER_SERVICE_URL}/orders/{payload.order_id}/check-review"
         try:
             res = await client.get(check_url, params={"user_id": user['id']})
             if res.status_code != 200: raise HTTPException(400, res.json().get("detail", "Error"))
@@ -55,7 +145,12 @@ async def create_review(payload: ReviewInput, request: Request, db: Session = De
         db.flush()
         for item in payload.items:
             db.add(models.FoodRating(review_id=new_review.id, food_id=item.food_id, score=item.score))
+        # Cập nhật bảng tổng hợp trong cùng transaction
+        if branch_id: ratings.bump_rating(db, models.BranchRatingStats, branch_id, payload.rating_general)
+        for item in payload.items:
+            ratings.bump_rating(db, models.FoodRatingStats, item.food_id, item.score)
         db.commit()
+        read_router.mark_write("/branches", f"branch_id={branch_id}" if branch_id else None)
         return {"message": "Success"}
     except Exception as e:
         db.rollback()
@@ -76,35 +171,70 @@ async def create_coupon(coupon: dict, request: Request, db: Session = Depends(ge
     exist = db.query(models.Coupon).filter(models.Coupon.code == coupon['code'].upper(), models.Coupon.branch_id == seller_branch_id).first()
     if exist: raise HTTPException(400, "Exists")
 
-    new_coupon = models.Coupon(code=coupon['code'].upper(), discount_percent=coupon['discount_percent'], branch_id=seller_branch_id)
+    max_redemptions, per_user_limit = coupon.get('max_redemptions'), coupon.get('per_user_limit')
+    for limit in (max_redemptions, per_user_limit):
+        if limit is not None and (not isinstance(limit, int) or limit <= 0): raise HTTPException(400, "Limits must be positive integers")
+
+    new_coupon = models.Coupon(code=coupon['code'].upper(), discount_percent=coupon['discount_percent'], branch_id=seller_branch_id, max_redemptions=max_redemptions, per_user_limit=per_user_limit)
     db.add(new_coupon)
+    db.flush()
+    coupons.create_shards(db, new_coupon)
     db.commit()
     db.refresh(new_coupon)
     return new_coupon
 
 @app.get("/coupons/verify")
 def verify_coupon(code: str, branch_id: int, db: Session = Depends(get_db)):
-    coupon = db.query(models.Coupon).filter(models.Coupon.code == code.upper(), models.Coupon.branch_id == branch_id, models.Coupon.is_active == True).first()
+    coupon = coupons.find_active(db, code, branch_id)
     if not coupon: raise HTTPException(404, "Invalid")
+    if not coupons.has_remaining(db, coupon): raise HTTPException(404, "Sold out")
     return {"valid": True, "discount_percent": coupon.discount_percent, "code": coupon.code}
 
+# --- GIỮ CHỖ LƯỢT DÙNG COUPON (Order Service gọi nội bộ) ---
+@app.exception_handler(coupons.CouponError)
+async def coupon_error_handler(request: Request, exc: coupons.CouponError):
+    return FastJSONResponse({"detail": exc.detail}, status_code=exc.status_code)
+
+class CouponReserveInput(BaseModel):
+    code: str
+    branch_id: int
+    user_id: Optional[int] = None
+
+class CouponExtendInput(BaseModel):
+    reservation_ids: List[int]
+
+@app.post("/coupons/reserve")
+def reserve_coupon(payload: CouponReserveInput, db: Session = Depends(get_db)):
+    coupon = coupons.find_active(db, payload.code, payload.branch_id)
+    if not coupon: raise HTTPException(404, "Invalid")
+    redemption = coupons.reserve(db, coupon, payload.user_id)
+    return {"reservation_id": redemption.id, "code": coupon.code, "discount_percent": coupon.discount_percent, "expires_at": redemption.expires_at}
+
+# Đơn còn chờ thanh toán -> gia hạn lượt đang giữ (Order Service gọi định kỳ)
+@app.post("/coupons/reservations/extend")
+def extend_coupon_reservations(payload: CouponExtendInput, db: Session = Depends(get_db)):
+    return {"extended": coupons.extend(db, payload.reservation_ids)}
+
+@app.post("/coupons/reservations/{reservation_id}/confirm")
+def confirm_coupon(reservation_id: int, order_id: Optional[int] = None, db: Session = Depends(get_db)):
+    if not coupons.confirm(db, reservation_id, order_id): raise HTTPException(409, "Reservation expired")
+    return {"message": "Confirmed"}
+
+@app.post("/coupons/reservations/{reservation_id}/release")
+def release_coupon(reservation_id: int, db: Session = Depends(get_db)):
+    return {"released": coupons.release(db, reservation_id)}
+
 @app.get("/foods/search")
-def search_foods(q: str = None, db: Session = Depends(get_db)):
-    query = db.query(models.Food)
+def search_foods(q: str = None, db: Session = Depends(get_read_db)):
+    # Gộp theo tên ngay trong DB (đi theo ix_foods_name) thay vì tải mọi món lên rồi gộp
+    final_price = models.Food.price * (1 - func.coalesce(models.Food.discount, 0) / 100.0)
+    query = db.query(models.Food.name, func.min(final_price), func.max(final_price), func.count(models.Food.id))
     if q: query = query.filter(models.Food.name.contains(q))
-    all_foods = query.all()
-    grouped = {}
-    for f in all_foods:
-        final_price = f.price * (1 - f.discount / 100)
-        if f.name not in grouped: grouped[f.name] = {"name": f.name, "min_price": final_price, "max_price": final_price, "branch_count": 1}
-        else:
-            if final_price < grouped[f.name]["min_price"]: grouped[f.name]["min_price"] = final_price
-            if final_price > grouped[f.name]["max_price"]: grouped[f.name]["max_price"] = final_price
-            grouped[f.name]["branch_count"] += 1
-    return list(grouped.values())
+    rows = query.group_by(models.Food.name).all()
+    return FastJSONResponse([{"name": name, "min_price": lo, "max_price": hi, "branch_count": count} for name, lo, hi, count in rows])
 
 @app.get("/foods/options")
-def get_food_options(name: str, db: Session = Depends(get_db)):
+def get_food_options(name: str, db: Session = Depends(get_read_db)):
     foods = db.query(models.Food).filter(models.Food.name == name).all()
     results = []
     for f in foods:
@@ -114,11 +244,23 @@ def get_food_options(name: str, db: Session = Depends(get_db)):
     results.sort(key=lambda x: x['final_price'])
     return results
 
+# Lấy nhiều món trong 1 lần (Order Service tính giá cả giỏ): ?ids=1,2,3
+FOOD_BATCH_LIMIT = int(os.getenv("FOOD_BATCH_LIMIT", 200))
+
+@app.get("/foods/batch")
+def get_foods_batch(ids: str, db: Session = Depends(get_db)):
+    try: food_ids = {int(x) for x in ids.split(",") if x.strip()}
+    except ValueError: raise HTTPException(400, "ids must be comma-separated integers")
+    if len(food_ids) > FOOD_BATCH_LIMIT: raise HTTPException(400, f"Too many ids (max {FOOD_BATCH_LIMIT})")
+    if not food_ids: return []
+    foods = db.query(models.Food.id, models.Food.name, models.Food.price, models.Food.discount, models.Food.branch_id).filter(models.Food.id.in_(food_ids))
+    return FastJSONResponse([{"id": f.id, "name": f.name, "price": f.price, "discount": f.discount, "branch_id": f.branch_id} for f in foods])
+
 # --- Thêm vào restaurant_service/main.py ---
 
 # API lấy chi tiết món ăn theo ID (Frontend gọi cái này để hiển thị trong Giỏ hàng)
 @app.get("/foods/{food_id}")
-def get_food_detail(food_id: int, db: Session = Depends(get_db)):
+def get_food_detail(food_id: int, db: Session = Depends(get_read_db)):
     # Tìm món ăn trong DB
     food = db.query(models.Food).filter(models.Food.id == food_id).first()
     
@@ -139,12 +281,126 @@ async def create_food(food: dict, request: Request, db: Session = Depends(get_db
     db.add(new_food)
     db.commit()
     db.refresh(new_food)
+    invalidate_menu_cache(new_food.branch_id, new_food.id)
     return new_food
 
-@app.get("/foods") 
-def read_foods(branch_id: int = None, db: Session = Depends(get_db)):
-    if branch_id: return db.query(models.Food).filter(models.Food.branch_id == branch_id).all()
-    return db.query(models.Food).all()
+# --- IMPORT MENU HÀNG LOẠT (CSV / NDJSON) ---
+def _iter_menu_rows(upload: UploadFile):
+    # Đọc file theo từng dòng, không nạp cả file vào RAM
+    text = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+    name = (upload.filename or "").lower()
+    ctype = (upload.content_type or "").lower()
+    if name.endswith((".ndjson", ".jsonl")) or "ndjson" in ctype or "jsonl" in ctype:
+        for line_no, line in enumerate(text, start=1):
+            if not line.strip(): continue
+            try: yield line_no, json.loads(line)
+            except ValueError: yield line_no, None
+    else:
+        # Dòng 1 là header: name,price,discount
+        for row_no, row in enumerate(csv.DictReader(text), start=2):
+            yield row_no, row
+
+def _validate_menu_row(row):
+    if not isinstance(row, dict): return None, "Dòng không đúng định dạng"
+    name = str(row.get("name") or "").strip()
+    if not name: return None, "Thiếu tên món"
+    if len(name) > 100: return None, "Tên món quá dài (tối đa 100 ký tự)"
+    try: price = float(row.get("price"))
+    except (TypeError, ValueError): return None, "Giá không hợp lệ"
+    if price < 0: return None, "Giá không được âm"
+    discount = row.get("discount")
+    try: discount = int(discount) if discount not in (None, "") else 0
+    except (TypeError, ValueError): return None, "Discount không hợp lệ"
+    if not 0 <= discount <= 100: return None, "Discount phải trong khoảng 0-100"
+    return {"name": name, "price": price, "discount": discount}, None
+
+def invalidate_menu_cache(branch_id: int, *food_ids: int):
+    # Gọi 1 lần sau mỗi lần ghi menu: đọc /foods, /foods?branch_id=... của quán này và
+    # /foods/{id} của món vừa ghi đi vào primary trong READ_YOUR_WRITES_SECONDS để không
+    # thấy menu cũ từ replica
+    read_router.mark_write(f"branch_id={branch_id}", "/foods", *[f"/foods/{food_id}" for food_id in food_ids])
+
+def _import_menu(db: Session, upload: UploadFile, branch_id: int):
+    # Đọc file + chèn DB đồng bộ: chạy trong threadpool (asyncio.to_thread), không chặn event loop
+    inserted, errors, chunk, truncated = 0, [], [], False
+    try:
+        for row_no, row in _iter_menu_rows(upload):
+            data, err = _validate_menu_row(row)
+            if err:
+                errors.append({"row": row_no, "error": err})
+                if len(errors) >= MENU_IMPORT_MAX_ERRORS:
+                    truncated = True
+                    break
+                continue
+            data["branch_id"] = branch_id
+            chunk.append(data)
+            if len(chunk) >= MENU_IMPORT_CHUNK_SIZE:
+                db.execute(insert(models.Food).values(chunk))
+                inserted += len(chunk)
+                chunk = []
+        if truncated:
+            # Dừng giữa chừng vì quá nhiều lỗi: bỏ cả phần đã đọc, sửa file rồi import lại
+            db.rollback()
+            inserted = 0
+        else:
+            if chunk:
+                db.execute(insert(models.Food).values(chunk))
+                inserted += len(chunk)
+            # Cả file nằm trong 1 transaction
+            db.commit()
+    except UnicodeDecodeError:
+        db.rollback()
+        raise HTTPException(400, "File phải là UTF-8")
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(500, str(e))
+    return {"inserted": inserted, "failed": len(errors), "errors": errors, "truncated": truncated, "committed": not truncated}
+
+@app.post("/foods/import")
+async def import_foods(request: Request, file: UploadFile = File(...), db: Session = Depends(get_db)):
+    # Verify token đúng 1 lần cho cả file
+    user = await verify_user(request)
+    if user['role'] != 'seller': raise HTTPException(403, "Only Seller")
+    if user.get('seller_mode') != 'owner': raise HTTPException(403, "Only Owner can add food")
+    branch_id = user.get('branch_id')
+    if not branch_id: raise HTTPException(400, "No branch")
+
+    result = await asyncio.to_thread(_import_menu, db, file, branch_id)
+    if result["inserted"]: invalidate_menu_cache(branch_id)
+    return result
+
+# --- SCHEMA TRẢ VỀ CỦA DANH SÁCH (để /docs mô tả; dữ liệu serialize thẳng qua FastJSONResponse) ---
+class RatingSummary(BaseModel):
+    rating_count: int
+    rating_avg: Optional[float] = None
+    rating_histogram: Dict[str, int]
+
+class FoodOut(RatingSummary):
+    id: int
+    name: str
+    price: float
+    discount: Optional[int] = None
+    branch_id: Optional[int] = None
+
+class BranchOut(RatingSummary):
+    id: int
+    name: str
+    address: Optional[str] = None
+    phone: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+@app.get("/foods", response_model=List[FoodOut])
+def read_foods(branch_id: int = None, sort: str = None, db: Session = Depends(get_read_db)):
+    # Kèm điểm đánh giá; sort=rating | rating_count
+    # Chỉ lấy cột (không nạp object ORM) rồi trả thẳng -> không qua jsonable_encoder
+    Food = models.Food
+    query = db.query(Food.id, Food.name, Food.price, Food.discount, Food.branch_id, *ratings.stats_columns(models.FoodRatingStats))
+    query = query.outerjoin(models.FoodRatingStats, models.FoodRatingStats.food_id == Food.id)
+    if branch_id: query = query.filter(Food.branch_id == branch_id)
+    order = ratings.rating_order_by(models.FoodRatingStats, sort)
+    if order: query = query.order_by(*order, Food.id)
+    return FastJSONResponse([{"id": r.id, "name": r.name, "price": r.price, "discount": r.discount, "branch_id": r.branch_id, **ratings.stats_to_dict(r)} for r in query])
 
 @app.delete("/foods/{food_id}")
 async def delete_food(food_id: int, request: Request, db: Session = Depends(get_db)):
@@ -157,16 +413,38 @@ async def delete_food(food_id: int, request: Request, db: Session = Depends(get_
     if item.branch_id != user.get('branch_id'): raise HTTPException(403, "Not your food")
     db.delete(item)
     db.commit()
+    invalidate_menu_cache(item.branch_id, food_id)
     return {"message": "Deleted"}
 
 @app.post("/branches")
 def create_branch(branch: dict, db: Session = Depends(get_db)):
-    new_b = models.Branch(name=branch['name'], address=branch.get('address'), phone=branch.get('phone'))
+    lat, lon = branch.get('latitude'), branch.get('longitude')
+    if (lat is None) != (lon is None): raise HTTPException(400, "latitude and longitude must be sent together")
+    if lat is not None:
+        try: lat, lon = float(lat), float(lon)
+        except (TypeError, ValueError): raise HTTPException(400, "Invalid coordinates")
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180): raise HTTPException(400, "Invalid coordinates")
+    new_b = models.Branch(name=branch['name'], address=branch.get('address'), phone=branch.get('phone'), latitude=lat, longitude=lon)
     db.add(new_b)
     db.commit()
     db.refresh(new_b) # Lấy ID
+    _index_branch(new_b)
+    read_router.mark_write("/branches")
     return new_b
 
-@app.get("/branches")
-def get_branches(db: Session = Depends(get_db)):
-    return db.query(models.Branch).all()
\ No newline at end of file
+@app.get("/branches/nearby")
+def get_nearby_branches(lat: float, lon: float, radius: float = 5, limit: int = 20):
+    # radius tính bằng km; trả về k quán gần nhất kèm khoảng cách
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180): raise HTTPException(400, "Invalid coordinates")
+    if radius <= 0 or radius > NEARBY_MAX_RADIUS_KM: raise HTTPException(400, f"radius must be in (0, {NEARBY_MAX_RADIUS_KM}]")
+    limit = max(1, min(limit, NEARBY_MAX_LIMIT))
+    return branch_index.nearby(lat, lon, radius, limit)
+
+@app.get("/branches", response_model=List[BranchOut])
+def get_branches(sort: str = None, db: Session = Depends(get_read_db)):
+    Branch = models.Branch
+    query = db.query(Branch.id, Branch.name, Branch.address, Branch.phone, Branch.latitude, Branch.longitude, *ratings.stats_columns(models.BranchRatingStats))
+    query = query.outerjoin(models.BranchRatingStats, models.BranchRatingStats.branch_id == Branch.id)
+    order = ratings.rating_order_by(models.BranchRatingStats, sort)
+    if order: query = query.order_by(*order, Branch.id)
+    return FastJSONResponse([{"id": r.id, "name": r.name, "address": r.address, "phone": r.phone, "latitude": r.latitude, "longitude": r.longitude, **ratings.stats_to_dict(r)} for r in query])
\ No newline at end of file
@@ -0,0 +1,9 @@
+"""Cột / index thêm vào branches, coupons sau bản đầu (create_all không sửa bảng cũ)."""
+from sqlalchemy import Float, Integer
+
+def upgrade(m):
+    m.add_column("branches", "latitude", Float())
+    m.add_column("branches", "longitude", Float())
+    m.add_column("coupons", "max_redemptions", Integer())
+    m.add_column("coupons", "per_user_limit", Integer())
+    m.create_index("ix_coupons_code_branch_active", "coupons", ["code", "branch_id", "is_active"])
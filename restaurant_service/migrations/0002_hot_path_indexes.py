@@ -0,0 +1,5 @@
+"""Menu theo quán (foods.branch_id) và tìm món theo tên (foods.name, GROUP BY name)."""
+
+def upgrade(m):
+    m.create_index("ix_foods_branch_id", "foods", ["branch_id"])
+    m.create_index("ix_foods_name", "foods", ["name"])
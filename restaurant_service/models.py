@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Boolean, DateTime, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from database import Base
 import datetime
@@ -10,6 +10,9 @@ class Branch(Base):
     name = Column(String(100), index=True)
     address = Column(String(200))
     phone = Column(String(20))
+    # Toạ độ để tìm quán gần nhất
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
     
     foods = relationship("Food", back_populates="branch")
     coupons = relationship("Coupon", back_populates="branch")
@@ -21,11 +24,13 @@ class Food(Base):
     price = Column(Float)
     discount = Column(Integer, default=0) 
     
-    branch_id = Column(Integer, ForeignKey("branches.id"))
+    branch_id = Column(Integer, ForeignKey("branches.id"), index=True)
     branch = relationship("Branch", back_populates="foods")
 
 class Coupon(Base):
     __tablename__ = "coupons"
+    # Index ghép cho đường verify: WHERE code = ? AND branch_id = ? AND is_active
+    __table_args__ = (Index("ix_coupons_code_branch_active", "code", "branch_id", "is_active"),)
     id = Column(Integer, primary_key=True, index=True)
     code = Column(String(50), index=True)
     discount_percent = Column(Integer)
@@ -33,6 +38,34 @@ class Coupon(Base):
     branch = relationship("Branch", back_populates="coupons")
     is_active = Column(Boolean, default=True)
 
+    # Giới hạn lượt dùng (NULL = không giới hạn)
+    max_redemptions = Column(Integer, nullable=True)
+    per_user_limit = Column(Integer, nullable=True)
+
+# Bộ đếm lượt còn lại được chia thành nhiều shard để checkout đồng thời
+# không cùng tranh 1 dòng bị khoá
+class CouponCounterShard(Base):
+    __tablename__ = "coupon_counter_shards"
+    coupon_id = Column(Integer, ForeignKey("coupons.id"), primary_key=True)
+    shard_no = Column(Integer, primary_key=True)
+    remaining = Column(Integer, nullable=False, default=0)
+
+# Mỗi lượt dùng coupon: RESERVED khi tạo đơn -> CONFIRMED khi thanh toán,
+# hoặc bị xoá (trả lượt về shard) khi hết hạn giữ chỗ
+class CouponRedemption(Base):
+    __tablename__ = "coupon_redemptions"
+    # slot = lượt thứ mấy của user với coupon này -> unique để chặn vượt per_user_limit
+    __table_args__ = (UniqueConstraint("coupon_id", "user_id", "slot", name="uq_redemption_user_slot"),)
+    id = Column(Integer, primary_key=True, index=True)
+    coupon_id = Column(Integer, ForeignKey("coupons.id"), index=True)
+    user_id = Column(Integer, nullable=True)
+    slot = Column(Integer, nullable=True)
+    shard_no = Column(Integer, nullable=True)
+    order_id = Column(Integer, nullable=True)
+    status = Column(String(20), default="RESERVED")
+    expires_at = Column(DateTime, index=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
 # --- BẢNG MỚI: REVIEW ---
 
 # 1. Bảng Cha: Đánh giá chung đơn hàng
@@ -63,4 +96,30 @@ class FoodRating(Base):
     parent_review = relationship("OrderReview", back_populates="details")
     
     food_id = Column(Integer, ForeignKey("foods.id"))
-    score = Column(Integer) # Điểm số món (1-5)
\ No newline at end of file
+    score = Column(Integer) # Điểm số món (1-5)
+
+# --- BẢNG TỔNG HỢP ĐIỂM (cập nhật dần trong create_review) ---
+class BranchRatingStats(Base):
+    __tablename__ = "branch_rating_stats"
+
+    branch_id = Column(Integer, ForeignKey("branches.id"), primary_key=True)
+    rating_count = Column(Integer, default=0, nullable=False)
+    rating_sum = Column(Integer, default=0, nullable=False)
+    # Histogram 1-5 sao
+    star_1 = Column(Integer, default=0, nullable=False)
+    star_2 = Column(Integer, default=0, nullable=False)
+    star_3 = Column(Integer, default=0, nullable=False)
+    star_4 = Column(Integer, default=0, nullable=False)
+    star_5 = Column(Integer, default=0, nullable=False)
+
+class FoodRatingStats(Base):
+    __tablename__ = "food_rating_stats"
+
+    food_id = Column(Integer, ForeignKey("foods.id"), primary_key=True)
+    rating_count = Column(Integer, default=0, nullable=False)
+    rating_sum = Column(Integer, default=0, nullable=False)
+    star_1 = Column(Integer, default=0, nullable=False)
+    star_2 = Column(Integer, default=0, nullable=False)
+    star_3 = Column(Integer, default=0, nullable=False)
+    star_4 = Column(Integer, default=0, nullable=False)
+    star_5 = Column(Integer, default=0, nullable=False)
@@ -0,0 +1,101 @@
+import os
+from sqlalchemy import func, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import models
+
+BACKFILL_BATCH_SIZE = int(os.getenv("RATING_BACKFILL_BATCH_SIZE", 1000))
+STARS = (1, 2, 3, 4, 5)
+
+def _key_column(stats_model):
+    return stats_model.branch_id if stats_model is models.BranchRatingStats else stats_model.food_id
+
+# --- CẬP NHẬT DẦN (gọi trong transaction của create_review) ---
+def bump_rating(db: Session, stats_model, key: int, score: int):
+    key_col = _key_column(stats_model)
+    star_col = getattr(stats_model, f"star_{score}")
+    values = {
+        stats_model.rating_count: stats_model.rating_count + 1,
+        stats_model.rating_sum: stats_model.rating_sum + score,
+        star_col: star_col + 1,
+    }
+    # UPDATE có điều kiện: cộng ngay trong DB, không đọc-sửa-ghi
+    if db.query(stats_model).filter(key_col == key).update(values, synchronize_session=False):
+        return
+    # Chưa có dòng -> tạo mới; nếu request khác vừa tạo xong thì quay lại UPDATE
+    try:
+        with db.begin_nested():
+            db.add(stats_model(**{key_col.key: key, "rating_count": 1, "rating_sum": score, f"star_{score}": 1}))
+    except IntegrityError:
+        db.query(stats_model).filter(key_col == key).update(values, synchronize_session=False)
+
+# Cột cần cho stats_to_dict: query thẳng các cột này (kèm cột của món / quán) thay vì nạp object
+def stats_columns(stats_model):
+    return [stats_model.rating_count, stats_model.rating_sum] + [getattr(stats_model, f"star_{s}") for s in STARS]
+
+def stats_to_dict(stats):
+    if stats is None or not stats.rating_count:
+        return {"rating_count": 0, "rating_avg": None, "rating_histogram": {str(s): 0 for s in STARS}}
+    return {
+        "rating_count": stats.rating_count,
+        "rating_avg": round(stats.rating_sum / stats.rating_count, 2),
+        "rating_histogram": {str(s): getattr(stats, f"star_{s}") for s in STARS},
+    }
+
+def rating_order_by(stats_model, sort: str):
+    # sort=rating -> điểm TB giảm dần, sort=rating_count -> số lượt đánh giá giảm dần
+    count = func.coalesce(stats_model.rating_count, 0)
+    if sort == "rating":
+        avg = func.coalesce(stats_model.rating_sum * 1.0 / func.nullif(stats_model.rating_count, 0), 0)
+        return [avg.desc(), count.desc()]
+    if sort == "rating_count":
+        return [count.desc()]
+    return None
+
+# --- BACKFILL: dựng lại toàn bộ từ lịch sử review theo từng batch ---
+def _empty_row():
+    return {"rating_count": 0, "rating_sum": 0, **{f"star_{s}": 0 for s in STARS}}
+
+def _add(acc, key, score):
+    if score not in STARS: return
+    row = acc.setdefault(key, _empty_row())
+    row["rating_count"] += 1
+    row["rating_sum"] += score
+    row[f"star_{score}"] += 1
+
+def _scan(db: Session, id_col, key_col, score_col, acc, batch_size):
+    # Keyset pagination theo id để mỗi batch là 1 query nhỏ
+    last_id = 0
+    while True:
+        rows = db.query(id_col, key_col, score_col).filter(id_col > last_id).order_by(id_col).limit(batch_size).all()
+        if not rows: break
+        for _, key, score in rows:
+            if key is not None: _add(acc, key, score)
+        last_id = rows[-1][0]
+
+def _write(db: Session, stats_model, acc, batch_size):
+    key_name = _key_column(stats_model).key
+    db.query(stats_model).delete(synchronize_session=False)
+    rows = [{key_name: key, **row} for key, row in acc.items()]
+    for i in range(0, len(rows), batch_size):
+        db.execute(insert(stats_model).values(rows[i:i + batch_size]))
+
+def rebuild_rating_stats(db: Session, batch_size: int = BACKFILL_BATCH_SIZE):
+    branch_acc, food_acc = {}, {}
+    _scan(db, models.OrderReview.id, models.OrderReview.branch_id, models.OrderReview.rating_general, branch_acc, batch_size)
+    _scan(db, models.FoodRating.id, models.FoodRating.food_id, models.FoodRating.score, food_acc, batch_size)
+    # Ghi lại trong 1 transaction để bảng tổng hợp không bao giờ ở trạng thái nửa vời
+    _write(db, models.BranchRatingStats, branch_acc, batch_size)
+    _write(db, models.FoodRatingStats, food_acc, batch_size)
+    db.commit()
+    return {"branches": len(branch_acc), "foods": len(food_acc)}
+
+if __name__ == "__main__":
+    # Chạy: python ratings.py
+    from database import SessionLocal, engine, Base
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        print(rebuild_rating_stats(db))
+    finally:
+        db.close()
@@ -0,0 +1,47 @@
+import os
+import sys
+import importlib
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from common.migrations import run_migrations
+
+PREFIXES = {"cart_service": "CART", "order_service": "ORDER", "payment_service": "PAYMENT", "restaurant_service": "RESTAURANT", "user_service": "USER"}
+
+class Service:
+    """database + models của 1 service trên SQLite trong RAM (mỗi service có module cùng tên)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.dir = os.path.join(ROOT, name)
+        self.migrations_dir = os.path.join(self.dir, "migrations")
+        os.environ[f"{PREFIXES[name]}_DATABASE_URL"] = "sqlite://"
+        for module in ("database", "models"): sys.modules.pop(module, None)
+        sys.path.insert(0, self.dir)
+        try:
+            self.database = importlib.import_module("database")
+            self.models = importlib.import_module("models")
+        finally:
+            sys.path.remove(self.dir)
+            for module in ("database", "models"): sys.modules.pop(module, None)
+        self.engine = self.database.engine
+        self.Base = self.database.Base
+
+    def migrate(self):
+        return run_migrations(self.engine, self.migrations_dir, verbose=False)
+
+    def session(self):
+        return self.database.SessionLocal()
+
+@pytest.fixture
+def service():
+    """service("order_service") -> schema đầy đủ: create_all + migrations, như lúc app khởi động."""
+    def load(name, create=True):
+        svc = Service(name)
+        if create:
+            svc.Base.metadata.create_all(bind=svc.engine)
+            svc.migrate()
+        return svc
+    return load
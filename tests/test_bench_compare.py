@@ -0,0 +1,34 @@
+import os
+import sys
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "perf"))
+from bench import compare, mann_whitney_p
+
+def run(samples, queries=1.0, calls=0.0):
+    return {"meta": {}, "benchmarks": {"search_foods": {
+        "median_ms": sorted(samples)[len(samples) // 2], "samples_ms": samples,
+        "queries_per_op": queries, "upstream_calls_per_op": calls}}}
+
+def samples(center, n=200, seed=1):
+    rng = random.Random(seed)
+    return [center + rng.gauss(0, center * 0.05) for _ in range(n)]
+
+def test_mann_whitney_separates_shifted_samples():
+    assert mann_whitney_p(samples(2.0, seed=1), samples(2.0, seed=2)) > 0.05
+    assert mann_whitney_p(samples(2.0, seed=1), samples(2.4, seed=2)) < 0.001
+    assert mann_whitney_p([1.0] * 50, [1.0] * 50) == 1.0
+
+def test_compare_verdicts():
+    base = run(samples(2.0, seed=1))
+    [(_, verdict, _)] = compare(base, run(samples(2.0, seed=2)))
+    assert verdict == "same"
+    [(_, verdict, _)] = compare(base, run(samples(2.5, seed=2)))
+    assert verdict == "slower"
+    [(_, verdict, _)] = compare(base, run(samples(1.5, seed=2)))
+    assert verdict == "faster"
+
+def test_extra_query_is_a_regression_without_timing_change():
+    [(_, verdict, detail)] = compare(run(samples(2.0, seed=1)), run(samples(2.0, seed=2), queries=2.0))
+    assert verdict == "regression"
+    assert detail["counters"] == ["+1.00 SQL/op"]
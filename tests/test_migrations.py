@@ -0,0 +1,86 @@
+import pytest
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+from common.migrations import applied_versions, discover
+
+def index_names(engine, table):
+    insp = inspect(engine)
+    return {i["name"] for i in insp.get_indexes(table)} | {u["name"] for u in insp.get_unique_constraints(table)}
+
+def test_fresh_database_records_every_version(service):
+    svc = service("order_service")
+    assert applied_versions(svc.engine) == {version for version, _, _ in discover(svc.migrations_dir)}
+    assert svc.migrate() == []
+
+def test_legacy_order_indexes_are_rebuilt(service):
+    svc = service("order_service", create=False)
+    with svc.engine.begin() as conn:
+        # Schema bản đầu: index đơn trên user_id / branch_id, chưa có coupon_reservation_id
+        conn.execute(text(
+            "CREATE TABLE orders (id INTEGER PRIMARY KEY, user_id INTEGER, user_name VARCHAR(100), branch_id INTEGER, "
+            "total_price FLOAT, status VARCHAR(50), created_at DATETIME, delivery_address VARCHAR(255), "
+            "customer_phone VARCHAR(20), note VARCHAR(500), coupon_code VARCHAR(50), discount_amount FLOAT)"))
+        conn.execute(text("CREATE INDEX ix_orders_user_id ON orders (user_id)"))
+        conn.execute(text("CREATE INDEX ix_orders_branch_id ON orders (branch_id)"))
+        conn.execute(text("INSERT INTO orders (id, user_id, branch_id, status) VALUES (1, 7, 3, 'PAID')"))
+    svc.Base.metadata.create_all(bind=svc.engine)
+    assert svc.migrate() == ["0001", "0002", "0003"]
+    names = index_names(svc.engine, "orders")
+    assert {"ix_orders_branch_created", "ix_orders_user_created", "ix_orders_branch_user"} <= names
+    assert not {"ix_orders_user_id", "ix_orders_branch_id"} & names
+    assert "coupon_reservation_id" in {c["name"] for c in inspect(svc.engine).get_columns("orders")}
+    assert "ix_order_items_order_id" in index_names(svc.engine, "order_items")
+    with svc.engine.connect() as conn:
+        assert conn.execute(text("SELECT user_id, branch_id, status FROM orders")).fetchall() == [(7, 3, "PAID")]
+    assert svc.migrate() == []
+
+def test_legacy_users_get_token_version(service):
+    svc = service("user_service", create=False)
+    with svc.engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE users (id INTEGER PRIMARY KEY, name VARCHAR(100), email VARCHAR(100), hashed_password VARCHAR(200), "
+            "role VARCHAR(20), seller_mode VARCHAR(20), managed_branch_id INTEGER, phone VARCHAR(20), address VARCHAR(255))"))
+        conn.execute(text("CREATE TABLE user_addresses (id INTEGER PRIMARY KEY, user_id INTEGER, title VARCHAR(50), address VARCHAR(255), phone VARCHAR(20))"))
+        conn.execute(text("INSERT INTO users (id, email) VALUES (1, 'a@b.c')"))
+    svc.Base.metadata.create_all(bind=svc.engine)
+    svc.migrate()
+    with svc.engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, email) VALUES (2, 'd@e.f')"))
+        assert conn.execute(text("SELECT id, token_version FROM users ORDER BY id")).fetchall() == [(1, 0), (2, 0)]
+    assert "ix_user_addresses_user_id" in index_names(svc.engine, "user_addresses")
+
+def test_legacy_cart_duplicates_are_merged(service):
+    svc = service("cart_service", create=False)
+    with svc.engine.begin() as conn:
+        conn.execute(text("CREATE TABLE cart_items (id INTEGER PRIMARY KEY, user_id INTEGER, food_id INTEGER, quantity INTEGER, branch_id INTEGER)"))
+        conn.execute(text("CREATE INDEX ix_cart_items_user_id ON cart_items (user_id)"))
+        conn.execute(text("INSERT INTO cart_items (id, user_id, food_id, quantity, branch_id) VALUES "
+                          "(1, 1, 10, 2, 5), (2, 1, 11, 1, 5), (3, 1, 10, 3, 5), (4, 2, 10, 1, 5)"))
+    svc.Base.metadata.create_all(bind=svc.engine)
+    svc.migrate()
+    with svc.engine.connect() as conn:
+        rows = conn.execute(text("SELECT id, user_id, food_id, quantity FROM cart_items ORDER BY id")).fetchall()
+    assert rows == [(1, 1, 10, 5), (2, 1, 11, 1), (4, 2, 10, 1)]
+    # Giỏ cũ có mốc updated_at -> máy dọn giỏ thấy được
+    with svc.engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM cart_items WHERE updated_at IS NULL")).scalar() == 0
+    names = index_names(svc.engine, "cart_items")
+    assert {"uq_cart_user_food", "ix_cart_items_updated_at"} <= names
+    assert "ix_cart_items_user_id" not in names
+
+def test_legacy_payments_get_active_order_key(service):
+    svc = service("payment_service", create=False)
+    with svc.engine.begin() as conn:
+        conn.execute(text("CREATE TABLE payments (id INTEGER PRIMARY KEY, order_id INTEGER, amount FLOAT, transaction_id VARCHAR(100), "
+                          "status VARCHAR(50), created_at DATETIME)"))
+        # Chế độ sync từng cho phép 2 payment SUCCESS cho 1 đơn
+        conn.execute(text("INSERT INTO payments (id, order_id, status) VALUES (1, 5, 'SUCCESS'), (2, 5, 'SUCCESS'), (3, 6, 'FAILED'), (4, 6, 'PENDING')"))
+    svc.Base.metadata.create_all(bind=svc.engine)
+    svc.migrate()
+    with svc.engine.begin() as conn:
+        assert conn.execute(text("SELECT id, active_order_id FROM payments ORDER BY id")).fetchall() == [(1, 5), (2, None), (3, None), (4, 6)]
+    assert "uq_payments_active_order" in index_names(svc.engine, "payments")
+    db = svc.session()
+    db.add(svc.models.Payment(order_id=6, active_order_id=6, transaction_id="PAY_DUP", status="PENDING"))
+    with pytest.raises(IntegrityError): db.commit()
+    db.close()
@@ -0,0 +1,136 @@
+"""EXPLAIN QUERY PLAN cho các truy vấn nóng: hỏng nếu quay lại quét cả bảng hoặc phải sort tạm.
+
+Truy vấn dựng lại đúng như trong service; index mong đợi phải xuất hiện trong plan.
+"""
+import re
+import datetime
+import pytest
+from sqlalchemy import func
+
+def explain(session, query):
+    stmt = query.statement if hasattr(query, "statement") else query
+    compiled = stmt.compile(dialect=session.bind.dialect, compile_kwargs={"render_postcompile": True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    with session.bind.connect() as conn:
+        return [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params)]
+
+def assert_plan(plan, uses=None, allow_index_scan=False):
+    text = "\n".join(plan)
+    for line in plan:
+        assert not re.match(r"^SCAN \w+$", line), f"full table scan:\n{text}"
+        assert "TEMP B-TREE" not in line, f"sort / group in temp b-tree:\n{text}"
+        if not allow_index_scan: assert not line.startswith("SCAN "), f"full index scan:\n{text}"
+    # uses: tên index, hoặc điều kiện index khi SQLite tự đặt tên (UNIQUE trong CREATE TABLE)
+    if uses: assert uses in text, f"{uses} not used:\n{text}"
+
+NOW = datetime.datetime(2026, 1, 1)
+
+def test_orders_by_branch_newest_first(service):
+    svc = service("order_service")
+    Order = svc.models.Order
+    plan = explain(svc.session(), svc.session().query(Order).filter(Order.branch_id == 1).order_by(Order.created_at.desc()))
+    assert_plan(plan, "ix_orders_branch_created")
+
+def test_orders_by_user_newest_first(service):
+    svc = service("order_service")
+    Order = svc.models.Order
+    plan = explain(svc.session(), svc.session().query(Order).filter(Order.user_id == 1).order_by(Order.created_at.desc()))
+    assert_plan(plan, "ix_orders_user_created")
+
+def test_branch_customers(service):
+    svc = service("order_service")
+    Order = svc.models.Order
+    db = svc.session()
+    query = db.query(Order.user_id).filter(Order.user_id.in_([1, 2, 3]), Order.branch_id == 1).distinct()
+    assert_plan(explain(db, query), "ix_orders_branch_user")
+
+def test_order_items_by_order(service):
+    svc = service("order_service")
+    OrderItem = svc.models.OrderItem
+    assert_plan(explain(svc.session(), svc.session().query(OrderItem).filter(OrderItem.order_id == 1)), "ix_order_items_order_id")
+
+def test_order_ledger_keyset(service):
+    svc = service("order_service")
+    Order = svc.models.Order
+    query = svc.session().query(Order.id, Order.status, Order.total_price).filter(Order.id > 0).order_by(Order.id).limit(1000)
+    assert_plan(explain(svc.session(), query))
+
+def test_cart_items_by_user_and_food(service):
+    svc = service("cart_service")
+    CartItem = svc.models.CartItem
+    db = svc.session()
+    assert_plan(explain(db, db.query(CartItem).filter(CartItem.user_id == 1, CartItem.food_id == 2)), "(user_id=? AND food_id=?)")
+    assert_plan(explain(db, db.query(CartItem).filter(CartItem.user_id == 1)), "(user_id=?)")
+
+def test_cart_expiry_scan(service):
+    svc = service("cart_service")
+    CartItem = svc.models.CartItem
+    db = svc.session()
+    assert_plan(explain(db, db.query(CartItem.user_id).filter(CartItem.updated_at < NOW)), "ix_cart_items_updated_at")
+
+def test_coupon_verify(service):
+    svc = service("restaurant_service")
+    Coupon = svc.models.Coupon
+    db = svc.session()
+    query = db.query(Coupon).filter(Coupon.code == "SALE10", Coupon.branch_id == 1, Coupon.is_active == True)  # noqa: E712
+    assert_plan(explain(db, query), "ix_coupons_code_branch_active")
+
+def test_coupon_redemptions_expired(service):
+    svc = service("restaurant_service")
+    Redemption = svc.models.CouponRedemption
+    db = svc.session()
+    query = db.query(Redemption).filter(Redemption.status == "RESERVED", Redemption.expires_at < NOW)
+    assert_plan(explain(db, query), "ix_coupon_redemptions_expires_at")
+
+def test_menu_by_branch(service):
+    svc = service("restaurant_service")
+    Food = svc.models.Food
+    db = svc.session()
+    assert_plan(explain(db, db.query(Food).filter(Food.branch_id == 1)), "ix_foods_branch_id")
+
+def test_food_options_by_name(service):
+    svc = service("restaurant_service")
+    Food = svc.models.Food
+    db = svc.session()
+    assert_plan(explain(db, db.query(Food).filter(Food.name == "Phở bò")), "ix_foods_name")
+
+def test_food_search_groups_by_name(service):
+    svc = service("restaurant_service")
+    Food = svc.models.Food
+    db = svc.session()
+    final_price = Food.price * (1 - func.coalesce(Food.discount, 0) / 100.0)
+    query = db.query(Food.name, func.min(final_price), func.max(final_price), func.count(Food.id)).group_by(Food.name)
+    # Không có q: phải đọc mọi món, nhưng theo thứ tự của ix_foods_name, không sort tạm
+    assert_plan(explain(db, query), "ix_foods_name", allow_index_scan=True)
+
+def test_user_addresses(service):
+    svc = service("user_service")
+    UserAddress = svc.models.UserAddress
+    db = svc.session()
+    assert_plan(explain(db, db.query(UserAddress).filter(UserAddress.user_id == 1)), "ix_user_addresses_user_id")
+    batch = db.query(UserAddress).filter(UserAddress.user_id.in_([1, 2, 3])).order_by(UserAddress.user_id, UserAddress.id)
+    assert_plan(explain(db, batch), "ix_user_addresses_user_id")
+
+def test_login_and_refresh_lookups(service):
+    svc = service("user_service")
+    User, RefreshToken, RevokedToken = svc.models.User, svc.models.RefreshToken, svc.models.RevokedToken
+    db = svc.session()
+    assert_plan(explain(db, db.query(User).filter(User.email == "a@b.c")), "ix_users_email")
+    assert_plan(explain(db, db.query(RefreshToken).filter(RefreshToken.token_hash == "x" * 64)), "ix_refresh_tokens_token_hash")
+    assert_plan(explain(db, db.query(RevokedToken).filter(RevokedToken.expires_at > NOW)), "ix_revoked_tokens_expires_at")
+    # Dọn token hết hạn (sessions.purge_expired)
+    assert_plan(explain(db, db.query(RefreshToken.id).filter(RefreshToken.expires_at < NOW).limit(1000)), "ix_refresh_tokens_expires_at")
+
+@pytest.mark.parametrize("column, index", [("order_id", "ix_payments_order_id"), ("provider_ref", "ix_payments_provider_ref")])
+def test_payment_lookups(service, column, index):
+    svc = service("payment_service")
+    Payment = svc.models.Payment
+    db = svc.session()
+    assert_plan(explain(db, db.query(Payment).filter(getattr(Payment, column) == 1)), index)
+
+def test_payment_history_page(service):
+    svc = service("payment_service")
+    Payment = svc.models.Payment
+    db = svc.session()
+    query = db.query(Payment).filter(Payment.created_at >= NOW, Payment.id < 100).order_by(Payment.id.desc()).limit(50)
+    assert_plan(explain(db, query))
@@ -0,0 +1,34 @@
+import json
+import datetime
+from decimal import Decimal
+import pytest
+from fastapi.encoders import jsonable_encoder
+
+import common.responses as responses
+from common.responses import FastJSONResponse, dumps
+
+ROWS = [{
+    "id": 1, "name": "Cơm Tấm Sườn Bì", "price": 45000.0, "discount": None, "created_at": datetime.datetime(2026, 1, 2, 3, 4, 5, 678),
+    "rating_histogram": {"1": 0, "5": 2}, "total": Decimal("12.50"),
+}]
+
+@pytest.fixture(params=["orjson", "json"])
+def backend(request, monkeypatch):
+    if request.param == "json": monkeypatch.setattr(responses, "orjson", None)
+    elif responses.orjson is None: pytest.skip("orjson not installed")
+    return request.param
+
+def test_same_json_as_default_fastapi_path(backend):
+    # Cùng nội dung với jsonable_encoder + JSONResponse mà các endpoint dùng trước đây
+    expected = json.loads(json.dumps(jsonable_encoder(ROWS), ensure_ascii=False))
+    assert json.loads(dumps(ROWS)) == expected
+    assert "Cơm Tấm".encode("utf-8") in dumps(ROWS)
+
+def test_non_string_keys(backend):
+    assert json.loads(dumps({1: "a"})) == {"1": "a"}
+
+def test_pre_serialized_bytes_are_sent_as_is(backend):
+    body = b'[{"id":1}]'
+    res = FastJSONResponse(body)
+    assert res.body == body
+    assert res.headers["content-type"] == "application/json"
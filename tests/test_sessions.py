@@ -0,0 +1,51 @@
+import sys
+import asyncio
+import importlib
+from datetime import datetime, timedelta
+import pytest
+
+@pytest.fixture
+def sessions(service, monkeypatch):
+    """user_service/sessions.py gắn với models của service SQLite trong RAM."""
+    svc = service("user_service")
+    monkeypatch.setitem(sys.modules, "models", svc.models)
+    monkeypatch.syspath_prepend(svc.dir)
+    monkeypatch.delitem(sys.modules, "sessions", raising=False)
+    module = importlib.import_module("sessions")
+    monkeypatch.delitem(sys.modules, "sessions")
+    return svc, module
+
+def test_purge_expired_tokens(sessions):
+    svc, sessions = sessions
+    RefreshToken, RevokedToken = svc.models.RefreshToken, svc.models.RevokedToken
+    now = datetime.utcnow()
+    db = svc.session()
+    db.add_all([RevokedToken(user_id=1, jti=f"old{i}", expires_at=now - timedelta(minutes=i + 1)) for i in range(5)])
+    db.add(RevokedToken(user_id=1, jti="live", expires_at=now + timedelta(minutes=5)))
+    db.add_all([RefreshToken(user_id=1, token_hash=f"{i:064d}", family_id="f", created_at=now, expires_at=now - timedelta(days=1)) for i in range(3)])
+    live = sessions.issue_refresh_token(db, 1)
+    db.commit()
+    # Lô nhỏ hơn số dòng cần xoá: vẫn xoá hết
+    assert sessions.purge_expired(db, batch_size=2) == 8
+    assert [r.jti for r in db.query(RevokedToken)] == ["live"]
+    assert db.query(RefreshToken).count() == 1
+    assert sessions.purge_expired(db) == 0
+
+def test_revocation_sync_purges_periodically(sessions):
+    svc, sessions = sessions
+    RevokedToken = svc.models.RevokedToken
+    db = svc.session()
+    db.add(RevokedToken(user_id=1, jti="old", expires_at=datetime.utcnow() - timedelta(minutes=1)))
+    db.commit()
+
+    async def run():
+        sync = sessions.RevocationSync(svc.database.SessionLocal, interval=0.01, purge_interval=0)
+        await sync.start()
+        for _ in range(100):
+            if sync.stats["purged"]: break
+            await asyncio.sleep(0.01)
+        await sync.stop()
+        return sync.stats["purged"]
+
+    assert asyncio.run(run()) == 1
+    assert db.query(RevokedToken).count() == 0
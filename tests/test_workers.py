@@ -0,0 +1,131 @@
+import os
+import json
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+from common import serve
+from common.db import ReadRouter, pool_budget
+from common.workers import setup_worker
+
+def test_worker_count(monkeypatch):
+    monkeypatch.setattr(serve, "available_cpus", lambda: 8)
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    assert serve.worker_count() == 8
+    # Service giữ state trong RAM
+    assert serve.worker_count(max_workers=1) == 1
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    assert serve.worker_count() == 3
+    assert serve.worker_count(requested=2) == 2
+    monkeypatch.setenv("WEB_CONCURRENCY", "")
+    assert serve.worker_count() == 8
+
+def test_pool_budget_split_across_workers(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "10")
+    monkeypatch.setenv("DB_MAX_OVERFLOW", "20")
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    assert pool_budget("ORDER") == (10, 20)
+    # 8 worker vẫn chỉ mở tối đa 30 kết nối cho cả service
+    monkeypatch.setenv("WEB_CONCURRENCY", "8")
+    assert pool_budget("ORDER") == (1, 2)
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    monkeypatch.setenv("RESTAURANT_DB_POOL_SIZE", "40")
+    assert pool_budget("RESTAURANT") == (10, 5)
+
+def test_cgroup_quota_caps_cpus(monkeypatch):
+    monkeypatch.setattr(serve.os, "sched_getaffinity", lambda pid: set(range(16)), raising=False)
+    monkeypatch.setattr(serve, "_cgroup_cpu_quota", lambda: 2.5)
+    assert serve.available_cpus() == 3
+    monkeypatch.setattr(serve, "_cgroup_cpu_quota", lambda: None)
+    assert serve.available_cpus() == 16
+
+def make_app(tmp_path, warmups=()):
+    app = FastAPI()
+    engine = create_engine(f"sqlite:///{tmp_path}/w.db")
+    setup_worker(app, engines={"primary": engine}, warmups=warmups)
+
+    @app.get("/ok")
+    def ok():
+        return {"ok": True}
+
+    @app.get("/boom")
+    def boom():
+        raise RuntimeError("boom")
+
+    return app
+
+def test_warm_up_and_request_counters(tmp_path, monkeypatch):
+    monkeypatch.delenv("WORKER_STATS_DIR", raising=False)
+    calls = []
+
+    async def warm_cache():
+        calls.append("cache")
+
+    def broken():
+        raise RuntimeError("upstream down")
+
+    # Warm-up lỗi không chặn worker khởi động
+    with TestClient(make_app(tmp_path, warmups=[warm_cache, broken]), raise_server_exceptions=False) as client:
+        assert calls == ["cache"]
+        client.get("/ok")
+        assert client.get("/boom").status_code == 500
+        stats = client.get("/metrics/worker").json()
+    assert stats["pid"] == os.getpid()
+    assert stats["ready"] and stats["warmup_ms"] is not None
+    # 2 request đã xong + chính request /metrics/worker đang chạy
+    assert (stats["requests"], stats["in_flight"], stats["errors_5xx"]) == (2, 1, 1)
+    # Pool đã mở đủ pool_size kết nối trước request đầu tiên
+    pool = stats["db"]["primary"]
+    assert pool["checked_in"] == pool["size"] > 1
+
+def test_all_workers_reads_live_snapshots(tmp_path, monkeypatch):
+    stats_dir = tmp_path / "stats"
+    monkeypatch.setenv("WORKER_STATS_DIR", str(stats_dir))
+    # Worker khác còn sống (dùng pid của process cha) và 1 worker đã chết
+    stats_dir.mkdir()
+    (stats_dir / f"{os.getppid()}.json").write_text(json.dumps({"pid": os.getppid(), "requests": 7}))
+    dead = 2 ** 22 + 1
+    (stats_dir / f"{dead}.json").write_text(json.dumps({"pid": dead, "requests": 1}))
+    with TestClient(make_app(tmp_path)) as client:
+        body = client.get("/metrics/worker", params={"all": "true"}).json()
+    assert {w["pid"] for w in body["workers"]} == {os.getpid(), os.getppid()}
+    assert body["requests"] == 7
+    assert not (stats_dir / f"{dead}.json").exists()
+    # Shutdown xoá snapshot của chính worker
+    assert not (stats_dir / f"{os.getpid()}.json").exists()
+
+def test_read_your_writes_pins_shared_between_workers(tmp_path):
+    # 2 worker cùng service: ghi ở worker a, đọc ở worker b vẫn phải vào primary
+    pin_dir = str(tmp_path / "pins")
+    a, b = (ReadRouter(lambda: "primary", lambda: "replica", pin_dir=pin_dir) for _ in range(2))
+    a.mark_write("branch_id=1", None, "/foods/7")
+    assert b.session(["/foods", "branch_id=1"]) == "primary"
+    assert b.session(["/foods/7"]) == "primary"
+    assert b.session(["/foods", "branch_id=2"]) == "replica"
+    # Hết hạn ghim -> replica; file hết hạn được dọn
+    c = ReadRouter(lambda: "primary", lambda: "replica", pin_seconds=-1, pin_dir=pin_dir)
+    c.mark_write("order_id=3")
+    assert b.session(["order_id=3"]) == "replica"
+    a._prune_shared_pins()
+    assert len(os.listdir(pin_dir)) == 2
+
+GATEWAY_WITHOUT_SQLALCHEMY = """
+import os, sys
+sys.modules["sqlalchemy"] = None  # image gateway không cài sqlalchemy
+sys.path[:0] = [{root!r}, os.path.join({root!r}, "gateway_service")]
+os.chdir(os.path.join({root!r}, "gateway_service"))
+import uvicorn
+uvicorn.run = lambda *args, **kwargs: None
+from fastapi.testclient import TestClient
+import main
+with TestClient(main.app) as client: assert client.get("/metrics/worker").json()["db"] == {{}}
+from common import serve
+serve.main(["--workers", "2"])
+"""
+
+def test_gateway_runs_without_sqlalchemy(tmp_path):
+    import subprocess, sys
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "WORKER_STATS_DIR": str(tmp_path)}
+    result = subprocess.run([sys.executable, "-c", GATEWAY_WITHOUT_SQLALCHEMY.format(root=root)], capture_output=True, text=True, env=env)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,74 @@
+"""Băm / kiểm tra mật khẩu bcrypt trên process pool riêng.
+
+bcrypt tốn CPU và giữ GIL nếu chạy trong threadpool mặc định, làm chậm mọi endpoint
+khác của worker. Ở đây mỗi lần băm chạy trong 1 process con (HASH_WORKERS process),
+hàng đợi có giới hạn HASH_QUEUE_LIMIT: đầy thì trả 503 ngay thay vì để request xếp hàng.
+Hash cũ có cost khác BCRYPT_ROUNDS được băm lại khi user đăng nhập thành công.
+"""
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# Chạy nhiều worker (common/serve.py đặt WEB_CONCURRENCY): chia CPU cho pool của từng worker
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", max(1, (os.cpu_count() or 1) // int(os.getenv("WEB_CONCURRENCY") or 1))))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", HASH_WORKERS * 8))
+
+# Tạo lại trong từng process con khi import module
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+def _hash(password: str):
+    return pwd_context.hash(password)
+
+def _verify_and_update(password: str, hashed: str):
+    # (đúng/sai, hash mới nếu cần băm lại với cost hiện tại)
+    return pwd_context.verify_and_update(password, hashed)
+
+def _warmup():
+    return os.getpid()
+
+class PasswordHasher:
+    def __init__(self, workers: int = HASH_WORKERS, queue_limit: int = HASH_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor = None
+        self._pending = 0
+        self.stats = {"hashed": 0, "verified": 0, "rehashed": 0, "rejected": 0}
+
+    def _pool(self):
+        if self._executor is None:
+            # spawn: không fork từ process đang chạy event loop + thread
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    async def _submit(self, fn, *args):
+        # Admission control: đang chạy + đang chờ vượt ngưỡng -> 503 ngay
+        if self._pending >= self.workers + self.queue_limit:
+            self.stats["rejected"] += 1
+            raise HTTPException(503, "Server busy, please retry", headers={"Retry-After": "1"})
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool(), fn, *args)
+        finally:
+            self._pending -= 1
+
+    async def start(self):
+        # Khởi động sẵn các process con để request đầu tiên không phải chờ spawn
+        pool = self._pool()
+        await asyncio.gather(*[asyncio.wrap_future(pool.submit(_warmup)) for _ in range(self.workers)])
+
+    def stop(self):
+        if self._executor is not None: self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def hash(self, password: str):
+        self.stats["hashed"] += 1
+        return await self._submit(_hash, password)
+
+    async def verify(self, password: str, hashed: str):
+        self.stats["verified"] += 1
+        ok, new_hash = await self._submit(_verify_and_update, password, hashed)
+        if ok and new_hash: self.stats["rehashed"] += 1
+        return ok, new_hash
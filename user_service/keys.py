@@ -0,0 +1,91 @@
+"""Khoá ký JWT bất đối xứng (RS256) cho User Service.
+
+- Mỗi khoá private là 1 file PEM trong JWT_KEYS_DIR, tên file (bỏ .pem) là `kid`.
+- Khoá dùng để ký: JWT_ACTIVE_KID nếu có, không thì khoá có kid lớn nhất (kid theo thời gian tạo).
+- /.well-known/jwks.json công bố public key của MỌI khoá trong thư mục, nên khi xoay khoá
+  (python keys.py rotate) token cũ ký bằng khoá trước vẫn hợp lệ tới khi hết hạn.
+  Chỉ xoá file khoá cũ sau khi token/refresh cuối cùng ký bằng nó đã hết hạn.
+"""
+import os
+import time
+import datetime
+import threading
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import JWTError, jwk, jwt
+
+JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR", "keys")
+JWT_ACTIVE_KID = os.getenv("JWT_ACTIVE_KID")
+# Đọc lại thư mục khoá định kỳ để nhận khoá mới sau khi xoay
+JWT_KEYS_RELOAD_SECONDS = float(os.getenv("JWT_KEYS_RELOAD_SECONDS", 60))
+# Token mang kid lạ chỉ kích hoạt đọc lại thư mục tối đa 1 lần / khoảng này
+JWT_UNKNOWN_KID_RELOAD_SECONDS = float(os.getenv("JWT_UNKNOWN_KID_RELOAD_SECONDS", 5))
+
+def generate_key(keys_dir: str = JWT_KEYS_DIR):
+    os.makedirs(keys_dir, exist_ok=True)
+    kid = datetime.datetime.utcnow().strftime("k%Y%m%d%H%M%S%f")
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    path = os.path.join(keys_dir, f"{kid}.pem")
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(pem)
+    return kid
+
+class KeyRing:
+    def __init__(self, keys_dir: str = JWT_KEYS_DIR, algorithm: str = "RS256", active_kid: str = JWT_ACTIVE_KID):
+        self.keys_dir = keys_dir
+        self.algorithm = algorithm
+        self.pinned_kid = active_kid
+        self._lock = threading.Lock()
+        self._private = {}
+        self._public_jwks = {}
+        self.active_kid = None
+        self._loaded_at = 0
+        self.reload()
+        if not self._private:
+            generate_key(keys_dir)
+            self.reload()
+
+    def reload(self):
+        private, public = {}, {}
+        if os.path.isdir(self.keys_dir):
+            for name in sorted(os.listdir(self.keys_dir)):
+                if not name.endswith(".pem"): continue
+                kid = name[:-4]
+                with open(os.path.join(self.keys_dir, name)) as f:
+                    pem = f.read()
+                private[kid] = pem
+                public[kid] = {**jwk.construct(pem, self.algorithm).public_key().to_dict(), "kid": kid, "use": "sig", "alg": self.algorithm}
+        with self._lock:
+            self._loaded_at = time.monotonic()
+            self._private, self._public_jwks = private, public
+            if self.pinned_kid in private: self.active_kid = self.pinned_kid
+            else: self.active_kid = max(private) if private else None
+
+    def _stale(self, seconds):
+        return time.monotonic() - self._loaded_at > seconds
+
+    def sign(self, claims: dict):
+        if self._stale(JWT_KEYS_RELOAD_SECONDS): self.reload()
+        return jwt.encode(claims, self._private[self.active_kid], algorithm=self.algorithm, headers={"kid": self.active_kid})
+
+    def jwks(self):
+        if self._stale(JWT_KEYS_RELOAD_SECONDS): self.reload()
+        return {"keys": list(self._public_jwks.values())}
+
+    def decode(self, token: str):
+        kid = jwt.get_unverified_header(token).get("kid")
+        # Worker khác có thể vừa tạo/xoay khoá -> đọc lại thư mục 1 lần
+        if kid not in self._public_jwks and self._stale(JWT_UNKNOWN_KID_RELOAD_SECONDS): self.reload()
+        key = self._public_jwks.get(kid)
+        if key is None: raise JWTError("Unknown kid")
+        return jwt.decode(token, key, algorithms=[self.algorithm])
+
+if __name__ == "__main__":
+    # Xoay khoá: python keys.py rotate
+    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == "rotate":
+        print(f"New signing key: {generate_key()}")
+    else:
+        print("Usage: python keys.py rotate")
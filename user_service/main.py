@@ -1,8 +1,16 @@
 from fastapi import FastAPI, Depends, HTTPException, Header
 from sqlalchemy.orm import Session
 from database import SessionLocal, engine, Base
+from common.db import pool_stats
+from common.migrations import run_migrations
+from common.responses import FastJSONResponse
+from common.workers import setup_worker
 import models
-from passlib.context import CryptContext
+from keys import KeyRing
+from hashing import PasswordHasher
+import sessions
+import asyncio
+import httpx
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from pydantic import BaseModel
@@ -10,13 +18,40 @@ from typing import List, Optional
 import os
 
 SECRET_KEY = os.getenv("SECRET_KEY", "chuoi_mac_dinh_phong_khi_quen_set_env")
-ALGORITHM = os.getenv("ALGORITHM", "HS256")
+ALGORITHM = os.getenv("ALGORITHM", "RS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+# Trong thời gian chuyển từ HS256 sang RS256: vẫn chấp nhận token HS256 cũ ký bằng SECRET_KEY
+JWT_ACCEPT_LEGACY_HS256 = os.getenv("JWT_ACCEPT_LEGACY_HS256", "0") == "1"
+# Số id tối đa cho 1 lần tra cứu hàng loạt
+BATCH_LOOKUP_LIMIT = int(os.getenv("BATCH_LOOKUP_LIMIT", 200))
+ORDER_SERVICE_URL = os.getenv("ORDER_SERVICE_URL", "http://order_service:8003")
 
 Base.metadata.create_all(bind=engine)
+run_migrations(engine, os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations"))
 
-app = FastAPI()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+app = FastAPI(default_response_class=FastJSONResponse)
+setup_worker(app, engines={"primary": engine})
+# bcrypt chạy trên process pool riêng (xem hashing.py)
+hasher = PasswordHasher()
+
+# Danh sách token bị thu hồi trong RAM (xem sessions.py)
+revocation_sync = sessions.RevocationSync(SessionLocal)
+
+@app.on_event("startup")
+async def start_hasher():
+    await hasher.start()
+
+@app.on_event("startup")
+async def start_revocation_sync():
+    await revocation_sync.start()
+
+@app.on_event("shutdown")
+def stop_hasher():
+    hasher.stop()
+
+@app.on_event("shutdown")
+async def stop_revocation_sync():
+    await revocation_sync.stop()
 
 def get_db():
     db = SessionLocal()
@@ -25,18 +60,58 @@ def get_db():
     finally:
         db.close()
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# Mức dùng connection pool (common/db.py)
+@app.get("/metrics/db")
+def get_db_metrics():
+    return pool_stats(engine)
+
+async def verify_password(plain_password, hashed_password):
+    return await hasher.verify(plain_password, hashed_password)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    return await hasher.hash(password)
+
+# Khoá RS256 (xem keys.py); ALGORITHM=HS256 thì giữ cách ký bằng SECRET_KEY như cũ
+keyring = None if ALGORITHM.startswith("HS") else KeyRing(algorithm=ALGORITHM)
 
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": sessions.new_jti()})
+    if keyring: return keyring.sign(to_encode)
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+def decode_token(token: str):
+    if not keyring: return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    if JWT_ACCEPT_LEGACY_HS256 and jwt.get_unverified_header(token).get("alg") == "HS256":
+        return jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+    return keyring.decode(token)
+
+def decode_active_token(authorization: str):
+    # Giải mã + kiểm tra danh sách thu hồi trong RAM (không truy vấn DB)
+    if not authorization: raise HTTPException(401, "Missing Token")
+    try: payload = decode_token(authorization.replace("Bearer ", ""))
+    except JWTError: raise HTTPException(401, "Invalid Token")
+    if revocation_sync.revocations.is_revoked(payload): raise HTTPException(401, "Token revoked")
+    return payload
+
+def issue_tokens(db: Session, user, family_id: str = None):
+    # Access token + refresh token mới; caller commit
+    token_data = {
+        "sub": user.email, 
+        "id": user.id, 
+        "role": user.role,
+        "branch_id": user.managed_branch_id,
+        "seller_mode": user.seller_mode, # Thêm vào Token
+        "ver": user.token_version or 0,
+    }
+    return {
+        "access_token": create_access_token(token_data),
+        "refresh_token": sessions.issue_refresh_token(db, user.id, family_id),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
 # --- MODELS ---
 class UserCreate(BaseModel):
     email: str
@@ -51,6 +126,12 @@ class LoginRequest(BaseModel):
     email: str
     password: str
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
 class AddressCreate(BaseModel):
     title: str
     address: str
@@ -62,13 +143,54 @@ class AddressResponse(AddressCreate):
     class Config:
         orm_mode = True
 
+class UserPublic(BaseModel):
+    id: int
+    name: Optional[str] = None
+    email: str
+    role: Optional[str] = None
+    phone: Optional[str] = None
+    address: Optional[str] = None
+    class Config:
+        orm_mode = True
+
 # --- API AUTH ---
+# register / login là async để chờ bcrypt trên process pool (hashing.py); phần truy vấn DB
+# (Session đồng bộ) chạy trong threadpool qua asyncio.to_thread, không chặn event loop
+def _find_user(db: Session, email: str):
+    return db.query(models.User).filter(models.User.email == email).first()
+
+def _save_user(db: Session, new_user):
+    try:
+        db.add(new_user)
+        db.commit()
+        db.refresh(new_user)
+        return new_user.id
+    except Exception:
+        db.rollback()
+        raise
+
+def _start_session(db: Session, user, new_hash: str = None):
+    # Cost bcrypt đã đổi -> lưu hash mới
+    if new_hash:
+        user.hashed_password = new_hash
+    
+    tokens = issue_tokens(db, user)
+    db.commit()
+    
+    return {
+        **tokens,
+        "id": user.id,  # <--- MÌNH ĐÃ THÊM DÒNG NÀY ĐỂ FRONTEND LẤY ĐƯỢC ID
+        "role": user.role,
+        "branch_id": user.managed_branch_id,
+        "seller_mode": user.seller_mode
+    }
+
 @app.post("/register")
-def register(user: UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
+async def register(user: UserCreate, db: Session = Depends(get_db)):
+    db_user = await asyncio.to_thread(_find_user, db, user.email)
     if db_user: raise HTTPException(400, "Email exists")
     
-    hashed_pw = get_password_hash(user.password)
+    hashed_pw = await get_password_hash(user.password)
     
     # Logic mặc định: Nếu là Seller mà ko chọn mode -> Mặc định là Owner
     final_seller_mode = None
@@ -86,55 +208,68 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
     )
     
     try:
-        db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
-        return {"message": "User created", "id": new_user.id}
+        user_id = await asyncio.to_thread(_save_user, db, new_user)
+        return {"message": "User created", "id": user_id}
     except Exception as e:
-        db.rollback()
         raise HTTPException(500, str(e))
 
 @app.post("/login")
-def login(req: LoginRequest, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == req.email).first()
-    if not user or not verify_password(req.password, user.hashed_password):
+async def login(req: LoginRequest, db: Session = Depends(get_db)):
+    user = await asyncio.to_thread(_find_user, db, req.email)
+    if not user:
         raise HTTPException(401, "Incorrect email/password")
-    
-    token_data = {
-        "sub": user.email, 
-        "id": user.id, 
-        "role": user.role,
-        "branch_id": user.managed_branch_id,
-        "seller_mode": user.seller_mode # Thêm vào Token
-    }
-    access_token = create_access_token(token_data)
-    
-    return {
-        "access_token": access_token, 
-        "token_type": "bearer",
-        "id": user.id,  # <--- MÌNH ĐÃ THÊM DÒNG NÀY ĐỂ FRONTEND LẤY ĐƯỢC ID
-        "role": user.role,
-        "branch_id": user.managed_branch_id,
-        "seller_mode": user.seller_mode
-    }
+    valid, new_hash = await verify_password(req.password, user.hashed_password)
+    if not valid:
+        raise HTTPException(401, "Incorrect email/password")
+    return await asyncio.to_thread(_start_session, db, user, new_hash)
+
+# Gia hạn phiên bằng refresh token: không bcrypt, token cũ bị thu hồi (rotation)
+@app.post("/token/refresh")
+def refresh_token(req: RefreshRequest, db: Session = Depends(get_db)):
+    user, family_id = sessions.rotate_refresh_token(db, req.refresh_token)
+    # Chỉ ghi 1 refresh token mới, cùng family với token vừa thu hồi
+    tokens = issue_tokens(db, user, family_id)
+    db.commit()
+    return tokens
+
+@app.post("/logout")
+def logout(req: Optional[LogoutRequest] = None, authorization: str = Header(None), db: Session = Depends(get_db)):
+    payload = decode_active_token(authorization)
+    row = sessions.revoke_access_token(db, payload) if payload.get("jti") else None
+    if req and req.refresh_token: sessions.revoke_refresh_token(db, req.refresh_token)
+    db.commit()
+    if row is not None: revocation_sync.record(row)
+    return {"message": "Logged out"}
+
+# Đăng xuất mọi nơi: mọi access token + refresh token hiện có của user đều mất hiệu lực
+@app.post("/logout/all")
+def logout_all(authorization: str = Header(None), db: Session = Depends(get_db)):
+    payload = decode_active_token(authorization)
+    row = sessions.bump_token_version(db, payload["id"], timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    sessions.revoke_all_refresh_tokens(db, payload["id"])
+    db.commit()
+    revocation_sync.record(row)
+    return {"message": "Logged out from all sessions"}
 
 @app.get("/verify")
 def verify_token(authorization: str = Header(None)):
-    if not authorization: raise HTTPException(401, "Missing Token")
-    token = authorization.replace("Bearer ", "")
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except JWTError: raise HTTPException(401, "Invalid Token")
+    return decode_active_token(authorization)
+
+# Nội bộ: các service khác đồng bộ danh sách thu hồi (common/auth.py)
+@app.get("/revocations")
+def get_revocations(db: Session = Depends(get_db)):
+    return {"entries": sessions.active_revocations(db)}
+
+# Public key để các service khác tự verify token (RS256)
+@app.get("/.well-known/jwks.json")
+def get_jwks():
+    if not keyring: return {"keys": []}
+    return keyring.jwks()
 
 # --- API ADDRESS ---
 def get_current_user_id(authorization: str):
-    if not authorization: return None
-    token = authorization.replace("Bearer ", "")
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload.get("id")
-    except: return None
+    try: return decode_active_token(authorization).get("id")
+    except HTTPException: return None
 
 @app.post("/users/addresses", response_model=AddressResponse)
 def add_address(addr: AddressCreate, authorization: str = Header(None), db: Session = Depends(get_db)):
@@ -150,4 +285,42 @@ def add_address(addr: AddressCreate, authorization: str = Header(None), db: Sess
 def get_my_addresses(authorization: str = Header(None), db: Session = Depends(get_db)):
     user_id = get_current_user_id(authorization)
     if not user_id: raise HTTPException(401, "Invalid Token")
-    return db.query(models.UserAddress).filter(models.UserAddress.user_id == user_id).all()
\ No newline at end of file
+    return db.query(models.UserAddress).filter(models.UserAddress.user_id == user_id).all()
+
+# --- API TRA CỨU HÀNG LOẠT (admin: mọi user; seller: khách của chi nhánh mình) ---
+def parse_ids(ids: str):
+    try: parsed = {int(x) for x in ids.split(",") if x.strip()}
+    except ValueError: raise HTTPException(400, "ids must be comma-separated integers")
+    if len(parsed) > BATCH_LOOKUP_LIMIT: raise HTTPException(400, f"Too many ids (max {BATCH_LOOKUP_LIMIT})")
+    return parsed
+
+def require_staff(authorization: str):
+    payload = decode_active_token(authorization)
+    if payload.get("role") not in ("seller", "admin"): raise HTTPException(403, "Permission denied")
+    return payload
+
+def visible_user_ids(payload: dict, user_ids: set):
+    # Seller chỉ xem được thông tin của user đã đặt đơn ở chi nhánh mình (hỏi Order Service)
+    if payload.get("role") == "admin" or not user_ids: return user_ids
+    branch_id = payload.get("branch_id")
+    if not branch_id: return set()
+    try:
+        res = httpx.get(f"{ORDER_SERVICE_URL}/orders/customers", params={"branch_id": branch_id, "user_ids": ",".join(map(str, user_ids))}, timeout=5.0)
+        res.raise_for_status()
+    except httpx.HTTPError: raise HTTPException(503, "Order service unavailable")
+    return user_ids & set(res.json())
+
+# 1 câu IN theo khoá chính thay vì N lần gọi cho N đơn hàng
+@app.get("/users/batch", response_model=List[UserPublic])
+def get_users_batch(ids: str, authorization: str = Header(None), db: Session = Depends(get_db)):
+    payload = require_staff(authorization)
+    user_ids = visible_user_ids(payload, parse_ids(ids))
+    if not user_ids: return []
+    return db.query(models.User).filter(models.User.id.in_(user_ids)).all()
+
+@app.get("/users/addresses/batch", response_model=List[AddressResponse])
+def get_addresses_batch(user_ids: str, authorization: str = Header(None), db: Session = Depends(get_db)):
+    payload = require_staff(authorization)
+    ids = visible_user_ids(payload, parse_ids(user_ids))
+    if not ids: return []
+    return db.query(models.UserAddress).filter(models.UserAddress.user_id.in_(ids)).order_by(models.UserAddress.user_id, models.UserAddress.id).all()
@@ -0,0 +1,7 @@
+"""Cột / index thêm vào users, user_addresses sau bản đầu (create_all không sửa bảng cũ)."""
+from sqlalchemy import Integer
+
+def upgrade(m):
+    m.add_column("users", "token_version", Integer(), nullable=False, server_default="0")
+    # Sổ địa chỉ 1 user và GET /users/addresses/batch (user_id IN ...)
+    m.create_index("ix_user_addresses_user_id", "user_addresses", ["user_id"])
@@ -0,0 +1,4 @@
+"""Index refresh_tokens.expires_at cho việc dọn token hết hạn (sessions.purge_expired)."""
+
+def upgrade(m):
+    m.create_index("ix_refresh_tokens_expires_at", "refresh_tokens", ["expires_at"])
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -21,6 +21,9 @@ class User(Base):
     
     phone = Column(String(20), nullable=True)
     address = Column(String(255), nullable=True)
+
+    # Tăng khi "đăng xuất mọi nơi": access token mang `ver` cũ hơn bị từ chối
+    token_version = Column(Integer, default=0, nullable=False, server_default="0")
     
     # Quan hệ sổ địa chỉ
     addresses = relationship("UserAddress", back_populates="user")
@@ -29,10 +32,37 @@ class UserAddress(Base):
     __tablename__ = "user_addresses"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     
     title = Column(String(50)) 
     address = Column(String(255))
     phone = Column(String(20))
     
-    user = relationship("User", back_populates="addresses")
\ No newline at end of file
+    user = relationship("User", back_populates="addresses")
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    # Chỉ lưu sha256 của token, không lưu token gốc
+    token_hash = Column(String(64), unique=True, index=True)
+    # Các token sinh ra từ cùng 1 lần login; phát hiện dùng lại -> thu hồi cả family
+    family_id = Column(String(32), index=True)
+    # Dọn định kỳ các token đã hết hạn (sessions.purge_expired)
+    expires_at = Column(DateTime, index=True)
+    created_at = Column(DateTime)
+    revoked_at = Column(DateTime, nullable=True)
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    # Các worker/service tải lại toàn bộ dòng chưa hết hạn (GET /revocations)
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, index=True)
+    # Thu hồi 1 access token (logout) ...
+    jti = Column(String(32), nullable=True)
+    # ... hoặc mọi token có ver < token_version (đăng xuất mọi nơi)
+    token_version = Column(Integer, nullable=True)
+    # Hết hạn cùng access token cuối cùng bị ảnh hưởng, sau đó không cần giữ nữa
+    expires_at = Column(DateTime, index=True)
@@ -0,0 +1,172 @@
+"""Refresh token + thu hồi token cho User Service.
+
+- Refresh token là chuỗi ngẫu nhiên (không phải JWT), DB chỉ lưu sha256. Mỗi lần
+  /token/refresh token cũ bị thu hồi và cấp token mới cùng family (rotation): không cần
+  bcrypt, chỉ 1 SELECT theo hash + 1 SELECT user.
+- Token đã bị rotate mà còn được gửi lại (bị lộ / dùng lại) -> thu hồi cả family.
+- Access token mang `jti` và `ver` (= users.token_version). Logout ghi jti vào
+  revoked_tokens, "đăng xuất mọi nơi" tăng token_version. Việc kiểm tra dùng
+  RevocationList trong RAM (common/auth.py), đồng bộ từ revoked_tokens mỗi
+  REVOCATION_SYNC_SECONDS -> verify không chạm DB.
+- Dòng revoked_tokens / refresh_tokens đã hết hạn không còn tác dụng: mỗi
+  TOKEN_PURGE_SECONDS vòng đồng bộ xoá chúng theo lô TOKEN_PURGE_BATCH_SIZE dòng.
+"""
+import os
+import uuid
+import time
+import asyncio
+import hashlib
+import secrets
+import calendar
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+import models
+from common.auth import RevocationList, REVOCATION_SYNC_SECONDS
+
+REFRESH_TOKEN_EXPIRE_DAYS = float(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 14))
+TOKEN_PURGE_SECONDS = float(os.getenv("TOKEN_PURGE_SECONDS", 3600))
+TOKEN_PURGE_BATCH_SIZE = int(os.getenv("TOKEN_PURGE_BATCH_SIZE", 1000))
+
+def new_jti():
+    return uuid.uuid4().hex
+
+def _hash(token: str):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def _epoch(dt: datetime):
+    return calendar.timegm(dt.utctimetuple())
+
+def _entry(row):
+    return {"user_id": row.user_id, "jti": row.jti, "token_version": row.token_version, "exp": _epoch(row.expires_at)}
+
+# --- Refresh token ---
+def issue_refresh_token(db, user_id: int, family_id: str = None):
+    token = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    db.add(models.RefreshToken(
+        user_id=user_id, token_hash=_hash(token), family_id=family_id or uuid.uuid4().hex,
+        created_at=now, expires_at=now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token
+
+def _revoke_family(db, family_id: str):
+    db.query(models.RefreshToken).filter(
+        models.RefreshToken.family_id == family_id, models.RefreshToken.revoked_at.is_(None)
+    ).update({models.RefreshToken.revoked_at: datetime.utcnow()}, synchronize_session=False)
+
+def rotate_refresh_token(db, token: str):
+    """Thu hồi refresh token đang dùng. Trả về (user, family_id) để caller cấp token mới cùng family rồi commit."""
+    row = db.query(models.RefreshToken).filter(models.RefreshToken.token_hash == _hash(token)).first()
+    if row is None: raise HTTPException(401, "Invalid refresh token")
+    now = datetime.utcnow()
+    if row.expires_at <= now: raise HTTPException(401, "Refresh token expired")
+    # Thu hồi có điều kiện: 2 request cùng token thì chỉ 1 request thắng
+    rotated = row.revoked_at is None and db.query(models.RefreshToken).filter(
+        models.RefreshToken.id == row.id, models.RefreshToken.revoked_at.is_(None)
+    ).update({models.RefreshToken.revoked_at: now}, synchronize_session=False)
+    if not rotated:
+        _revoke_family(db, row.family_id)
+        db.commit()
+        raise HTTPException(401, "Refresh token reused")
+    user = db.query(models.User).filter(models.User.id == row.user_id).first()
+    if user is None: raise HTTPException(401, "Invalid refresh token")
+    return user, row.family_id
+
+def revoke_refresh_token(db, token: str):
+    row = db.query(models.RefreshToken).filter(models.RefreshToken.token_hash == _hash(token)).first()
+    if row is not None: _revoke_family(db, row.family_id)
+
+def revoke_all_refresh_tokens(db, user_id: int):
+    db.query(models.RefreshToken).filter(
+        models.RefreshToken.user_id == user_id, models.RefreshToken.revoked_at.is_(None)
+    ).update({models.RefreshToken.revoked_at: datetime.utcnow()}, synchronize_session=False)
+
+# --- Thu hồi access token ---
+def revoke_access_token(db, payload: dict):
+    row = models.RevokedToken(user_id=payload.get("id"), jti=payload.get("jti"), expires_at=datetime.utcfromtimestamp(payload["exp"]))
+    db.add(row)
+    return row
+
+def bump_token_version(db, user_id: int, access_ttl: timedelta):
+    db.query(models.User).filter(models.User.id == user_id).update(
+        {models.User.token_version: models.User.token_version + 1}, synchronize_session=False)
+    version = db.query(models.User.token_version).filter(models.User.id == user_id).scalar()
+    # Sau 1 vòng đời access token, mọi token có ver cũ đều đã hết hạn
+    row = models.RevokedToken(user_id=user_id, token_version=version, expires_at=datetime.utcnow() + access_ttl)
+    db.add(row)
+    return row
+
+def active_revocations(db):
+    rows = db.query(models.RevokedToken).filter(models.RevokedToken.expires_at > datetime.utcnow()).all()
+    return [_entry(r) for r in rows]
+
+def purge_expired(db, batch_size: int = TOKEN_PURGE_BATCH_SIZE):
+    """Xoá revoked_tokens và refresh_tokens đã hết hạn, mỗi lô 1 transaction ngắn. Trả về số dòng đã xoá."""
+    now = datetime.utcnow()
+    deleted = 0
+    # Refresh token hết hạn bị rotate_refresh_token từ chối trước khi xét reuse -> xoá được
+    for model in (models.RevokedToken, models.RefreshToken):
+        while True:
+            ids = [r.id for r in db.query(model.id).filter(model.expires_at < now).limit(batch_size)]
+            if not ids: break
+            deleted += db.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+            db.commit()
+            if len(ids) < batch_size: break
+    return deleted
+
+class RevocationSync:
+    """Giữ RevocationList của worker này khớp với bảng revoked_tokens."""
+
+    def __init__(self, session_factory, interval: float = REVOCATION_SYNC_SECONDS, purge_interval: float = TOKEN_PURGE_SECONDS):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.purge_interval = purge_interval
+        self.revocations = RevocationList()
+        self._task = None
+        self._purged_at = time.monotonic()
+        self.stats = {"syncs": 0, "errors": 0, "last_sync_ms": 0, "purged": 0}
+
+    def record(self, row):
+        # Worker vừa ghi thì áp dụng ngay, không chờ chu kỳ đồng bộ
+        self.revocations.add(_entry(row))
+
+    def _load(self):
+        db = self.session_factory()
+        try: return active_revocations(db)
+        finally: db.close()
+
+    def _purge(self):
+        db = self.session_factory()
+        try: return purge_expired(db)
+        finally: db.close()
+
+    async def purge(self):
+        self._purged_at = time.monotonic()
+        self.stats["purged"] += await asyncio.to_thread(self._purge)
+
+    async def sync(self):
+        started = time.monotonic()
+        self.revocations.update(await asyncio.to_thread(self._load))
+        self.stats["syncs"] += 1
+        self.stats["last_sync_ms"] = round((time.monotonic() - started) * 1000, 1)
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sync()
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"Revocation sync failed: {e}")
+            if time.monotonic() - self._purged_at < self.purge_interval: continue
+            try:
+                await self.purge()
+            except Exception as e:
+                print(f"Token purge failed: {e}")
+
+    async def start(self):
+        await self.sync()
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task: self._task.cancel()